@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import cv2
+
+from detectors import BACKENDS, create_detector
+from face_tracker import iou
+
+
+def load_frames(paths, max_frames, step, scale):
+    """
+    Decode the footage once so every backend sees identical input and decoding is not timed.
+    :return: list of (key, small_frame) where key is '<file name>:<frame index>'
+    """
+    frames = []
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"WARNING: Could not open {path}")
+            continue
+        index = -1
+        name = os.path.basename(path)
+        while len(frames) < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            index += 1
+            if index % step:
+                continue
+            small = cv2.resize(frame, (0, 0), fx=scale, fy=scale) if scale != 1.0 else frame
+            frames.append((f"{name}:{index}", small))
+        cap.release()
+    return frames
+
+
+def run_backend(detector, frames, batch_size, scale, min_size):
+    """
+    Time a backend over all frames.
+    :return: (seconds, {key: [boxes in full frame coordinates]})
+    """
+    results = {}
+    t_start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        chunk = frames[i:i + batch_size]
+        detections = detector.detect_batch([f for _, f in chunk], scale_factor=1.1, min_size=min_size)
+        for (key, _), faces in zip(chunk, detections):
+            results[key] = [(int(x / scale), int(y / scale), int(w / scale), int(h / scale)) for (x, y, w, h) in faces]
+    return time.perf_counter() - t_start, results
+
+
+def match(predicted, truth, threshold=0.4):
+    """
+    Greedy IoU matching.
+    :return: number of truth boxes matched
+    """
+    used = set()
+    hits = 0
+    for t in truth:
+        best, best_i = 0.0, None
+        for i, p in enumerate(predicted):
+            if i in used:
+                continue
+            overlap = iou(p, t)
+            if overlap > best:
+                best, best_i = overlap, i
+        if best_i is not None and best >= threshold:
+            used.add(best_i)
+            hits += 1
+    return hits
+
+
+def consensus(all_results, keys, min_agree=2):
+    """
+    Pseudo ground truth when no annotations exist: boxes found by at least min_agree backends.
+    """
+    truth = {}
+    for key in keys:
+        boxes = []
+        for results in all_results.values():
+            for box in results.get(key, []):
+                if any(iou(box, b) >= 0.4 for b in boxes):
+                    continue
+                agree = sum(1 for other in all_results.values() if any(iou(box, o) >= 0.4 for o in other.get(key, [])))
+                if agree >= min_agree:
+                    boxes.append(box)
+        truth[key] = boxes
+    return truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare face detector backends on the same footage")
+    parser.add_argument("footage", nargs="+", help="Video file(s) to run the detectors on")
+    parser.add_argument("--backends", default="haar,dnn", help=f"Comma separated backends ({', '.join(BACKENDS)}; default: haar,dnn)")
+    parser.add_argument("--model-dir", default="models", help="Directory containing the DNN/YuNet model files (default: models)")
+    parser.add_argument("--scale", type=float, default=0.5, help="Downscale factor applied before detection, as in StreamPlayer (default: 0.5)")
+    parser.add_argument("--max-frames", type=int, default=300, help="Max frames to evaluate (default: 300)")
+    parser.add_argument("--step", type=int, default=1, help="Use every Nth frame of the footage (default: 1)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Frames per detector call (default: 1)")
+    parser.add_argument("--annotations", help="JSON file mapping '<file name>:<frame index>' to lists of [x, y, w, h] ground truth boxes")
+    args = parser.parse_args()
+
+    frames = load_frames(args.footage, args.max_frames, args.step, args.scale)
+    if not frames:
+        print("No frames decoded.")
+        sys.exit(1)
+    keys = [k for k, _ in frames]
+    min_size = (max(24, int(60 * args.scale)),) * 2
+    print(f"Loaded {len(frames)} frames at {frames[0][1].shape[1]}x{frames[0][1].shape[0]} (scale {args.scale}).")
+
+    timings = {}
+    all_results = {}
+    for backend in args.backends.split(","):
+        try:
+            detector = create_detector(backend, args.model_dir)
+        except Exception as e:
+            print(f"Skipping {backend}: {e}")
+            continue
+        # Warm-up so one-off initialization is not counted
+        detector.detect_batch([frames[0][1]], min_size=min_size)
+        print(f"Running {backend}...")
+        timings[backend], all_results[backend] = run_backend(detector, frames, args.batch_size, args.scale, min_size)
+
+    if not all_results:
+        print("No backend could be loaded.")
+        sys.exit(1)
+
+    if args.annotations:
+        with open(args.annotations, 'r') as f:
+            truth = {k: [tuple(b) for b in v] for k, v in json.load(f).items()}
+        truth_source = args.annotations
+    elif len(all_results) > 1:
+        truth = consensus(all_results, keys)
+        truth_source = "boxes agreed on by at least 2 backends"
+    else:
+        truth = None
+        truth_source = None
+
+    print(f"\n{'backend':<8} {'fps':>8} {'ms/frame':>9} {'faces':>7} {'recall':>7} {'precision':>9}")
+    for backend, results in all_results.items():
+        seconds = timings[backend]
+        found = sum(len(v) for v in results.values())
+        recall = precision = "-"
+        if truth is not None:
+            total_truth = sum(len(truth.get(k, [])) for k in keys)
+            hits = sum(match(results.get(k, []), truth.get(k, [])) for k in keys)
+            recall = f"{hits / total_truth:.1%}" if total_truth else "-"
+            precision = f"{hits / found:.1%}" if found else "-"
+        print(f"{backend:<8} {len(frames) / seconds:8.1f} {1000 * seconds / len(frames):9.2f} {found:7d} {recall:>7} {precision:>9}")
+    if truth_source:
+        print(f"\nRecall/precision against: {truth_source}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from detectors import BACKENDS
+from recognizers import load_model_names
+from stream_player import StreamPlayer
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+
+def rss_mb():
+    """
+    Current resident set size in MB (Linux), or None.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    scale = 1e6 if sys.platform == "darwin" else 1e3
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def video_frames(paths, max_frames):
+    """
+    Decode recorded footage.
+    :return: generator of (media_time, frame); media time keeps increasing across files
+    """
+    offset = 0.0
+    count = 0
+    for path in paths:
+        cap = cv2.VideoCapture(path)
+        if not cap.isOpened():
+            print(f"WARNING: Could not open {path}")
+            continue
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        index = 0
+        while count < max_frames:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield offset + index / fps, frame
+            index += 1
+            count += 1
+        cap.release()
+        offset += index / fps
+
+
+def synthetic_frames(count, fps, width, height, face_image=None, seed=0):
+    """
+    Reproducible synthetic footage: a noisy static background with an optional face image
+    sliding across the middle third of the clip (so the pipeline sees a face appear, stay and leave).
+    :return: generator of (media_time, frame)
+    """
+    rng = np.random.default_rng(seed)
+    background = rng.integers(60, 120, (height, width, 3), dtype=np.uint8)
+    face = None
+    if face_image:
+        face = cv2.imread(face_image)
+        if face is None:
+            print(f"WARNING: Could not read {face_image}, generating frames without a face.")
+        else:
+            side = height // 3
+            face = cv2.resize(face, (side, side))
+
+    for i in range(count):
+        frame = background.copy()
+        # Sensor noise so motion gating and the detector see realistic input
+        noise = rng.integers(0, 8, (height, width, 3), dtype=np.uint8)
+        cv2.add(frame, noise, frame)
+        if face is not None and count // 3 <= i < 2 * count // 3:
+            progress = (i - count // 3) / max(1, count // 3)
+            x = int(progress * (width - face.shape[1]))
+            y = (height - face.shape[0]) // 2
+            frame[y:y + face.shape[0], x:x + face.shape[1]] = face
+        yield i / fps, frame
+
+
+class _TimedRecognizer:
+    def __init__(self, recognizer, samples):
+        """
+        Wrap a recognizer so every predict()/predict_batch() call is timed.
+        """
+        self.recognizer = recognizer
+        self.samples = samples
+
+    def predict(self, face):
+        t_start = time.perf_counter()
+        result = self.recognizer.predict(face)
+        self.samples.append(time.perf_counter() - t_start)
+        return result
+
+    def predict_batch(self, faces):
+        t_start = time.perf_counter()
+        results = self.recognizer.predict_batch(faces) if hasattr(self.recognizer, "predict_batch") else [self.recognizer.predict(f) for f in faces]
+        self.samples.append(time.perf_counter() - t_start)
+        return results
+
+
+class ReplayPlayer(StreamPlayer):
+    """
+    StreamPlayer driven by a frame iterator instead of a camera: the same detection,
+    recognition, stability and trigger code runs, but time is the media time of each frame
+    (cooldowns, motion hold, adaptive cadence) and alerts are recorded instead of sent.
+    """
+    def __init__(self, names_file="names.json", **kwargs):
+        kwargs.setdefault("headless", True)
+        # A model swapped in mid-run would replace the timing wrapper below
+        kwargs.setdefault("model_reload", False)
+        super().__init__(uri="replay", **kwargs)
+        if names_file:
+            self.names = load_model_names(kwargs.get("trainer_file", "trainer.yml"), names_file)
+        self.media_time = 0.0
+        self.clock = lambda: self.media_time
+        self.alerts = []
+        self.stage_times = {"decode": [], "motion": [], "detect": [], "recognize": [], "frame": []}
+        if hasattr(self, 'recognizer'):
+            self.recognizer = _TimedRecognizer(self.recognizer, self.stage_times["recognize"])
+        if self.motion_detector:
+            update = self.motion_detector.update
+
+            def timed_update(frame, timestamp=None):
+                t_start = time.perf_counter()
+                moving = update(frame, timestamp)
+                self.stage_times["motion"].append(time.perf_counter() - t_start)
+                return moving
+            self.motion_detector.update = timed_update
+
+    def _detect_faces(self, frame):
+        t_start = time.perf_counter()
+        faces = super()._detect_faces(frame)
+        self.stage_times["detect"].append(time.perf_counter() - t_start)
+        return faces
+
+    def _fire_alert(self, name):
+        self.alerts.append({"frame": self.frame_count, "time": round(self.media_time, 3), "name": name})
+        print(f"ALERT: {name} at {self.media_time:.2f}s (frame {self.frame_count})")
+
+    def replay(self, frames, realtime=False):
+        """
+        Push every frame through the pipeline.
+        :param frames: Iterator of (media_time, frame)
+        :param realtime: Sleep so frames are processed no faster than their media time
+        :return: wall clock seconds
+        """
+        t_begin = time.perf_counter()
+        iterator = iter(frames)
+        while True:
+            t_decode = time.perf_counter()
+            try:
+                media_time, frame = next(iterator)
+            except StopIteration:
+                break
+            self.stage_times["decode"].append(time.perf_counter() - t_decode)
+
+            if realtime:
+                delay = media_time - (time.perf_counter() - t_begin)
+                if delay > 0:
+                    time.sleep(delay)
+
+            self.media_time = media_time
+            t_start = time.perf_counter()
+            self._process_frame(frame)
+            self.stage_times["frame"].append(time.perf_counter() - t_start)
+        return time.perf_counter() - t_begin
+
+
+def latency_summary(samples):
+    """
+    :return: dict of count and p50/p90/p99/max in milliseconds
+    """
+    if not samples:
+        return {"count": 0}
+    ms = np.array(samples) * 1000.0
+    p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+    return {"count": len(samples), "p50": round(float(p50), 3), "p90": round(float(p90), 3), "p99": round(float(p99), 3), "max": round(float(ms.max()), 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded or synthetic footage through the StreamPlayer pipeline and report its performance")
+    parser.add_argument("footage", nargs="*", help="Video file(s) to replay (omit to use --synthetic)")
+    parser.add_argument("--synthetic", type=int, default=0, help="Generate this many synthetic frames instead of reading footage")
+    parser.add_argument("--face-image", help="Image pasted into the synthetic frames as a moving face")
+    parser.add_argument("--size", default="1280x720", help="Synthetic frame size (default: 1280x720)")
+    parser.add_argument("--fps", type=float, default=30.0, help="Synthetic frame rate (default: 30)")
+    parser.add_argument("--max-frames", type=int, default=100000, help="Stop after this many frames of footage")
+    parser.add_argument("--realtime", action="store_true", help="Pace frames at their media time instead of as fast as possible")
+    parser.add_argument("--trainer", default="trainer.yml", help="Trained model (default: trainer.yml; recognition is skipped if missing)")
+    parser.add_argument("--names", default="names.json", help="ID -> name mapping (default: names.json)")
+    parser.add_argument("--detector", choices=BACKENDS, default="haar", help="Face detector backend (default: haar)")
+    parser.add_argument("--model-dir", default="models", help="Directory containing detector/embedding model files (default: models)")
+    parser.add_argument("--motion-gate", action="store_true", help="Only run face detection while the scene is changing")
+    parser.add_argument("--motion-interval", type=int, default=5, help="With --motion-gate, detect every Nth frame while motion lasts (default: 5)")
+    parser.add_argument("--adaptive", action="store_true", help="Use the adaptive detection scheduler")
+    parser.add_argument("--cpu-budget", type=float, default=0.5, help="Adaptive only: fraction of one core for detection+recognition (default: 0.5)")
+    parser.add_argument("--latency-budget", type=float, default=1.0, help="Adaptive only: max seconds before a new face is detected (default: 1.0)")
+    parser.add_argument("--json", help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        frames = synthetic_frames(args.synthetic, args.fps, width, height, args.face_image)
+        source = f"{args.synthetic} synthetic frames ({width}x{height} @ {args.fps:g}fps)"
+    elif args.footage:
+        frames = video_frames(args.footage, args.max_frames)
+        source = ", ".join(args.footage)
+    else:
+        parser.error("give footage files or --synthetic N")
+
+    player = ReplayPlayer(
+        names_file=args.names,
+        trainer_file=args.trainer,
+        motion_gate=args.motion_gate,
+        motion_detect_interval=args.motion_interval,
+        adaptive=args.adaptive,
+        cpu_budget=args.cpu_budget,
+        latency_budget=args.latency_budget,
+        detector=args.detector,
+        model_dir=args.model_dir
+    )
+
+    rss_before = rss_mb()
+    seconds = player.replay(frames, realtime=args.realtime)
+    frame_count = player.frame_count
+    if not frame_count:
+        print("No frames replayed.")
+        sys.exit(1)
+
+    report = {
+        "source": source,
+        "detector": args.detector,
+        "trainer": args.trainer if hasattr(player, 'recognizer') else None,
+        "motion_gate": args.motion_gate,
+        "adaptive": args.adaptive,
+        "realtime": args.realtime,
+        "frames": frame_count,
+        "seconds": round(seconds, 3),
+        "fps": round(frame_count / seconds, 2),
+        "media_seconds": round(player.media_time, 3),
+        "stages": {name: latency_summary(samples) for name, samples in player.stage_times.items()},
+        "memory_mb": {"rss_before": rss_before, "rss_after": rss_mb(), "peak_rss": peak_rss_mb()},
+        "alerts": player.alerts,
+    }
+    if player.scheduler:
+        report["scheduler"] = player.scheduler.get_state()
+
+    print(f"\nReplayed {frame_count} frames from {source} in {seconds:.2f}s ({report['fps']:.1f} fps)")
+    print(f"{'stage':<10} {'count':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, summary in report["stages"].items():
+        if summary["count"]:
+            print(f"{name:<10} {summary['count']:7d} {summary['p50']:8.2f} {summary['p90']:8.2f} {summary['p99']:8.2f} {summary['max']:8.2f}")
+    memory = report["memory_mb"]
+    if memory["rss_after"] is not None:
+        print(f"Memory: RSS {memory['rss_before']:.1f} -> {memory['rss_after']:.1f} MB")
+    if memory["peak_rss"] is not None:
+        print(f"Memory: peak RSS {memory['peak_rss']:.1f} MB")
+    print(f"Alerts: {len(player.alerts)}")
+    for alert in player.alerts:
+        print(f"  {alert['time']:8.2f}s  frame {alert['frame']:6d}  {alert['name']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
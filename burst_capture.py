@@ -0,0 +1,167 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+def sharpness(gray):
+    """
+    Variance of the Laplacian of a 100x100 copy (higher is sharper; comparable across face sizes).
+    """
+    return float(cv2.Laplacian(cv2.resize(gray, (100, 100), interpolation=cv2.INTER_AREA), cv2.CV_64F).var())
+
+
+def asymmetry(gray):
+    """
+    Mean difference between the left half and the mirrored right half (0 = symmetric).
+    A cheap pose check: frontal faces are nearly symmetric, strong profiles are not.
+    """
+    small = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return float(np.abs(small[:, :32] - small[:, 32:][:, ::-1]).mean()) / 255.0
+
+
+def dhash(gray, size=8):
+    """
+    Difference hash: one bit per horizontally adjacent pixel pair of a (size+1)x(size) thumbnail.
+    Near-duplicate crops differ in only a few bits.
+    :return: int with size*size bits
+    """
+    small = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view(np.uint8).tobytes().hex(), 16)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BurstCapture:
+    def __init__(self, output_dir, person_name, target=30, min_size=80, min_sharpness=50.0, brightness=(50, 205), min_contrast=25.0, max_asymmetry=0.22, min_interval=0.15, min_distance=6):
+        """
+        Automatic training capture: score every detected face, keep the best crop of each short
+        window, skip near-duplicates and write the accepted crops on a background thread.
+        :param output_dir: Dataset directory
+        :param person_name: Name used in the file names (<name>.<time>.<n>.jpg, as trainer.py expects)
+        :param target: Number of images to collect
+        :param min_size: Smallest accepted face side (px)
+        :param min_sharpness: Minimum Laplacian variance (see sharpness())
+        :param brightness: Accepted range of the mean gray level
+        :param min_contrast: Minimum gray level standard deviation
+        :param max_asymmetry: Maximum left/right asymmetry (see asymmetry())
+        :param min_interval: Seconds per window; at most one image is accepted per window
+        :param min_distance: Minimum dhash Hamming distance to every accepted image
+        """
+        self.output_dir = output_dir
+        self.person_name = person_name
+        self.target = target
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.brightness = brightness
+        self.min_contrast = min_contrast
+        self.max_asymmetry = max_asymmetry
+        self.min_interval = min_interval
+        self.min_distance = min_distance
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.hashes = []
+        self.saved = 0
+        self.candidate = None # (score, crop, hash) of the current window
+        self.window_start = 0
+        self.rejected = {"size": 0, "sharpness": 0, "exposure": 0, "pose": 0, "duplicate": 0}
+        self.started = None
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+    @property
+    def done(self):
+        return self.saved >= self.target
+
+    def score(self, crop):
+        """
+        Quality of a gray face crop.
+        :return: (score, reason). score is None and reason names the failed check if the crop is rejected.
+        """
+        if min(crop.shape[:2]) < self.min_size:
+            return None, "size"
+        mean, std = cv2.meanStdDev(crop)
+        if not self.brightness[0] <= mean[0][0] <= self.brightness[1] or std[0][0] < self.min_contrast:
+            return None, "exposure"
+        sharp = sharpness(crop)
+        if sharp < self.min_sharpness:
+            return None, "sharpness"
+        asym = asymmetry(crop)
+        if asym > self.max_asymmetry:
+            return None, "pose"
+        # Sharper, larger and more frontal is better; size stops mattering once it is well above the minimum
+        return sharp * min(2.0, min(crop.shape[:2]) / float(self.min_size)) * (1.0 - asym), None
+
+    def offer(self, gray, boxes, now=None):
+        """
+        Feed the faces found in a frame (the detection and the crop come from the same frame).
+        The largest face is considered; the others are assumed to be bystanders.
+        :param gray: Gray frame the boxes refer to
+        :param boxes: list of (x, y, w, h)
+        :return: True if an image was accepted (written in the background)
+        """
+        now = time.time() if now is None else now
+        if self.started is None:
+            self.started = now
+        accepted = False
+        if now - self.window_start >= self.min_interval:
+            accepted = self.flush()
+            self.window_start = now
+        if not boxes or self.done:
+            return accepted
+
+        (x, y, w, h) = max(boxes, key=lambda b: b[2] * b[3])
+        crop = gray[y:y+h, x:x+w]
+        score, reason = self.score(crop)
+        if score is None:
+            self.rejected[reason] += 1
+            return accepted
+        if self.candidate is None or score > self.candidate[0]:
+            # Copied: the frame buffer is reused by the next decode
+            self.candidate = (score, crop.copy(), dhash(crop))
+        return accepted
+
+    def flush(self):
+        """
+        Accept the best crop of the current window unless it duplicates an earlier one.
+        :return: True if it was accepted
+        """
+        candidate, self.candidate = self.candidate, None
+        if candidate is None or self.done:
+            return False
+        score, crop, crop_hash = candidate
+        if any(hamming(crop_hash, h) < self.min_distance for h in self.hashes):
+            self.rejected["duplicate"] += 1
+            return False
+        self.hashes.append(crop_hash)
+        self._write(crop, f"score {score:.0f}, {self.saved + 1}/{self.target}")
+        return True
+
+    def save(self, crop):
+        """
+        Write a manually captured crop without scoring it (the 'c' key / SIGUSR2).
+        """
+        self.hashes.append(dhash(crop))
+        self._write(crop.copy(), "manual")
+
+    def _write(self, crop, note):
+        filename = os.path.join(self.output_dir, f"{self.person_name}.{int(time.time())}.{self.saved}.jpg")
+        self.writer.submit(cv2.imwrite, filename, crop)
+        self.saved += 1
+        print(f"Captured {filename} ({note})")
+
+    def describe(self):
+        elapsed = time.time() - self.started if self.started else 0.0
+        rejected = ", ".join(f"{k} {v}" for k, v in self.rejected.items() if v)
+        return f"{self.saved}/{self.target} images in {elapsed:.1f}s" + (f" (rejected: {rejected})" if rejected else "")
+
+    def stop(self):
+        """
+        Write the last window's candidate and wait for pending writes.
+        """
+        self.flush()
+        self.writer.shutdown(wait=True)
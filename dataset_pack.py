@@ -0,0 +1,167 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from detectors import create_detector
+from recognizers import FACE_SIZE, prepare_face
+
+_local = threading.local()
+
+
+def _thread_detector():
+    # CascadeClassifier instances are not safe to share between threads
+    if not hasattr(_local, "detector"):
+        _local.detector = create_detector("haar")
+    return _local.detector
+
+
+def load_face(image_path, size=FACE_SIZE, color=False):
+    """
+    Decode one training image and normalize it: crop to the largest detected face
+    (captures are usually crops already, so the whole image is used when nothing is found),
+    equalize and resize to size x size.
+    :param color: Keep the BGR crop and only resize it (embedding recognizers, see recognizers.face_crop)
+    :return: (size, size) uint8 array ((size, size, 3) with color), or None if the image cannot be read
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR if color else cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if color else image
+    faces = _thread_detector().detect(gray, scale_factor=1.1, min_size=(30, 30))
+    if faces:
+        x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+        image = image[y:y+h, x:x+w]
+    if color:
+        return cv2.resize(image, (size, size), interpolation=cv2.INTER_AREA if image.shape[0] > size else cv2.INTER_LINEAR)
+    return prepare_face(image, size)
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+class DatasetPack:
+    def __init__(self, path, size=FACE_SIZE, color=False):
+        """
+        Packed training set: one raw (N, size, size) uint8 file that is memory mapped,
+        plus a JSON index with the source file, label and signature of every row.
+        :param path: Data file (the index is written to path + '.json')
+        :param size: Face size in pixels
+        :param color: Rows are (size, size, 3) BGR crops instead of normalized gray faces
+        """
+        self.path = path
+        self.index_path = path + ".json"
+        self.size = size
+        self.color = color
+        self.shape = (size, size, 3) if color else (size, size)
+        self.files = []
+        self.labels = []
+        self.signatures = []
+
+        if os.path.exists(self.index_path) and os.path.exists(self.path):
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            row_bytes = int(np.prod(self.shape))
+            if index.get("size") == size and index.get("color", False) == color and os.path.getsize(self.path) == len(index["files"]) * row_bytes:
+                self.files = index["files"]
+                self.labels = index["labels"]
+                self.signatures = index["signatures"]
+            else:
+                print(f"WARNING: {self.path} does not match its index or face format, rebuilding pack.")
+                self.reset()
+
+    def __len__(self):
+        return len(self.files)
+
+    def faces(self):
+        """
+        Zero-copy view of all rows.
+        """
+        if not self.files:
+            return np.zeros((0,) + self.shape, np.uint8)
+        return np.memmap(self.path, dtype=np.uint8, mode='r', shape=(len(self.files),) + self.shape)
+
+    def reset(self):
+        self.files, self.labels, self.signatures = [], [], []
+        open(self.path, 'wb').close()
+        self._save_index()
+
+    def _save_index(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, 'w') as f:
+            json.dump({"size": self.size, "color": self.color, "files": self.files, "labels": self.labels, "signatures": self.signatures}, f)
+        os.replace(tmp, self.index_path)
+
+    def ingest(self, data_dir, files, labels, workers=None):
+        """
+        Make sure every file has an up-to-date row, decoding only what is new or modified
+        with a thread pool (cv2 releases the GIL while decoding and detecting).
+        :return: list of row numbers (None where the image could not be read), in the order of files
+        """
+        latest = {f: i for i, f in enumerate(self.files)}
+        signatures = {f: file_signature(os.path.join(data_dir, f)) for f in files}
+        todo = [(f, l) for f, l in zip(files, labels) if f not in latest or self.signatures[latest[f]] != signatures[f]]
+
+        # Rows that are reused keep the caller's (possibly renumbered) label
+        relabeled = False
+        for f, label in zip(files, labels):
+            row = latest.get(f)
+            if row is not None and self.signatures[row] == signatures[f] and self.labels[row] != int(label):
+                self.labels[row] = int(label)
+                relabeled = True
+
+        if todo:
+            workers = workers or os.cpu_count() or 1
+            print(f"Ingesting {len(todo)} images with {workers} threads...")
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                faces = list(pool.map(lambda item: load_face(os.path.join(data_dir, item[0]), self.size, self.color), todo))
+
+            with open(self.path, 'ab') as out:
+                for (f, label), face in zip(todo, faces):
+                    if face is None:
+                        print(f"Skipping {f}: could not read image")
+                        continue
+                    out.write(np.ascontiguousarray(face, dtype=np.uint8).tobytes())
+                    latest[f] = len(self.files)
+                    self.files.append(f)
+                    self.labels.append(int(label))
+                    self.signatures.append(signatures[f])
+        if todo or relabeled:
+            self._save_index()
+
+        return [latest.get(f) if f in latest and self.signatures[latest[f]] == signatures[f] else None for f in files]
+
+    def compact(self, keep_files):
+        """
+        Rewrite the pack with only the latest row of each kept file (drops deleted/replaced images).
+        """
+        latest = {f: i for i, f in enumerate(self.files) if f in keep_files}
+        if len(latest) == len(self.files):
+            return
+        rows = sorted(latest.values())
+        data = np.array(self.faces()[rows]) if rows else np.zeros((0,) + self.shape, np.uint8)
+        files = [self.files[i] for i in rows]
+        labels = [self.labels[i] for i in rows]
+        signatures = [self.signatures[i] for i in rows]
+        with open(self.path + ".tmp", 'wb') as out:
+            out.write(data.tobytes())
+        os.replace(self.path + ".tmp", self.path)
+        self.files, self.labels, self.signatures = files, labels, signatures
+        self._save_index()
+
+
+def load_pack(path):
+    """
+    Load a pack for training or evaluation without decoding any image.
+    :return: (faces memmap (N, size, size) or (N, size, size, 3), labels array (N,), files list)
+    """
+    with open(path + ".json", 'r') as f:
+        index = json.load(f)
+    pack = DatasetPack(path, size=index["size"], color=index.get("color", False))
+    return pack.faces(), np.array(pack.labels, dtype=np.int32), list(pack.files)
+
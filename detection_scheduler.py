@@ -0,0 +1,141 @@
+import math
+import time
+
+
+class AdaptiveScheduler:
+    # Cost ladder from richest to cheapest: (downscale factor, detectMultiScale scaleFactor)
+    LEVELS = [
+        (1.0, 1.1),
+        (0.75, 1.1),
+        (0.5, 1.1),
+        (0.35, 1.1),
+        (0.25, 1.1),
+        (0.25, 1.2),
+        (0.25, 1.3),
+    ]
+
+    def __init__(self, cpu_budget=0.5, latency_budget=1.0, min_interval=1, adjust_period=5.0, smoothing=0.2):
+        """
+        Pick the detection cadence and downscale factor from measured stage timings.
+        :param cpu_budget: Fraction of one core the detection/recognition stages may use per stream
+        :param latency_budget: Max seconds between a face appearing and the detector seeing it
+        :param min_interval: Never detect more often than every Nth frame
+        :param adjust_period: Seconds between re-evaluations
+        :param smoothing: EMA weight of new timing samples
+        """
+        self.cpu_budget = cpu_budget
+        self.latency_budget = latency_budget
+        self.min_interval = max(1, min_interval)
+        self.adjust_period = adjust_period
+        self.smoothing = smoothing
+
+        self.level = self.LEVELS.index((0.5, 1.1)) # Start at the historical defaults
+        self.interval = 30
+
+        self.fps = 0.0
+        self.detect_cost = None # Seconds per detection pass (EMA)
+        self.recog_cost = 0.0 # Seconds of recognition per detection pass (EMA over all passes)
+        self.pass_recog = None # Recognition seconds of the current pass
+        self.last_frame_time = None
+        self.last_adjust_time = None # Set by the first frame (timestamps may be media time)
+
+    @property
+    def scale(self):
+        return self.LEVELS[self.level][0]
+
+    @property
+    def scale_factor(self):
+        return self.LEVELS[self.level][1]
+
+    def _ema(self, old, sample):
+        if old is None:
+            return sample
+        return old + self.smoothing * (sample - old)
+
+    def record_frame(self, timestamp=None):
+        """
+        Called once per frame reaching the processing loop.
+        """
+        now = timestamp if timestamp is not None else time.time()
+        if self.last_frame_time is not None and now > self.last_frame_time:
+            self.fps = self._ema(self.fps or None, 1.0 / (now - self.last_frame_time))
+        self.last_frame_time = now
+        if self.last_adjust_time is None:
+            self.last_adjust_time = now
+        elif now - self.last_adjust_time >= self.adjust_period:
+            self.last_adjust_time = now
+            self._adjust()
+
+    def record_detection(self, duration):
+        """
+        Called once per detection pass; also closes the recognition total of the previous pass.
+        """
+        self.detect_cost = self._ema(self.detect_cost, duration)
+        if self.pass_recog is not None:
+            # Passes without recognition (every face already tracked) count as 0, so this is the mean per pass
+            self.recog_cost = self._ema(self.recog_cost, self.pass_recog)
+        self.pass_recog = 0.0
+
+    def record_recognition(self, duration):
+        """
+        Recognition time spent in the current detection pass.
+        """
+        self.pass_recog = (self.pass_recog or 0.0) + duration
+
+    def _needed_interval(self, cost):
+        """
+        Smallest frame interval that keeps cost * detection rate within the CPU budget.
+        """
+        return max(self.min_interval, int(math.ceil(self.fps * cost / self.cpu_budget)))
+
+    def _adjust(self):
+        if not self.fps or self.detect_cost is None:
+            return
+
+        cost = self.detect_cost + self.recog_cost
+        max_interval = max(self.min_interval, int(self.fps * self.latency_budget))
+        needed = self._needed_interval(cost)
+        old = (self.interval, self.level)
+
+        if (needed > max_interval or cost > self.latency_budget) and self.level < len(self.LEVELS) - 1:
+            # Over budget even at the slowest acceptable cadence: make each pass cheaper
+            self._set_level(self.level + 1)
+        elif needed <= self.min_interval and self.level > 0:
+            # Plenty of headroom: move to a richer level if its predicted cost still fits
+            richer = self.LEVELS[self.level - 1][0]
+            predicted = self.detect_cost * (richer / self.scale) ** 2 + self.recog_cost
+            if self._needed_interval(predicted) <= self.min_interval and predicted < self.latency_budget / 2:
+                self._set_level(self.level - 1)
+
+        if self.level != old[1]:
+            needed = self._needed_interval(self.detect_cost + self.recog_cost)
+        self.interval = min(needed, max_interval)
+        # Only report meaningful changes; the interval jitters with the timing samples
+        if self.level != old[1] or abs(self.interval - old[0]) > 0.25 * old[0]:
+            print(f"DEBUG: Scheduler: {self.describe()}")
+
+    def _set_level(self, level):
+        # Rescale the cost estimate by pixel count so the next decision is not based on stale timings
+        ratio = (self.LEVELS[level][0] / self.scale) ** 2
+        self.detect_cost *= ratio
+        self.level = level
+
+    def describe(self):
+        """
+        Human readable summary of the current measurements and choices.
+        """
+        detect_ms = (self.detect_cost or 0.0) * 1000
+        cpu = (self.fps / self.interval) * ((self.detect_cost or 0.0) + self.recog_cost) if self.interval else 0.0
+        return (f"fps {self.fps:.1f}, detect {detect_ms:.0f}ms, recog {self.recog_cost * 1000:.0f}ms -> "
+                f"every {self.interval} frames at scale {self.scale:.2f} (scaleFactor {self.scale_factor}), "
+                f"CPU {cpu:.0%} of {self.cpu_budget:.0%} budget")
+
+    def get_state(self):
+        return {
+            "fps": self.fps,
+            "detect_cost": self.detect_cost,
+            "recog_cost": self.recog_cost,
+            "interval": self.interval,
+            "scale": self.scale,
+            "scale_factor": self.scale_factor,
+        }
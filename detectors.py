@@ -0,0 +1,152 @@
+import os
+
+import cv2
+import numpy as np
+
+# Default model file names looked up in the model directory
+DNN_CONFIG_FILE = "deploy.prototxt"
+DNN_MODEL_FILE = "res10_300x300_ssd_iter_140000.caffemodel"
+YUNET_MODEL_FILE = "face_detection_yunet_2023mar.onnx"
+
+BACKENDS = ["haar", "dnn", "yunet"]
+
+
+class HaarDetector:
+    name = "haar"
+
+    def __init__(self, cascade_file=None, min_neighbors=4):
+        """
+        OpenCV Haar cascade face detector.
+        :param cascade_file: Cascade XML (default: haarcascade_frontalface_default.xml shipped with OpenCV)
+        :param min_neighbors: detectMultiScale minNeighbors
+        """
+        if cascade_file is None:
+            cascade_file = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        self.cascade = cv2.CascadeClassifier(cascade_file)
+        if self.cascade.empty():
+            raise FileNotFoundError(f"Could not load Haar cascade {cascade_file}")
+        self.min_neighbors = min_neighbors
+
+    def detect(self, image, scale_factor=1.1, min_size=(30, 30)):
+        """
+        Detect faces in a BGR or gray image.
+        :return: list of (x, y, w, h) in image coordinates
+        """
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        faces = self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=min_size
+        )
+        return [tuple(int(v) for v in f) for f in faces]
+
+    def detect_batch(self, images, scale_factor=1.1, min_size=(30, 30)):
+        # The cascade has no batched path
+        return [self.detect(image, scale_factor, min_size) for image in images]
+
+
+class DnnDetector:
+    name = "dnn"
+
+    def __init__(self, config_file, model_file, input_size=(300, 300), confidence=0.5):
+        """
+        OpenCV DNN (ResNet-10 SSD, Caffe) face detector on the CPU.
+        Handles profile and tilted faces better than the Haar cascade and supports batched inference.
+        :param config_file: deploy.prototxt
+        :param model_file: res10_300x300_ssd_iter_140000.caffemodel
+        :param input_size: Network input size
+        :param confidence: Minimum detection score
+        """
+        for f in (config_file, model_file):
+            if not os.path.isfile(f):
+                raise FileNotFoundError(f"DNN face model file not found: {f}")
+        self.net = cv2.dnn.readNetFromCaffe(config_file, model_file)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.confidence = confidence
+
+    def detect(self, image, scale_factor=None, min_size=(30, 30)):
+        return self.detect_batch([image], scale_factor, min_size)[0]
+
+    def detect_batch(self, images, scale_factor=None, min_size=(30, 30)):
+        """
+        Run one forward pass over several images (frames or channels).
+        scale_factor is a cascade parameter and is ignored here.
+        :return: list (one per image) of lists of (x, y, w, h)
+        """
+        if not images:
+            return []
+        bgr = [cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if img.ndim == 2 else img for img in images]
+        blob = cv2.dnn.blobFromImages(bgr, 1.0, self.input_size, (104.0, 177.0, 123.0), swapRB=False, crop=False)
+        self.net.setInput(blob)
+        detections = self.net.forward() # [1, 1, N, 7]: image_id, label, score, x1, y1, x2, y2 (relative)
+
+        results = [[] for _ in images]
+        min_w, min_h = min_size if min_size else (0, 0)
+        for det in detections.reshape(-1, 7):
+            image_id, score = int(det[0]), float(det[2])
+            if image_id < 0 or score < self.confidence:
+                continue
+            h, w = images[image_id].shape[:2]
+            x1, y1, x2, y2 = np.clip(det[3:7], 0.0, 1.0) * np.array([w, h, w, h])
+            bw, bh = int(x2 - x1), int(y2 - y1)
+            if bw < min_w or bh < min_h:
+                continue
+            results[image_id].append((int(x1), int(y1), bw, bh))
+        return results
+
+
+class YuNetDetector:
+    name = "yunet"
+
+    def __init__(self, model_file, score_threshold=0.6, nms_threshold=0.3):
+        """
+        OpenCV YuNet (ONNX) face detector via cv2.FaceDetectorYN.
+        :param model_file: face_detection_yunet_*.onnx
+        :param score_threshold: Minimum detection score
+        :param nms_threshold: Non-maximum suppression threshold
+        """
+        if not os.path.isfile(model_file):
+            raise FileNotFoundError(f"YuNet model file not found: {model_file}")
+        self.detector = cv2.FaceDetectorYN.create(model_file, "", (320, 320), score_threshold, nms_threshold)
+        self.input_size = None
+
+    def detect(self, image, scale_factor=None, min_size=(30, 30)):
+        bgr = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR) if image.ndim == 2 else image
+        h, w = bgr.shape[:2]
+        if self.input_size != (w, h):
+            self.detector.setInputSize((w, h))
+            self.input_size = (w, h)
+        _, faces = self.detector.detect(bgr)
+        if faces is None:
+            return []
+
+        min_w, min_h = min_size if min_size else (0, 0)
+        result = []
+        for f in faces:
+            x, y, bw, bh = (int(v) for v in f[:4])
+            if bw < min_w or bh < min_h:
+                continue
+            result.append((max(0, x), max(0, y), bw, bh))
+        return result
+
+    def detect_batch(self, images, scale_factor=None, min_size=(30, 30)):
+        # FaceDetectorYN takes one image per call
+        return [self.detect(image, scale_factor, min_size) for image in images]
+
+
+def create_detector(backend="haar", model_dir="models"):
+    """
+    Build a face detector backend.
+    :param backend: 'haar', 'dnn' or 'yunet'
+    :param model_dir: Directory containing the DNN/YuNet model files
+    """
+    if backend == "haar":
+        return HaarDetector()
+    if backend == "dnn":
+        return DnnDetector(os.path.join(model_dir, DNN_CONFIG_FILE), os.path.join(model_dir, DNN_MODEL_FILE))
+    if backend == "yunet":
+        return YuNetDetector(os.path.join(model_dir, YUNET_MODEL_FILE))
+    raise ValueError(f"Unknown detector backend '{backend}' (choose from {', '.join(BACKENDS)})")
@@ -0,0 +1,131 @@
+import time
+import threading
+
+from frame_grabber import FrameGrabber
+
+
+def map_box(box, src_size, dst_size):
+    """
+    Map (x, y, w, h) from a frame of src_size (w, h) to the same view at dst_size.
+    """
+    sx = dst_size[0] / float(src_size[0])
+    sy = dst_size[1] / float(src_size[1])
+    x, y, w, h = box
+    return (int(round(x * sx)), int(round(y * sy)), int(round(w * sx)), int(round(h * sy)))
+
+
+def expand_box(box, margin, size):
+    """
+    Grow a box by margin (fraction of its size) on every side, clipped to a frame of size (w, h).
+    """
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    x0, y0 = max(0, x - dx), max(0, y - dy)
+    x1, y1 = min(size[0], x + w + dx), min(size[1], y + h + dy)
+    return (x0, y0, max(0, x1 - x0), max(0, y1 - y0))
+
+
+def refine_box(detector, image, box, margin=0.3):
+    """
+    Re-detect a face inside a box mapped from the other stream. The two streams are not frame-synchronized,
+    so the mapped box may be off by the movement between them; the face found near it is used instead.
+    :param detector: Face detector backend (see detectors.py)
+    :param image: High resolution frame (BGR or gray)
+    :param box: Box mapped into image coordinates
+    :return: (x, y, w, h) of the detected face, or box if nothing was found
+    """
+    h_img, w_img = image.shape[:2]
+    rx, ry, rw, rh = expand_box(box, margin, (w_img, h_img))
+    if rw < 24 or rh < 24:
+        return box
+    min_side = max(24, int(min(box[2], box[3]) * 0.5))
+    faces = detector.detect(image[ry:ry+rh, rx:rx+rw], min_size=(min_side, min_side))
+    if not faces:
+        return box
+    # The face closest to the mapped center
+    cx, cy = box[0] + box[2] / 2.0 - rx, box[1] + box[3] / 2.0 - ry
+    x, y, w, h = min(faces, key=lambda f: (f[0] + f[2] / 2.0 - cx) ** 2 + (f[1] + f[3] / 2.0 - cy) ** 2)
+    return (rx + x, ry + y, w, h)
+
+
+class DetailStream:
+    def __init__(self, uri, idle_timeout=15.0, max_frame_age=1.0, retry_delay=30.0):
+        """
+        High resolution stream that is only decoded while someone needs it.
+        Detection runs on the sub-stream; recognition and snapshots call frame(), which opens the main
+        stream in the background on first use and keeps it open until it has not been asked for
+        for idle_timeout seconds.
+        :param uri: Main stream URI
+        :param idle_timeout: Seconds without a request before the stream is closed again
+        :param max_frame_age: Frames older than this are not returned
+        :param retry_delay: Seconds before retrying after the stream could not be opened
+        """
+        self.uri = uri
+        self.idle_timeout = idle_timeout
+        self.max_frame_age = max_frame_age
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+        self.grabber = None
+        self.opening = False
+        self.failed_at = None
+        self.last_request = 0
+
+    @property
+    def failed(self):
+        """
+        True while the last open attempt failed (callers fall back to the sub-stream).
+        """
+        return self.failed_at is not None
+
+    def frame(self):
+        """
+        Freshest high resolution frame. Opens the stream if it is closed.
+        :return: BGR frame, or None while the stream is opening, failed or has no fresh frame
+        """
+        now = time.time()
+        with self.lock:
+            self.last_request = now
+            grabber = self.grabber
+            if grabber is None:
+                if not self.opening and (self.failed_at is None or now - self.failed_at >= self.retry_delay):
+                    self.opening = True
+                    threading.Thread(target=self._open, daemon=True).start()
+                return None
+        frame, timestamp = grabber.peek()
+        if frame is None or now - timestamp > self.max_frame_age:
+            return None
+        return frame
+
+    def close_if_idle(self):
+        """
+        Close the stream when nobody asked for a frame recently. Cheap enough to call every frame.
+        """
+        with self.lock:
+            if self.grabber is None or time.time() - self.last_request < self.idle_timeout:
+                return
+            grabber, self.grabber = self.grabber, None
+        print("DEBUG: Main stream idle, closing it.")
+        threading.Thread(target=grabber.stop, daemon=True).start()
+
+    def stop(self):
+        with self.lock:
+            grabber, self.grabber = self.grabber, None
+        if grabber:
+            grabber.stop()
+
+    def _open(self):
+        print(f"DEBUG: Opening main stream for high resolution crops: {self.uri}")
+        t_start = time.time()
+        grabber = FrameGrabber(self.uri, max_frame_age=self.max_frame_age)
+        ok = grabber.start()
+        with self.lock:
+            self.opening = False
+            if ok:
+                self.grabber = grabber
+                self.failed_at = None
+            else:
+                self.failed_at = time.time()
+        if ok:
+            print(f"DEBUG: Main stream open after {time.time() - t_start:.1f}s.")
+        else:
+            print(f"WARNING: Could not open main stream {self.uri}; using sub-stream crops for {self.retry_delay:.0f}s.")
@@ -0,0 +1,203 @@
+import os
+
+import cv2
+import numpy as np
+
+# Default embedding model looked up in the model directory (OpenCV model zoo SFace)
+SFACE_MODEL_FILE = "face_recognition_sface_2021dec.onnx"
+
+# Distances are (1 - cosine similarity) * 100, so lower is better like LBPH.
+# SFace's recommended cosine threshold of 0.363 corresponds to a distance of ~64.
+EMBEDDING_THRESHOLD = 63.0
+
+
+class SFaceEmbedder:
+    size = 112
+
+    def __init__(self, model_file):
+        """
+        Turn face crops into 128-d embeddings with OpenCV's SFace model (cv2.FaceRecognizerSF).
+        :param model_file: face_recognition_sface_*.onnx
+        """
+        if not os.path.isfile(model_file):
+            raise FileNotFoundError(f"SFace model file not found: {model_file}")
+        self.model = cv2.FaceRecognizerSF.create(model_file, "")
+
+    def embed(self, face):
+        """
+        :param face: BGR face crop of any size, as cut from the frame (SFace is trained on colour faces
+                     without histogram equalization; gray crops are accepted but match worse)
+        :return: L2-normalized float32 vector
+        """
+        bgr = cv2.cvtColor(face, cv2.COLOR_GRAY2BGR) if face.ndim == 2 else face
+        bgr = cv2.resize(bgr, (self.size, self.size))
+        feature = self.model.feature(bgr).reshape(-1).astype(np.float32)
+        norm = np.linalg.norm(feature)
+        return feature / norm if norm > 0 else feature
+
+
+class GalleryIndex:
+    def __init__(self, embeddings, labels, float16=False):
+        """
+        Contiguous embedding matrix with vectorized cosine search.
+        Rows are grouped by label so each person's samples form one slice,
+        and per-person centroids allow a coarse search before the exact one.
+        :param embeddings: (N, D) array
+        :param labels: (N,) integer labels
+        :param float16: Store the matrix as float16 (half the memory, scores are computed in float32)
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.maximum(norms, 1e-12)
+
+        order = np.argsort(labels, kind="stable")
+        self.labels = np.ascontiguousarray(labels[order])
+        self.matrix = np.ascontiguousarray(embeddings[order], dtype=np.float16 if float16 else np.float32)
+        self.float16 = float16
+
+        # Per-person slices and centroids
+        self.people, starts = np.unique(self.labels, return_index=True)
+        self.slices = np.append(starts, len(self.labels))
+        centroids = np.add.reduceat(embeddings[order], starts, axis=0) if len(starts) else np.zeros((0, embeddings.shape[1]), np.float32)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _scores(self, queries, rows=None):
+        """
+        Cosine similarity of (M, D) float32 queries against the gallery (or a subset of rows).
+        float16 storage is upcast in chunks so the BLAS float32 path is used.
+        """
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        if not self.float16:
+            return queries @ matrix.T
+        out = np.empty((queries.shape[0], matrix.shape[0]), np.float32)
+        chunk = 8192
+        for i in range(0, matrix.shape[0], chunk):
+            out[:, i:i + chunk] = queries @ matrix[i:i + chunk].astype(np.float32).T
+        return out
+
+    def search(self, queries, k=5, probe=None):
+        """
+        Top-k nearest gallery samples per query.
+        :param queries: (D,) or (M, D) normalized embeddings
+        :param k: Number of neighbours
+        :param probe: If set, only search the samples of the `probe` people whose centroids score best
+        :return: list (one per query) of [(label, similarity), ...] best first
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if len(self) == 0:
+            return [[] for _ in queries]
+
+        if not probe:
+            return [self._top_k(row, None, k) for row in self._scores(queries)]
+
+        results = []
+        for q in queries:
+            top_people = np.argsort(-(self.centroids @ q))[:probe]
+            rows = np.concatenate([np.arange(self.slices[p], self.slices[p + 1]) for p in top_people])
+            results.append(self._top_k(self._scores(q[None, :], rows)[0], rows, k))
+        return results
+
+    def _top_k(self, scores, rows, k):
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        labels = self.labels[top] if rows is None else self.labels[rows[top]]
+        return [(int(l), float(scores[t])) for l, t in zip(labels, top)]
+
+    def centroid_scores(self, query):
+        """
+        Cosine similarity of one query against every person's centroid.
+        :return: list of (label, similarity) best first
+        """
+        scores = self.centroids @ np.asarray(query, dtype=np.float32)
+        order = np.argsort(-scores)
+        return [(int(self.people[i]), float(scores[i])) for i in order]
+
+
+class EmbeddingRecognizer:
+    def __init__(self, embedder, threshold=EMBEDDING_THRESHOLD, k=5, float16=False, probe_above=20000):
+        """
+        Embedding-based alternative to the LBPH recognizer with the same predict() contract:
+        predict(gray_face) -> (label, distance), lower distance is better.
+        :param embedder: Object with embed(face) -> normalized vector
+        :param threshold: Distance below which a prediction is accepted
+        :param k: Neighbours considered per query
+        :param float16: Store the gallery as float16
+        :param probe_above: Use centroid pre-filtering once the gallery exceeds this many samples
+        """
+        self.embedder = embedder
+        # Queries and gallery samples are colour crops (see recognizers.face_crop and dataset_pack.load_face)
+        self.color = True
+        self.face_size = embedder.size
+        self.threshold = threshold
+        self.k = k
+        self.float16 = float16
+        self.probe_above = probe_above
+        self.index = GalleryIndex(np.zeros((0, 1), np.float32), np.zeros(0, np.int32), float16)
+
+    def _embed_all(self, faces):
+        return np.stack([self.embedder.embed(f) for f in faces]) if len(faces) else np.zeros((0, 1), np.float32)
+
+    def train(self, faces, labels):
+        self.index = GalleryIndex(self._embed_all(faces), labels, self.float16)
+
+    def update(self, faces, labels):
+        """
+        Append samples to the gallery without re-embedding the existing ones.
+        """
+        new = self._embed_all(faces)
+        if len(self.index) == 0:
+            self.index = GalleryIndex(new, labels, self.float16)
+            return
+        old = self.index.matrix.astype(np.float32)
+        self.index = GalleryIndex(np.vstack([old, new]), np.concatenate([self.index.labels, np.asarray(labels, np.int32)]), self.float16)
+
+    def predict(self, face):
+        return self.predict_batch([face])[0]
+
+    def predict_batch(self, faces):
+        """
+        Recognize several face crops with one matrix product.
+        :return: list of (label, distance); label is -1 for an empty gallery
+        """
+        if len(self.index) == 0:
+            return [(-1, float("inf")) for _ in faces]
+        queries = self._embed_all(faces)
+        probe = 3 if len(self.index) > self.probe_above else None
+        results = []
+        for neighbours in self.index.search(queries, self.k, probe):
+            # Similarity-weighted vote among the k nearest samples
+            votes = {}
+            for label, sim in neighbours:
+                votes[label] = votes.get(label, 0.0) + max(sim, 0.0)
+            label = max(votes, key=votes.get)
+            best = max(sim for l, sim in neighbours if l == label)
+            results.append((label, (1.0 - best) * 100.0))
+        return results
+
+    def write(self, path):
+        """
+        Save the gallery as a single .npz file.
+        """
+        # Through a file object: np.savez appends '.npz' to a path without that extension
+        with open(path, 'wb') as f:
+            np.savez(f, embeddings=self.index.matrix, labels=self.index.labels)
+
+    def read(self, path):
+        with np.load(path) as data:
+            embeddings = data["embeddings"]
+            labels = data["labels"]
+        self.float16 = embeddings.dtype == np.float16
+        self.index = GalleryIndex(embeddings, labels, self.float16)
+
+
+def create_embedding_recognizer(model_dir="models", float16=False):
+    """
+    Build an EmbeddingRecognizer backed by the SFace model in model_dir.
+    """
+    return EmbeddingRecognizer(SFaceEmbedder(os.path.join(model_dir, SFACE_MODEL_FILE)), float16=float16)
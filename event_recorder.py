@@ -0,0 +1,340 @@
+import os
+import re
+import glob
+import time
+import queue
+import shutil
+import datetime
+import threading
+import subprocess
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+RECORD_MODES = ["auto", "remux", "frames"]
+
+
+class EventRecorder:
+    def __init__(self, output_dir, pre_seconds=5.0, post_seconds=10.0, camera="main"):
+        """
+        Base class: save a clip from pre_seconds before to post_seconds after each event, plus a snapshot.
+        All file writing happens on a background thread.
+        :param output_dir: Directory for clips and snapshots
+        :param pre_seconds: Seconds of video kept before the event
+        :param post_seconds: Seconds of video recorded after the event
+        :param camera: Camera name used in file names
+        """
+        self.output_dir = output_dir
+        self.pre_seconds = pre_seconds
+        self.post_seconds = post_seconds
+        self.camera = camera
+        self.events = [] # Pending clips: dicts with name, start, end, path
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.running = False
+        os.makedirs(output_dir, exist_ok=True)
+
+    def start(self):
+        self.running = True
+        return True
+
+    def stop(self):
+        self.running = False
+        self.writer.shutdown(wait=True)
+
+    def push(self, frame, timestamp):
+        """
+        Called for every decoded frame (only the frame based recorder uses it).
+        """
+        pass
+
+    def trigger(self, name, snapshot=None, timestamp=None):
+        """
+        Record an event. Returns immediately.
+        :param name: Person (used in the file names)
+        :param snapshot: Frame to save as JPEG (e.g. the annotated frame), or None
+        :return: Path of the clip that will be written
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        stamp = datetime.datetime.fromtimestamp(timestamp).strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(self.output_dir, f"{self.camera}_{stamp}_{re.sub(r'[^A-Za-z0-9_-]', '_', name)}")
+        if snapshot is not None:
+            self.writer.submit(self._write_snapshot, base + ".jpg", snapshot)
+
+        with self.lock:
+            # An event during a pending clip extends that clip instead of starting an overlapping one
+            for event in self.events:
+                if event["start"] <= timestamp <= event["end"]:
+                    event["end"] = max(event["end"], timestamp + self.post_seconds)
+                    return event["path"]
+            event = {"name": name, "start": timestamp - self.pre_seconds, "end": timestamp + self.post_seconds, "path": base + ".mp4"}
+            self.events.append(event)
+        print(f"DEBUG: Recording event clip {event['path']} ({self.pre_seconds:g}s before, {self.post_seconds:g}s after)")
+        return event["path"]
+
+    def _write_snapshot(self, path, frame):
+        if cv2.imwrite(path, frame):
+            print(f"Event snapshot saved to {path}")
+        else:
+            print(f"WARNING: Could not write {path}")
+
+    def _due_events(self, now):
+        """
+        Remove and return events whose recording window has passed.
+        """
+        with self.lock:
+            due = [e for e in self.events if e["end"] <= now]
+            self.events = [e for e in self.events if e["end"] > now]
+        return due
+
+
+class SegmentRecorder(EventRecorder):
+    # MPEG-TS segments stay readable even if ffmpeg is killed mid-segment
+    segment_ext = ".ts"
+
+    def __init__(self, uri, output_dir, pre_seconds=5.0, post_seconds=10.0, camera="main", segment_seconds=2.0, ffmpeg="ffmpeg"):
+        """
+        Remux the compressed stream into short segments with a separate ffmpeg process (-c copy,
+        no decoding or encoding) and join the segments around an event into a clip.
+        Only the last pre_seconds worth of segments are kept on disk.
+        :param uri: Stream URI (opened a second time by ffmpeg)
+        :param segment_seconds: Target segment length (segments are cut on keyframes, so they may be longer)
+        :param ffmpeg: ffmpeg executable
+        """
+        super().__init__(output_dir, pre_seconds, post_seconds, camera)
+        self.uri = uri
+        self.segment_seconds = segment_seconds
+        self.ffmpeg = ffmpeg
+        self.segment_dir = os.path.join(output_dir, f".segments-{camera}")
+        self.process = None
+        self.thread = None
+        self.restart_delay = 1.0
+        self.expired = set() # Segments queued for removal
+
+    def start(self):
+        os.makedirs(self.segment_dir, exist_ok=True)
+        for old in glob.glob(os.path.join(self.segment_dir, "*" + self.segment_ext)):
+            os.remove(old)
+        if not self._spawn():
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        # ffmpeg has closed its last segment; save what was recorded of pending events
+        self._cut(self._due_events(float("inf")), self._segments() + [(float("inf"), None)])
+        super().stop()
+
+    def _spawn(self):
+        cmd = [self.ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin"]
+        if self.uri.startswith("rtsp"):
+            cmd += ["-rtsp_transport", "tcp"]
+        elif os.path.exists(self.uri):
+            # Local files (replays/tests) are read at their native rate like a live stream
+            cmd += ["-re"]
+        cmd += ["-i", self.uri, "-map", "0:v", "-c", "copy",
+                "-f", "segment", "-segment_time", str(self.segment_seconds), "-reset_timestamps", "1",
+                "-strftime", "1", os.path.join(self.segment_dir, "%Y%m%d-%H%M%S" + self.segment_ext)]
+        try:
+            self.process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        except OSError as e:
+            print(f"WARNING: Could not start ffmpeg for recording: {e}")
+            return False
+        return True
+
+    def _segments(self):
+        """
+        :return: sorted list of (start time, path) of the segments on disk
+        """
+        segments = []
+        for path in glob.glob(os.path.join(self.segment_dir, "*" + self.segment_ext)):
+            try:
+                start = time.mktime(time.strptime(os.path.basename(path)[:-len(self.segment_ext)], "%Y%m%d-%H%M%S"))
+            except ValueError:
+                continue
+            segments.append((start, path))
+        return sorted(segments)
+
+    def _loop(self):
+        while self.running:
+            time.sleep(0.5)
+            if self.process.poll() is not None:
+                print(f"WARNING: Recording ffmpeg exited with code {self.process.returncode}, restarting in {self.restart_delay:.0f}s...")
+                time.sleep(self.restart_delay)
+                self.restart_delay = min(self.restart_delay * 2, 60.0)
+                if self.running:
+                    self._spawn()
+                continue
+
+            segments = self._segments()
+            if len(segments) > 1:
+                self.restart_delay = 1.0
+
+            # A clip can be cut once a segment has started after its end (the one covering it is closed)
+            self._cut(self._due_events(segments[-1][0] if segments else 0), segments)
+
+            # Keep what a future event may still need
+            with self.lock:
+                oldest_needed = min([e["start"] for e in self.events] + [time.time() - self.pre_seconds])
+            for i, (start, path) in enumerate(segments[:-1]):
+                if segments[i + 1][0] < oldest_needed - self.segment_seconds and path not in self.expired:
+                    self.expired.add(path)
+                    self.writer.submit(self._remove, path)
+
+    def _cut(self, events, segments):
+        """
+        Queue clips for events, using the closed segments (all but the last one, which is still being written).
+        """
+        for event in events:
+            # Segment i covers [start_i, start_i+1)
+            parts = [path for i, (start, path) in enumerate(segments[:-1])
+                     if start < event["end"] and segments[i + 1][0] > event["start"]]
+            self.writer.submit(self._write_clip, event, parts)
+
+    def _remove(self, path):
+        # Deferred to the writer so a clip being joined never loses a segment
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        self.expired.discard(path)
+
+    def _write_clip(self, event, parts):
+        if not parts:
+            print(f"WARNING: No recorded segments for {event['path']}")
+            return
+        list_file = event["path"] + ".txt"
+        with open(list_file, 'w') as f:
+            for path in parts:
+                f.write(f"file '{os.path.abspath(path)}'\n")
+        cmd = [self.ffmpeg, "-hide_banner", "-loglevel", "error", "-nostdin", "-y",
+               "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", "-movflags", "+faststart", event["path"]]
+        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        os.remove(list_file)
+        if result.returncode == 0:
+            print(f"Event clip saved to {event['path']}")
+        else:
+            print(f"WARNING: Could not write {event['path']}: {result.stderr.decode(errors='replace').strip()}")
+
+
+class FrameRecorder(EventRecorder):
+    def __init__(self, output_dir, pre_seconds=5.0, post_seconds=10.0, camera="main", fps=10.0, quality=80):
+        """
+        Fallback when ffmpeg is not available: keep JPEG-compressed decoded frames in a ring buffer
+        and re-encode them into a clip. Compression runs on a background thread; the hot loop
+        only hands over frame references (and drops them if that thread falls behind).
+        :param fps: Frame rate kept in the buffer and used for clips
+        :param quality: JPEG quality of buffered frames
+        """
+        super().__init__(output_dir, pre_seconds, post_seconds, camera)
+        self.fps = fps
+        self.quality = quality
+        self.inbox = queue.Queue(maxsize=max(2, int(fps)))
+        self.ring = collections.deque() # (timestamp, jpeg) of the last pre_seconds
+        self.clips = {} # event path -> list of (timestamp, jpeg)
+        self.last_push = 0
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        self.inbox.put(None)
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        # Save what was buffered of pending events
+        for event in self._due_events(float("inf")):
+            self.writer.submit(self._write_clip, event, self.clips.pop(event["path"], []))
+        super().stop()
+
+    def push(self, frame, timestamp):
+        if timestamp - self.last_push < 1.0 / self.fps:
+            return
+        self.last_push = timestamp
+        try:
+            # Copied: the player draws on (and the grabber may reuse) the frame before it is encoded here
+            self.inbox.put_nowait((timestamp, frame.copy()))
+        except queue.Full:
+            pass
+
+    def _loop(self):
+        while self.running:
+            try:
+                item = self.inbox.get(timeout=0.5)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            now = time.time()
+
+            # New events start with the buffered pre-event frames
+            with self.lock:
+                for event in self.events:
+                    if event["path"] not in self.clips:
+                        self.clips[event["path"]] = [(t, j) for t, j in self.ring if t >= event["start"]]
+
+            if item:
+                timestamp, frame = item
+                ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if ok:
+                    self.ring.append((timestamp, jpeg))
+                    with self.lock:
+                        for event in self.events:
+                            if event["start"] <= timestamp <= event["end"]:
+                                self.clips[event["path"]].append((timestamp, jpeg))
+                while self.ring and self.ring[0][0] < timestamp - self.pre_seconds:
+                    self.ring.popleft()
+
+            for event in self._due_events(now):
+                self.writer.submit(self._write_clip, event, self.clips.pop(event["path"], []))
+
+    def _write_clip(self, event, frames):
+        if not frames:
+            print(f"WARNING: No buffered frames for {event['path']}")
+            return
+        first = cv2.imdecode(frames[0][1], cv2.IMREAD_COLOR)
+        height, width = first.shape[:2]
+        # Play back at the rate frames were actually buffered (the stream may be slower than self.fps)
+        span = frames[-1][0] - frames[0][0]
+        fps = min(self.fps, (len(frames) - 1) / span) if span > 0 else self.fps
+        out = cv2.VideoWriter(event["path"], cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+        if not out.isOpened():
+            print(f"WARNING: Could not write {event['path']}")
+            return
+        for _, jpeg in frames:
+            out.write(cv2.imdecode(jpeg, cv2.IMREAD_COLOR))
+        out.release()
+        print(f"Event clip saved to {event['path']} ({len(frames)} frames)")
+
+
+def create_recorder(uri, output_dir, pre_seconds=5.0, post_seconds=10.0, camera="main", mode="auto"):
+    """
+    Build an event recorder.
+    :param mode: 'remux' (ffmpeg -c copy segments), 'frames' (buffer decoded frames) or 'auto' (remux if ffmpeg is installed)
+    """
+    if mode not in RECORD_MODES:
+        raise ValueError(f"Unknown record mode '{mode}' (expected one of {', '.join(RECORD_MODES)})")
+    ffmpeg = shutil.which("ffmpeg")
+    if mode == "remux" or (mode == "auto" and ffmpeg):
+        if not ffmpeg:
+            raise FileNotFoundError("ffmpeg not found on PATH (needed for --record-mode remux)")
+        return SegmentRecorder(uri, output_dir, pre_seconds, post_seconds, camera, ffmpeg=ffmpeg)
+    if mode == "auto":
+        print("WARNING: ffmpeg not found, event clips will be re-encoded from decoded frames.")
+    return FrameRecorder(output_dir, pre_seconds, post_seconds, camera)
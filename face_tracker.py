@@ -0,0 +1,150 @@
+import collections
+import itertools
+import time
+
+
+def iou(a, b):
+    """
+    Intersection over union of two (x, y, w, h) boxes.
+    """
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / float(union) if union > 0 else 0.0
+
+
+def _centroid_distance(a, b):
+    """
+    Distance between box centres, relative to the mean box size.
+    """
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    dx = (ax + aw / 2.0) - (bx + bw / 2.0)
+    dy = (ay + ah / 2.0) - (by + bh / 2.0)
+    size = (aw + ah + bw + bh) / 4.0
+    return ((dx * dx + dy * dy) ** 0.5) / size if size > 0 else float("inf")
+
+
+class Track:
+    def __init__(self, track_id, box, history_size):
+        """
+        One face followed across detection passes.
+        :param track_id: Unique id
+        :param box: (x, y, w, h) in full frame coordinates
+        :param history_size: Number of recent predictions kept for voting
+        """
+        self.id = track_id
+        self.box = box
+        self.hits = 1
+        self.misses = 0
+        self.history = collections.deque(maxlen=history_size) # (name or None, distance)
+        self.last_predict_time = 0
+        self.verified_name = None
+        self.alerted = False
+
+    @property
+    def last_prediction(self):
+        return self.history[-1] if self.history else None
+
+
+class FaceTracker:
+    def __init__(self, iou_threshold=0.3, max_centroid_distance=1.0, max_misses=2, history_size=5, min_votes=2, recheck_interval=10.0):
+        """
+        Associate detections across passes so each person is recognized once, not on every pass.
+        :param iou_threshold: Minimum IoU to continue a track
+        :param max_centroid_distance: Fallback match on centre distance (in face sizes) for fast movement
+        :param max_misses: Detection passes a track may go unmatched before it is dropped
+        :param history_size: Predictions kept per track for stability voting
+        :param min_votes: Votes a name needs within the history to become the verified identity
+        :param recheck_interval: Seconds before a verified identity is re-confirmed with a new prediction
+        """
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_misses = max_misses
+        self.history_size = history_size
+        self.min_votes = min_votes
+        self.recheck_interval = recheck_interval
+        self.tracks = []
+        self._ids = itertools.count(1)
+
+    def update(self, boxes):
+        """
+        Match the boxes of a detection pass to existing tracks (greedy, best score first).
+        :return: list of tracks for the given boxes, in the same order
+        """
+        candidates = []
+        for ti, track in enumerate(self.tracks):
+            for bi, box in enumerate(boxes):
+                overlap = iou(track.box, box)
+                if overlap >= self.iou_threshold:
+                    candidates.append((1.0 + overlap, ti, bi))
+                else:
+                    dist = _centroid_distance(track.box, box)
+                    if dist <= self.max_centroid_distance:
+                        candidates.append((1.0 - dist / (self.max_centroid_distance + 1.0), ti, bi))
+        candidates.sort(reverse=True)
+
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+        for _, ti, bi in candidates:
+            if ti in used_tracks or assigned[bi] is not None:
+                continue
+            track = self.tracks[ti]
+            track.box = tuple(boxes[bi])
+            track.hits += 1
+            track.misses = 0
+            assigned[bi] = track
+            used_tracks.add(ti)
+
+        survivors = []
+        for ti, track in enumerate(self.tracks):
+            if ti not in used_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        self.tracks = survivors
+
+        for bi, box in enumerate(boxes):
+            if assigned[bi] is None:
+                track = Track(next(self._ids), tuple(box), self.history_size)
+                self.tracks.append(track)
+                assigned[bi] = track
+        return assigned
+
+    def needs_recognition(self, track, now=None):
+        """
+        Predict for new or unverified tracks until the history is full,
+        and re-confirm verified identities once their last prediction has aged out.
+        """
+        now = now if now is not None else time.time()
+        if track.verified_name is None:
+            return len(track.history) < self.history_size or now - track.last_predict_time > self.recheck_interval
+        return now - track.last_predict_time > self.recheck_interval
+
+    def add_prediction(self, track, name, distance, now=None):
+        """
+        Record a prediction for a track and update its stability vote.
+        :param name: Accepted name, or None if the prediction was rejected (Unknown)
+        :param distance: Recognizer distance (lower is better)
+        :return: The verified name, or None
+        """
+        track.last_predict_time = now if now is not None else time.time()
+        track.history.append((name, distance))
+
+        votes = collections.Counter(n for n, _ in track.history if n)
+        if votes:
+            best, count = votes.most_common(1)[0]
+            verified = best if count >= self.min_votes else None
+        else:
+            verified = None
+        if verified != track.verified_name:
+            track.alerted = False
+        track.verified_name = verified
+        return verified
+
+    def clear(self):
+        self.tracks = []
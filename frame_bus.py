@@ -0,0 +1,525 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import threading
+import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
+
+import cv2
+import numpy as np
+
+from frame_grabber import OPEN_TIMEOUT_MS, FrameGrabber
+
+MAGIC = 0x4f4e56494642 # "ONVIFB"
+ALIGN = 64
+
+# Header fields (int64)
+H_MAGIC, H_SLOTS, H_CAPACITY, H_WRITE_SEQ, H_CLOSED, H_CONNECTED, H_RECONNECTS, H_OUTAGES, H_DOWNTIME_MS, H_OVERSIZE = range(10)
+HEADER_FIELDS = 16
+
+# Slot table columns (int64): sequence number (-1 while the slot is being written), timestamp (ns), frame shape
+S_SEQ, S_TIME_NS, S_HEIGHT, S_WIDTH, S_CHANNELS = range(5)
+SLOT_FIELDS = 5
+
+POLL_INTERVAL = 0.002 # Readers poll for new frames; the producer never waits for anyone
+
+# Seconds the capture process waits for the parent to re-resolve the stream URI (ONVIF discovery)
+RESOLVE_TIMEOUT = 30.0
+
+
+# Before Python 3.13, every SharedMemory registers its name with the resource tracker (POSIX only)
+_TRACKED = os.name == "posix" and sys.version_info < (3, 13)
+
+
+def _aligned(size):
+    return (size + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _open_untracked(name, create=False, size=0):
+    """
+    Open a shared memory segment without leaving it registered with Python's resource tracker.
+    A bus has one explicit owner that unlinks it (the capture process, or BusGrabber.stop() if that
+    process died). A registration held by any other process is reported as leaked when it exits,
+    or removes the owner's entry from a tracker the two processes share.
+    """
+    if not _TRACKED:
+        if sys.version_info >= (3, 13):
+            return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+        return shared_memory.SharedMemory(name=name, create=create, size=size)
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+def _unlink(shm):
+    if _TRACKED:
+        # unlink() unregisters the name again: register it first so the tracker's bookkeeping stays balanced
+        resource_tracker.register(shm._name, "shared_memory")
+    shm.unlink()
+
+
+def _layout(slots, capacity):
+    """
+    Byte offsets of the slot table and the frame slots, and the total size.
+    """
+    table = _aligned(HEADER_FIELDS * 8)
+    data = table + _aligned(slots * SLOT_FIELDS * 8)
+    return table, data, data + slots * _aligned(capacity)
+
+
+def bus_name(camera):
+    """
+    Shared memory name for a camera's bus (unique per process, no '/').
+    """
+    return f"onvif_{camera.replace('/', '_')}_{os.getpid()}"
+
+
+class FrameBus:
+    def __init__(self, name, capacity, slots=8):
+        """
+        Producer side of a shared memory frame ring. Decoded frames are published into the next slot
+        with an increasing sequence number; readers in any process attach by name (see FrameReader).
+        Publishing never waits for readers: a reader that falls more than slots-1 frames behind
+        simply finds newer frames in the slots it wanted.
+        :param name: Shared memory name
+        :param capacity: Largest frame in bytes (h * w * channels, uint8)
+        :param slots: Ring size; bounds how long a zero-copy view stays valid (slots-1 frame intervals)
+        """
+        self.name = name
+        self.slots = slots
+        self.capacity = capacity
+        table, data, size = _layout(slots, capacity)
+        self.shm = _open_untracked(name, create=True, size=size)
+        self.head = np.ndarray((HEADER_FIELDS,), np.int64, self.shm.buf, 0)
+        self.table = np.ndarray((slots, SLOT_FIELDS), np.int64, self.shm.buf, table)
+        self.data = np.ndarray((slots, _aligned(capacity)), np.uint8, self.shm.buf, data)
+        self.head[:] = 0
+        self.table[:, S_SEQ] = 0
+        self.head[H_SLOTS] = slots
+        self.head[H_CAPACITY] = capacity
+        self.head[H_MAGIC] = MAGIC # Last: readers wait for it
+        self.seq = 0
+
+    def publish(self, frame, timestamp=None):
+        """
+        Copy a frame into the next slot.
+        :param frame: uint8 image (h, w) or (h, w, c)
+        :return: Sequence number, or None if the frame does not fit (the stream changed resolution)
+        """
+        if frame.nbytes > self.capacity:
+            self.head[H_OVERSIZE] += 1
+            return None
+        timestamp = time.time() if timestamp is None else timestamp
+        self.seq += 1
+        slot = self.seq % self.slots
+        row = self.table[slot]
+        # Seqlock: readers that see -1, or a different sequence number after copying, retry or drop the frame
+        row[S_SEQ] = -1
+        self.data[slot, :frame.nbytes] = np.ascontiguousarray(frame).reshape(-1)
+        row[S_TIME_NS] = int(timestamp * 1e9)
+        row[S_HEIGHT] = frame.shape[0]
+        row[S_WIDTH] = frame.shape[1]
+        row[S_CHANNELS] = frame.shape[2] if frame.ndim == 3 else 0
+        row[S_SEQ] = self.seq
+        self.head[H_WRITE_SEQ] = self.seq
+        return self.seq
+
+    def set_status(self, connected, reconnects=0, outages=0, downtime=0.0):
+        """
+        Stream status for readers in other processes (see FrameReader.status()).
+        """
+        self.head[H_CONNECTED] = 1 if connected else 0
+        self.head[H_RECONNECTS] = reconnects
+        self.head[H_OUTAGES] = outages
+        self.head[H_DOWNTIME_MS] = int(downtime * 1000)
+
+    def close(self, unlink=True):
+        """
+        Mark the bus closed for readers and release it. Readers keep their mapping until they close.
+        """
+        self.head[H_CLOSED] = 1
+        self.head = self.table = self.data = None
+        self.shm.close()
+        if unlink:
+            _unlink(self.shm)
+
+
+class BusFrame:
+    def __init__(self, reader, slot, seq, timestamp, image):
+        """
+        A frame read from the bus.
+        :param image: numpy array; a view into shared memory unless the reader copied it.
+                      A view stays valid until the producer reuses its slot, see valid().
+        """
+        self.reader = reader
+        self.slot = slot
+        self.seq = seq
+        self.timestamp = timestamp
+        self.image = image
+
+    def valid(self):
+        """
+        True while the producer has not reused the slot. Check after working on a zero-copy view
+        and discard the result if it turned False (the view was overwritten during the work).
+        """
+        return self.reader.table is not None and self.reader.table[self.slot, S_SEQ] == self.seq
+
+
+class FrameReader:
+    def __init__(self, name, timeout=0.0):
+        """
+        Consumer side of a FrameBus. Each reader keeps its own position and reads at its own rate.
+        Readers never own the bus: the producer unlinks it (see _open_untracked()).
+        :param name: Shared memory name of the bus
+        :param timeout: Seconds to wait for the bus to appear
+        """
+        deadline = time.time() + timeout
+        while True:
+            try:
+                self.shm = _open_untracked(name)
+                break
+            except FileNotFoundError:
+                if time.time() >= deadline:
+                    raise
+                time.sleep(0.05)
+        self.name = name
+        self.head = np.ndarray((HEADER_FIELDS,), np.int64, self.shm.buf, 0)
+        while self.head[H_MAGIC] != MAGIC:
+            if time.time() >= deadline:
+                self.close()
+                raise ValueError(f"{name} is not a frame bus")
+            time.sleep(0.01)
+        self.slots = int(self.head[H_SLOTS])
+        capacity = int(self.head[H_CAPACITY])
+        table, data, _ = _layout(self.slots, capacity)
+        self.table = np.ndarray((self.slots, SLOT_FIELDS), np.int64, self.shm.buf, table)
+        self.data = np.ndarray((self.slots, _aligned(capacity)), np.uint8, self.shm.buf, data)
+        self.last_seq = 0
+
+        # Counters
+        self.frames_read = 0
+        self.frames_skipped = 0 # Published while this reader was busy; never seen by it
+        self.torn_reads = 0 # Slot overwritten while copying
+
+    @property
+    def closed(self):
+        return self.head is None or bool(self.head[H_CLOSED])
+
+    @property
+    def latest_seq(self):
+        return int(self.head[H_WRITE_SEQ])
+
+    def read(self, timeout=1.0, copy=False):
+        """
+        Freshest frame newer than the last one this reader returned.
+        :param timeout: Seconds to wait for a new frame
+        :param copy: Return a private copy instead of a view into shared memory (for frames that are
+                     kept, drawn on or handed to other threads). Without it the view is checked against
+                     the slot's sequence number once here; check BusFrame.valid() again after using it.
+        :return: BusFrame, or None on timeout or when the bus is closed
+        """
+        deadline = time.time() + timeout
+        while not self.closed:
+            frame = self._take(copy)
+            if frame is not None:
+                return frame
+            if time.time() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+        return None
+
+    def peek(self, copy=False):
+        """
+        Freshest frame, whether or not this reader has seen it, without moving the reader's position.
+        :return: BusFrame, or None before the first frame
+        """
+        last_seq = self.last_seq
+        self.last_seq = 0
+        try:
+            return self._take(copy, count=False)
+        finally:
+            self.last_seq = last_seq
+
+    def _take(self, copy, count=True):
+        for _ in range(3):
+            seq = self.latest_seq
+            if seq <= self.last_seq:
+                return None
+            slot = seq % self.slots
+            row = self.table[slot]
+            if row[S_SEQ] != seq:
+                # Being rewritten by a newer publish; the header catches up right after
+                self.torn_reads += 1
+                continue
+            timestamp = row[S_TIME_NS] / 1e9
+            shape = (int(row[S_HEIGHT]), int(row[S_WIDTH])) + ((int(row[S_CHANNELS]),) if row[S_CHANNELS] else ())
+            image = self.data[slot, :int(np.prod(shape))].reshape(shape)
+            if copy:
+                image = image.copy()
+            if row[S_SEQ] != seq:
+                self.torn_reads += 1
+                continue
+            if count:
+                if self.last_seq:
+                    self.frames_skipped += seq - self.last_seq - 1
+                self.frames_read += 1
+                self.last_seq = seq
+            return BusFrame(self, slot, seq, timestamp, image)
+        return None
+
+    def status(self):
+        """
+        Stream status published by the producer.
+        """
+        head = self.head
+        return {
+            "connected": bool(head[H_CONNECTED]),
+            "published": int(head[H_WRITE_SEQ]),
+            "reconnects": int(head[H_RECONNECTS]),
+            "outages": int(head[H_OUTAGES]),
+            "downtime": int(head[H_DOWNTIME_MS]) / 1000.0,
+            "oversize": int(head[H_OVERSIZE]),
+        }
+
+    def close(self):
+        self.head = self.table = self.data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass # A zero-copy view is still referenced; the mapping goes away with it
+
+
+def _capture_main(uri, name, slots, ready, stop_event, resolve_conn=None):
+    """
+    Capture process: decode the stream (FrameGrabber, with its reconnect and watchdog logic)
+    and publish every frame to a FrameBus. The bus is created on the first frame, when its size is known.
+    :param resolve_conn: Optional Pipe end; fresh URIs are requested from the parent, which owns the ONVIF client
+    """
+    # The parent stops this process through stop_event; Ctrl+C in the terminal is its business
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    resolve_uri = None
+    if resolve_conn is not None:
+        def resolve_uri():
+            # Drop an answer that arrived after an earlier request timed out
+            while resolve_conn.poll():
+                resolve_conn.recv()
+            resolve_conn.send("resolve")
+            return resolve_conn.recv() if resolve_conn.poll(RESOLVE_TIMEOUT) else None
+    grabber = FrameGrabber(uri, max_frame_age=0, resolve_uri=resolve_uri)
+    if not grabber.start():
+        ready.set()
+        return
+    bus = None
+    warned = False
+    try:
+        while not stop_event.is_set() and grabber.running:
+            ret, frame, timestamp = grabber.read(timeout=0.5)
+            if bus is not None:
+                stats = grabber.get_stats()
+                bus.set_status(grabber.connected, stats["reconnects"], stats["outages"], stats["downtime"])
+            if not ret:
+                continue
+            if bus is None:
+                bus = FrameBus(name, frame.nbytes, slots)
+                ready.set()
+            if bus.publish(frame, timestamp) is None and not warned:
+                warned = True
+                print(f"WARNING: Stream resolution changed to {frame.shape[1]}x{frame.shape[0]}; frames no longer fit the bus. Restart to resize it.")
+    finally:
+        grabber.stop()
+        if bus is not None:
+            bus.close()
+        ready.set()
+
+
+class BusGrabber:
+    def __init__(self, uri, name, slots=8, max_frame_age=1.0, metrics=None, resolve_uri=None):
+        """
+        FrameGrabber replacement that decodes in a separate process and reads frames from a shared
+        memory bus, so decoding gets its own core and GIL. The player gets a private copy of each frame
+        it reads (it draws on and keeps frames); detection, recognition and recording still run in the
+        player's process. Other processes (e.g. the preview, see main()) can attach to the same bus by
+        name and read zero-copy views.
+        :param uri: RTSP Stream URI
+        :param name: Shared memory name of the bus (see bus_name())
+        :param slots: Ring size of the bus
+        :param max_frame_age: Frames older than this (seconds) are discarded as stale
+        :param metrics: Optional StreamMetrics receiving decode/drop/stale counters
+        :param resolve_uri: Optional callable returning a fresh URI; called here (in the parent) when the
+                            capture process keeps failing to reconnect
+        """
+        self.uri = uri
+        self.name = name
+        self.slots = slots
+        self.max_frame_age = max_frame_age
+        self.metrics = metrics
+        self.resolve_uri = resolve_uri
+        self.context = multiprocessing.get_context("spawn")
+        self.stop_event = self.context.Event()
+        self.resolve_conn = None
+        self.resolver = None
+        self.process = None
+        self.reader = None
+        self.frames_stale = 0
+        self.last_published = 0
+
+    def start(self):
+        """
+        Start the capture process and attach to its bus.
+        :return: True once the first frame was published
+        """
+        ready = self.context.Event()
+        child_conn = None
+        if self.resolve_uri:
+            self.resolve_conn, child_conn = self.context.Pipe()
+            self.resolver = threading.Thread(target=self._serve_resolve, daemon=True)
+            self.resolver.start()
+        self.process = self.context.Process(target=_capture_main, args=(self.uri, self.name, self.slots, ready, self.stop_event, child_conn), daemon=True)
+        self.process.start()
+        if not ready.wait(OPEN_TIMEOUT_MS / 1000.0 + 10.0) or not self.process.is_alive():
+            self.stop()
+            return False
+        try:
+            self.reader = FrameReader(self.name)
+        except (FileNotFoundError, ValueError):
+            self.stop()
+            return False
+        print(f"DEBUG: Decoding in process {self.process.pid}, frames on shared memory bus '{self.name}' (watch with: python frame_bus.py {self.name})")
+        if self.metrics:
+            self.metrics.set("stream_up", 1)
+        return True
+
+    def _serve_resolve(self):
+        """
+        Answer the capture process's requests for a fresh URI.
+        """
+        while not self.stop_event.is_set():
+            try:
+                if not self.resolve_conn.poll(0.5):
+                    continue
+                self.resolve_conn.recv()
+                uri = self.resolve_uri()
+                if uri:
+                    self.uri = uri
+                self.resolve_conn.send(uri)
+            except (EOFError, OSError):
+                break
+
+    @property
+    def running(self):
+        return self.reader is not None and not self.reader.closed and self.process.is_alive()
+
+    @property
+    def connected(self):
+        return self.reader is not None and self.reader.status()["connected"]
+
+    def read(self, timeout=1.0):
+        """
+        Return the freshest frame not yet handed out (a private copy: the player draws on and keeps it,
+        and a view would be overwritten after slots-1 newer frames).
+        :return: (ret, frame, timestamp). ret is False on timeout, stale frame or stream end.
+        """
+        if not self.running:
+            return False, None, None
+        skipped = self.reader.frames_skipped
+        frame = self.reader.read(timeout, copy=True)
+        if self.metrics:
+            published = self.reader.latest_seq
+            self.metrics.inc("frames_decoded_total", published - self.last_published)
+            self.last_published = published
+            if self.reader.frames_skipped > skipped:
+                self.metrics.inc("frames_dropped_total", self.reader.frames_skipped - skipped)
+            self.metrics.set("stream_up", 1 if self.connected else 0)
+        if frame is None:
+            return False, None, None
+        if self.max_frame_age and time.time() - frame.timestamp > self.max_frame_age:
+            self.frames_stale += 1
+            if self.metrics:
+                self.metrics.inc("frames_stale_total")
+            return False, None, None
+        return True, frame.image, frame.timestamp
+
+    def peek(self):
+        """
+        Freshest frame without marking it as handed out (for secondary consumers).
+        :return: (frame, timestamp), or (None, None) before the first frame
+        """
+        frame = self.reader.peek(copy=True) if self.reader else None
+        if frame is None:
+            return None, None
+        return frame.image, frame.timestamp
+
+    def stop(self):
+        """
+        Stop the capture process and detach. The process unlinks the bus; if it died, it is unlinked here.
+        """
+        self.stop_event.set()
+        if self.reader:
+            self.reader.close()
+        if self.process:
+            self.process.join(timeout=5.0)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join(timeout=2.0)
+            try:
+                shared_memory.SharedMemory(name=self.name).unlink()
+            except FileNotFoundError:
+                pass
+        if self.resolver:
+            self.resolver.join(timeout=1.0)
+            self.resolve_conn.close()
+        if self.metrics:
+            self.metrics.set("stream_up", 0)
+
+    def get_stats(self):
+        """
+        Snapshot of the capture counters (decoding counters come from the capture process).
+        """
+        status = self.reader.status() if self.reader else {}
+        return {
+            "read": status.get("published", 0),
+            "dropped": self.reader.frames_skipped if self.reader else 0,
+            "stale": self.frames_stale,
+            "reconnects": status.get("reconnects", 0),
+            "outages": status.get("outages", 0),
+            "downtime": status.get("downtime", 0.0),
+            "last_recovery": None,
+        }
+
+
+def main():
+    """
+    Preview a running player's frame bus from another process: a display consumer at its own rate.
+    """
+    parser = argparse.ArgumentParser(description="Watch frames published on a shared memory frame bus")
+    parser.add_argument("name", help="Bus name, printed by the player at startup")
+    parser.add_argument("--fps", type=float, default=15.0, help="Maximum display rate (default: 15)")
+    args = parser.parse_args()
+
+    try:
+        reader = FrameReader(args.name, timeout=5.0)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: Could not attach to bus {args.name}: {e}")
+        sys.exit(1)
+    cv2.namedWindow(args.name, cv2.WINDOW_NORMAL)
+    try:
+        while not reader.closed:
+            t_start = time.time()
+            frame = reader.read(timeout=1.0)
+            if frame is not None:
+                # imshow copies into the window buffer, so the zero-copy view is enough
+                cv2.imshow(args.name, frame.image)
+            if cv2.waitKey(max(1, int((1.0 / args.fps - (time.time() - t_start)) * 1000))) & 0xFF == ord('q'):
+                break
+    except KeyboardInterrupt:
+        pass
+    print(f"Read {reader.frames_read} frames, skipped {reader.frames_skipped}.")
+    frame = None
+    reader.close()
+    cv2.destroyAllWindows()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+import collections
+import random
+import threading
+import time
+
+import cv2
+
+
+# FFmpeg open/read timeouts (ms). socket.setdefaulttimeout() does not reach FFmpeg, so without
+# these a dead RTSP server can block cap.read() forever.
+OPEN_TIMEOUT_MS = 10000
+READ_TIMEOUT_MS = 10000
+
+
+def open_capture(uri, open_timeout_ms=OPEN_TIMEOUT_MS, read_timeout_ms=READ_TIMEOUT_MS):
+    """
+    cv2.VideoCapture on the FFmpeg backend with open/read timeouts where OpenCV supports them (4.5.2+).
+    """
+    if hasattr(cv2, "CAP_PROP_READ_TIMEOUT_MSEC"):
+        params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, open_timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, read_timeout_ms]
+        return cv2.VideoCapture(uri, cv2.CAP_FFMPEG, params)
+    return cv2.VideoCapture(uri, cv2.CAP_FFMPEG)
+
+
+class Backoff:
+    def __init__(self, initial=0.5, maximum=10.0, jitter=0.2):
+        """
+        Capped exponential backoff with jitter for reconnect attempts.
+        :param initial: Delay before the first retry
+        :param maximum: Upper bound of the delay
+        :param jitter: +/- fraction applied to every delay, so cameras behind one NVR do not retry in lockstep
+        """
+        self.initial = initial
+        self.maximum = maximum
+        self.jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self):
+        delay = min(self.maximum, self.initial * (2 ** self.attempts))
+        self.attempts += 1
+        return delay * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class FrameGrabber:
+    def __init__(self, uri, buffer_size=1, max_frame_age=1.0, reconnect_delay=0.5, max_reconnect_delay=10.0, stall_timeout=10.0, resolve_uri=None, resolve_after=3, metrics=None):
+        """
+        Drain an RTSP stream on a dedicated thread into a bounded buffer.
+        The consumer always receives the freshest decoded frame, so a slow
+        processing loop never lets FFmpeg's internal buffer build up lag.
+        A lost stream is reopened in the background with capped exponential backoff; a watchdog
+        abandons a read that has not delivered a frame for stall_timeout seconds.
+        :param uri: RTSP Stream URI
+        :param buffer_size: Number of most recent frames to keep (1 = latest-frame slot)
+        :param max_frame_age: Frames older than this (seconds) are discarded as stale
+        :param reconnect_delay: Seconds before the first reconnect attempt (doubled per failure, with jitter)
+        :param max_reconnect_delay: Cap of the reconnect delay
+        :param stall_timeout: Seconds without a frame after which the stream counts as stalled (0 = no watchdog)
+        :param resolve_uri: Optional callable returning a fresh URI (e.g. ONVIF re-discovery after an NVR reboot)
+        :param resolve_after: Failed reconnect attempts before resolve_uri is called
+        :param metrics: Optional StreamMetrics receiving decode/drop/reconnect/downtime counters
+        """
+        self.uri = uri
+        self.max_frame_age = max_frame_age
+        self.backoff = Backoff(reconnect_delay, max_reconnect_delay)
+        self.stall_timeout = stall_timeout
+        self.resolve_uri = resolve_uri
+        self.resolve_after = resolve_after
+        self.buffer = collections.deque(maxlen=max(1, buffer_size))
+        self.cond = threading.Condition()
+        self.cap = None
+        self.thread = None
+        self.watchdog = None
+        self.running = False
+        self.metrics = metrics
+
+        # A stalled reader cannot be interrupted; it is abandoned and exits once its read returns
+        self.generation = 0
+        self.last_frame_time = 0
+
+        # Sequence numbers let the consumer skip frames it has already seen
+        self.seq = 0
+        self.last_read_seq = 0
+
+        # Counters
+        self.frames_read = 0
+        self.frames_dropped = 0 # Decoded but replaced before the consumer picked them up
+        self.frames_stale = 0 # Picked up too late (older than max_frame_age)
+        self.reconnects = 0
+        self.outages = 0
+        self.down_since = None # Start of the current outage
+        self.downtime = 0.0 # Seconds without a stream, all outages
+        self.last_recovery = None # Seconds the last outage lasted
+
+    def start(self):
+        """
+        Open the stream and start the reader and watchdog threads.
+        :return: True if the stream could be opened
+        """
+        self.cap = open_capture(self.uri)
+        if not self.cap.isOpened():
+            return False
+
+        if self.metrics:
+            self.metrics.set("stream_up", 1)
+        self.running = True
+        self.last_frame_time = time.time()
+        self.thread = threading.Thread(target=self._reader, args=(self.generation, self.cap), daemon=True)
+        self.thread.start()
+        if self.stall_timeout:
+            self.watchdog = threading.Thread(target=self._watch, daemon=True)
+            self.watchdog.start()
+        return True
+
+    def stop(self):
+        """
+        Stop the reader thread and release the stream.
+        """
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=2.0)
+        if self.cap and (self.thread is None or not self.thread.is_alive()):
+            self.cap.release()
+        if self.metrics:
+            self.metrics.set("stream_up", 0)
+
+    @property
+    def connected(self):
+        return self.down_since is None
+
+    def _reader(self, generation, cap):
+        """
+        Reader loop: decode frames as fast as the stream delivers them, reconnect when the stream drops.
+        """
+        while self.running and generation == self.generation:
+            try:
+                ret, frame = cap.read()
+            except Exception as e:
+                print(f"Error reading frame: {e}")
+                ret, frame = False, None
+
+            if generation != self.generation:
+                # The watchdog gave up on this read and started a new reader
+                break
+            if not ret:
+                if not self.running:
+                    break
+                cap.release()
+                cap = self._reconnect(generation)
+                if cap is None:
+                    break
+                continue
+
+            now = time.time()
+            self.last_frame_time = now
+            if self.down_since is not None:
+                self._mark_up(now)
+
+            dropped = 0
+            with self.cond:
+                self.seq += 1
+                self.frames_read += 1
+                # The oldest entry falls out of a full buffer; count it if it was never consumed
+                if len(self.buffer) == self.buffer.maxlen and self.buffer[0][0] > self.last_read_seq:
+                    self.frames_dropped += 1
+                    dropped = 1
+                self.buffer.append((self.seq, now, frame))
+                depth = min(len(self.buffer), self.seq - self.last_read_seq)
+                self.cond.notify_all()
+
+            if self.metrics:
+                self.metrics.inc("frames_decoded_total")
+                if dropped:
+                    self.metrics.inc("frames_dropped_total", dropped)
+                self.metrics.set("capture_queue_depth", depth)
+        if cap is not None:
+            cap.release()
+
+    def _reconnect(self, generation):
+        """
+        Reopen the stream until it works, the grabber is stopped or a newer reader took over.
+        :return: opened capture, or None
+        """
+        self._mark_down()
+        self.backoff.reset()
+        failures = 0
+        while self.running and generation == self.generation:
+            delay = self.backoff.next_delay()
+            print(f"\nError: Lost frame or stream ended. Reconnecting in {delay:.1f}s (attempt {failures + 1})...")
+            with self.cond:
+                # Sleep on the condition so stop() wakes us up
+                self.cond.wait_for(lambda: not self.running, delay)
+            if not self.running or generation != self.generation:
+                return None
+            if self.resolve_uri and failures and failures % self.resolve_after == 0:
+                uri = self.resolve_uri()
+                if uri and uri != self.uri:
+                    print(f"Stream URI changed, reconnecting to {uri}")
+                    self.uri = uri
+            self.reconnects += 1
+            if self.metrics:
+                self.metrics.inc("reconnects_total")
+            cap = open_capture(self.uri)
+            if cap.isOpened():
+                if generation != self.generation:
+                    cap.release()
+                    return None
+                self.cap = cap
+                # The outage ends with the first frame, not with the open
+                self.last_frame_time = time.time()
+                return cap
+            cap.release()
+            failures += 1
+            print("Reconnect failed.")
+        return None
+
+    def _watch(self):
+        """
+        Watchdog: abandon a reader whose read() has not returned a frame for stall_timeout seconds.
+        """
+        while self.running:
+            time.sleep(min(1.0, self.stall_timeout / 4.0))
+            if not self.running or not self.connected:
+                continue
+            stalled = time.time() - self.last_frame_time
+            if stalled < self.stall_timeout:
+                continue
+            print(f"\nWARNING: No frame for {stalled:.1f}s, stream stalled. Reconnecting...")
+            if self.metrics:
+                self.metrics.inc("stalls_total")
+            self.generation += 1
+            generation = self.generation
+            self._mark_down()
+            thread = threading.Thread(target=self._recover, args=(generation,), daemon=True)
+            thread.start()
+            self.thread = thread
+
+    def _recover(self, generation):
+        cap = self._reconnect(generation)
+        if cap is not None:
+            self._reader(generation, cap)
+
+    def _mark_down(self):
+        if self.down_since is not None:
+            return
+        # The outage started with the last frame, not when it was noticed
+        self.down_since = self.last_frame_time or time.time()
+        self.outages += 1
+        if self.metrics:
+            self.metrics.set("stream_up", 0)
+
+    def _mark_up(self, now):
+        down = now - self.down_since
+        self.down_since = None
+        self.downtime += down
+        self.last_recovery = down
+        self.backoff.reset()
+        print(f"Stream restored after {down:.1f}s of downtime.")
+        if self.metrics:
+            self.metrics.set("stream_up", 1)
+            self.metrics.inc("downtime_seconds_total", down)
+            self.metrics.observe("recovery_seconds", down)
+
+    def read(self, timeout=1.0):
+        """
+        Return the freshest frame not yet handed out.
+        :param timeout: Seconds to wait for a new frame
+        :return: (ret, frame, timestamp). ret is False on timeout, stale frame or stream end.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: not self.running or (self.buffer and self.buffer[-1][0] > self.last_read_seq), timeout):
+                return False, None, None
+            if not self.buffer or self.buffer[-1][0] <= self.last_read_seq:
+                return False, None, None
+
+            seq, timestamp, frame = self.buffer[-1]
+            # Everything between the last consumed frame and this one was skipped
+            skipped = sum(1 for s, _, _ in self.buffer if self.last_read_seq < s < seq)
+            self.frames_dropped += skipped
+            self.last_read_seq = seq
+
+        if self.metrics:
+            if skipped:
+                self.metrics.inc("frames_dropped_total", skipped)
+            self.metrics.set("capture_queue_depth", 0)
+
+        if self.max_frame_age and time.time() - timestamp > self.max_frame_age:
+            self.frames_stale += 1
+            if self.metrics:
+                self.metrics.inc("frames_stale_total")
+            return False, None, None
+        return True, frame, timestamp
+
+    def peek(self):
+        """
+        Freshest frame without marking it as handed out (for secondary consumers).
+        :return: (frame, timestamp), or (None, None) before the first frame
+        """
+        with self.cond:
+            if not self.buffer:
+                return None, None
+            _, timestamp, frame = self.buffer[-1]
+        return frame, timestamp
+
+    def get_stats(self):
+        """
+        Snapshot of the capture counters.
+        """
+        with self.cond:
+            return {
+                "read": self.frames_read,
+                "dropped": self.frames_dropped,
+                "stale": self.frames_stale,
+                "reconnects": self.reconnects,
+                "outages": self.outages,
+                "downtime": self.downtime + (time.time() - self.down_since if self.down_since is not None else 0.0),
+                "last_recovery": self.last_recovery,
+            }
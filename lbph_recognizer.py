@@ -0,0 +1,408 @@
+import os
+import json
+import time
+import struct
+
+import cv2
+import numpy as np
+
+# Compact LBPH model: magic, JSON header length (uint32 little endian) and JSON header with the format
+# version (header["version"], LBPH_VERSION; models of any other version are refused). The arrays listed in
+# header["arrays"] (name -> [offset, dtype, shape]) live in the data file header["data"] next to it, each aligned
+# so it can be memory mapped. Every export writes a new data file, so a file that is mapped is never rewritten.
+LBPH_MAGIC = b"LBPHMDL1"
+LBPH_VERSION = 2
+LBPH_EXTENSION = ".lbph"
+ALIGN = 64
+
+# Histogram values scored per chunk: bounds the temporary (rows, dim) float32 arrays to ~16 MB
+CHUNK_VALUES = 4 * 1024 * 1024
+
+# Galleries larger than this are searched person by person with centroid bounds instead of a full scan
+PRUNE_ABOVE = 4000
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def lbp_image(gray, radius=1, neighbors=8):
+    """
+    Extended (circular) local binary patterns, computed like OpenCV's LBPH recognizer
+    (bilinear interpolation of the sampling points, ties count as 1).
+    :param gray: uint8 array (rows, cols), or a stack (n, rows, cols) of equally sized faces
+    :return: int32 array of shape (..., rows - 2 * radius, cols - 2 * radius)
+    """
+    src = np.asarray(gray, dtype=np.float32)
+    rows, cols = src.shape[-2:]
+    center = src[..., radius:rows - radius, radius:cols - radius]
+    dst = np.zeros(center.shape, np.int32)
+    eps = np.finfo(np.float32).eps
+    for n in range(neighbors):
+        x = np.float32(radius * np.cos(2.0 * np.pi * n / neighbors))
+        y = np.float32(-radius * np.sin(2.0 * np.pi * n / neighbors))
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        ty, tx = y - fy, x - fx
+        w1, w2, w3, w4 = (1 - tx) * (1 - ty), tx * (1 - ty), (1 - tx) * ty, tx * ty
+
+        def shifted(dy, dx):
+            return src[..., radius + dy:rows - radius + dy, radius + dx:cols - radius + dx]
+        t = w1 * shifted(fy, fx) + w2 * shifted(fy, cx) + w3 * shifted(cy, fx) + w4 * shifted(cy, cx)
+        dst += (((t > center) | (np.abs(t - center) < eps)).astype(np.int32) << n)
+    return dst
+
+
+def spatial_histogram(lbp, neighbors=8, grid_x=8, grid_y=8):
+    """
+    Concatenated per-cell histograms of an LBP image, each normalized by the cell size (as OpenCV does).
+    :param lbp: LBP image (rows, cols) or stack (n, rows, cols)
+    :return: float32 array (..., grid_x * grid_y * 2**neighbors)
+    """
+    bins = 2 ** neighbors
+    lead = lbp.shape[:-2]
+    count = int(np.prod(lead)) if lead else 1
+    height, width = lbp.shape[-2] // grid_y, lbp.shape[-1] // grid_x
+    cells = lbp[..., :height * grid_y, :width * grid_x].reshape(count, grid_y, height, grid_x, width)
+    cells = cells.transpose(0, 1, 3, 2, 4).reshape(count * grid_y * grid_x, -1)
+    # One bincount over all cells: offset every cell's codes into its own range of bins
+    offsets = (np.arange(count * grid_y * grid_x) * bins)[:, None]
+    hist = np.bincount((cells + offsets).ravel(), minlength=count * grid_y * grid_x * bins).astype(np.float32)
+    return (hist / np.float32(height * width)).reshape(lead + (grid_y * grid_x * bins,))
+
+
+def chi_square(bins, queries, sums=None, columns=None):
+    """
+    OpenCV's HISTCMP_CHISQR_ALT, 2 * sum((h - q)^2 / (h + q)), of every query against every histogram.
+    Rewritten as 2 * (sum(h) - 3 * sum(q) + 4 * sum(q^2 / (h + q))) where the last sum only runs over the
+    query's non-zero bins, a small fraction of all bins for LBP histograms, and is a matrix-vector product
+    over 1 / (h + q). The histograms are stored bin-major, so those bins are contiguous rows of the matrix.
+    :param bins: (D, N) float32/float16 matrix, one column per histogram (may be memory mapped)
+    :param queries: (Q, D) float32
+    :param sums: Optional precomputed (N,) column sums
+    :param columns: Optional indices of the histograms to score (only their values are read)
+    :return: (Q, N) float32 distances, or (Q, len(columns))
+    """
+    queries = np.atleast_2d(queries)
+    if sums is None:
+        sums = np.asarray(bins, dtype=np.float32).sum(axis=0)
+    if columns is not None:
+        sums = sums[columns]
+    n = len(sums)
+    out = np.empty((len(queries), n), np.float32)
+    block = max(1, CHUNK_VALUES // max(1, n))
+    for j, q in enumerate(queries):
+        nz = np.flatnonzero(q)
+        shared = np.zeros(n, np.float32)
+        for i in range(0, len(nz), block):
+            rows = nz[i:i + block]
+            # Fancy indexing copies, so the in-place steps below never touch the (possibly mapped) matrix
+            h = np.asarray(bins[rows] if columns is None else bins[np.ix_(rows, columns)], dtype=np.float32)
+            h += q[rows, None]
+            np.reciprocal(h, out=h)
+            shared += np.square(q[rows]) @ h
+        out[j] = 2.0 * (sums - 3.0 * q.sum(dtype=np.float32) + 4.0 * shared)
+    # Rounding can leave tiny negatives for identical histograms
+    return np.maximum(out, 0.0, out=out)
+
+
+class LBPHIndex:
+    def __init__(self, matrix, labels, centroids, radii, sums):
+        """
+        LBPH histograms as one contiguous bin-major matrix with columns grouped by label, plus per-person centroids.
+        The square root of the chi-square distance is a metric, so sqrt(d(q, centroid)) - radius is a lower
+        bound for sqrt(d(q, h)) of every histogram h of that person; people whose bound cannot beat the
+        current k-th best identity are skipped without being scored. Results are exact.
+        Use build() to create one from unsorted histograms; the arrays here may be memory mapped.
+        :param matrix: (D, N) float32 or float16, one histogram per column, columns sorted by label
+        :param labels: (N,) int32 labels, sorted
+        :param centroids: (D, P) float32 mean histogram per person
+        :param radii: (P,) float32 largest sqrt distance from a person's histograms to its centroid
+        :param sums: (N,) float32 sums of the histograms
+        """
+        self.matrix = matrix
+        self.labels = labels
+        self.centroids = centroids
+        self.radii = radii
+        self.sums = sums
+        self.people, starts = np.unique(np.asarray(labels), return_index=True)
+        self.slices = np.append(starts, len(labels))
+        self.centroid_sums = np.asarray(centroids).sum(axis=0)
+
+    @classmethod
+    def build(cls, histograms, labels, float16=False):
+        """
+        :param histograms: (N, D) histograms in any order, e.g. from cv2's getHistograms()
+        :param labels: (N,) labels
+        :param float16: Store the matrix as float16
+        """
+        histograms = np.asarray(histograms, dtype=np.float32)
+        labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        order = np.argsort(labels, kind="stable")
+        labels = np.ascontiguousarray(labels[order])
+        matrix = np.ascontiguousarray(histograms[order].T, dtype=np.float16 if float16 else np.float32)
+        # Sums, centroids and radii of the stored values, so bounds hold for float16 storage too
+        stored = matrix.astype(np.float32)
+        sums = stored.sum(axis=0)
+        people, starts = np.unique(labels, return_index=True)
+        slices = np.append(starts, len(labels))
+        centroids = np.zeros((matrix.shape[0], len(people)), np.float32)
+        radii = np.zeros(len(people), np.float32)
+        for p in range(len(people)):
+            start, end = slices[p], slices[p + 1]
+            centroids[:, p] = stored[:, start:end].mean(axis=1)
+            radii[p] = np.sqrt(chi_square(stored[:, start:end], centroids[:, p], sums[start:end]).max())
+        return cls(matrix, labels, centroids, radii, sums)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def search(self, queries, k=1, prune=None):
+        """
+        Top-k identities per query histogram.
+        :param queries: (D,) or (Q, D) float32 histograms
+        :param k: Number of identities returned per query
+        :param prune: Use centroid bounds (default: for galleries above PRUNE_ABOVE histograms)
+        :return: list (one per query) of [(label, distance), ...] best first; distance is the
+                 chi-square distance to the person's nearest histogram
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if len(self) == 0:
+            return [[] for _ in queries]
+        k = min(k, len(self.people))
+        if prune is None:
+            prune = len(self) > PRUNE_ABOVE and len(self.people) > k
+        if not prune:
+            # Full scan, then the best histogram of each person (columns are grouped by label)
+            best = np.minimum.reduceat(chi_square(self.matrix, queries, self.sums), self.slices[:-1], axis=1)
+            return [self._top_k(row, k) for row in best]
+
+        bounds = np.sqrt(chi_square(self.centroids, queries, self.centroid_sums)) - self.radii - 1e-3
+        return [self._search_pruned(q, bound, k) for q, bound in zip(queries, bounds)]
+
+    def _search_pruned(self, query, bound, k):
+        """
+        Score the k people with the lowest bounds first; their k-th best distance then rules out everyone
+        whose bound is higher, and only the remaining candidates are scored, in one pass.
+        """
+        order = np.argsort(bound)
+        best = np.full(len(self.people), np.inf, np.float32)
+        best[order[:k]] = self._person_minima(query, order[:k])
+        kth = np.sqrt(best[order[:k]].max())
+        rest = order[k:]
+        candidates = rest[bound[rest] <= kth]
+        if len(candidates) > len(self.people) // 2:
+            # Bounds too loose for this query: a full scan is cheaper than gathering most columns
+            return self._top_k(np.minimum.reduceat(chi_square(self.matrix, query, self.sums)[0], self.slices[:-1]), k)
+        if len(candidates):
+            best[candidates] = self._person_minima(query, candidates)
+        return self._top_k(best, k)
+
+    def _person_minima(self, query, people):
+        """
+        Distance from the query to the nearest histogram of each of the given people.
+        """
+        starts, ends = self.slices[people], self.slices[np.asarray(people) + 1]
+        columns = np.concatenate([np.arange(a, b) for a, b in zip(starts, ends)])
+        distances = chi_square(self.matrix, query, self.sums, columns)[0]
+        return np.minimum.reduceat(distances, np.concatenate(([0], np.cumsum(ends - starts)[:-1])))
+
+    def _top_k(self, distances, k):
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(int(self.people[p]), float(distances[p])) for p in top if np.isfinite(distances[p])]
+
+
+def read_header(path):
+    """
+    Parse the JSON header of a compact LBPH model without touching the histograms.
+    :return: (header dict, offset of the first byte after the header)
+    :raises ValueError: Not a compact LBPH model, or one of another format version
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(LBPH_MAGIC)) != LBPH_MAGIC:
+            raise ValueError(f"{path} is not a compact LBPH model")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length).decode("utf-8"))
+    if header.get("version") != LBPH_VERSION:
+        raise ValueError(f"{path} is a compact LBPH model of format version {header.get('version', 1)}, expected {LBPH_VERSION}; re-create it with trainer.py --export")
+    return header, len(LBPH_MAGIC) + 4 + length
+
+
+def data_path(path, header):
+    return os.path.join(os.path.dirname(path), header["data"])
+
+
+def _replace(tmp, path, attempts=10):
+    # Windows refuses the rename while another process has the header open for a moment
+    for attempt in range(attempts):
+        try:
+            os.replace(tmp, path)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.1)
+
+
+def _remove_stale_data(path, keep):
+    """
+    Delete the data files of older exports, except those in keep.
+    """
+    directory = os.path.dirname(path) or "."
+    prefix = os.path.basename(path) + "."
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(".data") and name not in keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass # Still mapped by a running process (Windows); a later export removes it
+
+
+def export_model(recognizer, path, names, float16=False, face_size=None):
+    """
+    Write a trained cv2 LBPH recognizer (histograms, labels, parameters) and the id -> name mapping
+    as a compact model, with the histograms already grouped by person and the centroid bounds precomputed.
+    The arrays go to a new data file (path.<timestamp>.data) and then the small header file at path is
+    replaced to point at it. Running processes keep their mapping of the previous data file, which is
+    never modified (Windows cannot replace a mapped file), and readers never see half a model.
+    The previous data file is kept for readers that just read the old header; older ones are deleted.
+    :param recognizer: cv2.face.LBPHFaceRecognizer
+    :param names: dict id -> name
+    :param float16: Store the histograms as float16 (half the size; values are multiples of 1/cell size)
+    :param face_size: Side of the normalized faces the model was trained on (see recognizers.prepare_face)
+    """
+    histograms = recognizer.getHistograms()
+    dim = histograms[0].size if len(histograms) else 0
+    index = LBPHIndex.build(np.array([h.reshape(-1) for h in histograms], np.float32).reshape(len(histograms), dim),
+                            recognizer.getLabels(), float16)
+    arrays = {
+        "labels": index.labels,
+        "histograms": index.matrix,
+        "centroids": index.centroids,
+        "radii": index.radii,
+        "sums": index.sums,
+    }
+    data_file = f"{os.path.basename(path)}.{time.time_ns()}.data"
+    header = {
+        "version": LBPH_VERSION,
+        "data": data_file,
+        "radius": recognizer.getRadius(),
+        "neighbors": recognizer.getNeighbors(),
+        "grid_x": recognizer.getGridX(),
+        "grid_y": recognizer.getGridY(),
+        "face_size": face_size,
+        "count": len(index),
+        "dim": dim,
+        "names": {str(k): v for k, v in names.items()},
+        "arrays": {},
+    }
+    with open(data_path(path, header), 'wb') as f:
+        for name, array in arrays.items():
+            offset = _aligned(f.tell())
+            header["arrays"][name] = [offset, array.dtype.name, list(array.shape)]
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+    header_bytes = json.dumps(header).encode("utf-8")
+
+    keep = {data_file}
+    if os.path.exists(path):
+        try:
+            keep.add(read_header(path)[0]["data"])
+        except (ValueError, KeyError):
+            pass
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(LBPH_MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+    _replace(tmp, path)
+    _remove_stale_data(path, keep)
+    return os.path.getsize(path) + os.path.getsize(data_path(path, header))
+
+
+class LBPHRecognizer:
+    def __init__(self):
+        """
+        NumPy LBPH recognizer, a drop-in for cv2's predict() with top-k and batch search on top.
+        Compact models (see export_model()) are memory mapped: loading only parses the header, pages are
+        read on first use, and every process that loads the same data file shares one copy in the page cache.
+        OpenCV YAML models (trainer.yml) are read with cv2 and indexed in memory.
+        """
+        self.radius = 1
+        self.neighbors = 8
+        self.grid_x = 8
+        self.grid_y = 8
+        self.index = LBPHIndex.build(np.zeros((0, 0), np.float32), np.zeros(0, np.int32))
+        self.names = {}
+        self.face_size = None # Face size recorded in a compact model
+
+    def __len__(self):
+        return len(self.index)
+
+    def read(self, path):
+        if not path.endswith(LBPH_EXTENSION):
+            recognizer = cv2.face.LBPHFaceRecognizer_create()
+            recognizer.read(path)
+            self.read_cv2(recognizer)
+            return
+
+        header, _ = read_header(path)
+        self.radius = header["radius"]
+        self.neighbors = header["neighbors"]
+        self.grid_x = header["grid_x"]
+        self.grid_y = header["grid_y"]
+        self.names = {int(k): v for k, v in header["names"].items()}
+        self.face_size = header.get("face_size")
+        if header["count"] == 0:
+            return
+        arrays = {}
+        data_file = data_path(path, header)
+        for name, (offset, dtype, shape) in header["arrays"].items():
+            arrays[name] = np.memmap(data_file, dtype=np.dtype(dtype), mode='r', offset=offset, shape=tuple(shape))
+        self.index = LBPHIndex(arrays["histograms"], arrays["labels"], arrays["centroids"], arrays["radii"], arrays["sums"])
+
+    def read_cv2(self, recognizer):
+        """
+        Index the histograms of a trained cv2 LBPH recognizer.
+        """
+        self.radius = recognizer.getRadius()
+        self.neighbors = recognizer.getNeighbors()
+        self.grid_x = recognizer.getGridX()
+        self.grid_y = recognizer.getGridY()
+        histograms = recognizer.getHistograms()
+        dim = histograms[0].size if len(histograms) else 0
+        matrix = np.array([h.reshape(-1) for h in histograms], np.float32).reshape(len(histograms), dim)
+        self.index = LBPHIndex.build(matrix, recognizer.getLabels())
+
+    def histograms(self, faces):
+        """
+        Spatial LBP histograms of face crops with the model's parameters; equally sized crops
+        (the normal case, see recognizers.prepare_face()) are processed as one stack.
+        :return: (len(faces), D) float32
+        """
+        if len(set(f.shape for f in faces)) == 1:
+            return spatial_histogram(lbp_image(np.stack(faces), self.radius, self.neighbors), self.neighbors, self.grid_x, self.grid_y)
+        return np.stack([spatial_histogram(lbp_image(f, self.radius, self.neighbors), self.neighbors, self.grid_x, self.grid_y) for f in faces])
+
+    def search(self, faces, k=3):
+        """
+        Top-k identities for each face crop.
+        :return: list (one per face) of [(label, distance), ...] best first
+        """
+        if not len(faces):
+            return []
+        return self.index.search(self.histograms(faces), k)
+
+    def predict_batch(self, faces):
+        """
+        Recognize several face crops with one histogram pass and one scan of the gallery.
+        :return: list of (label, distance); label is -1 for an empty model
+        """
+        return [matches[0] if matches else (-1, float("inf")) for matches in self.search(faces, k=1)]
+
+    def predict(self, face):
+        """
+        :return: (label, chi-square distance) of the nearest training histogram, like cv2's LBPH
+        """
+        return self.predict_batch([face])[0]
@@ -4,7 +4,14 @@ import getpass
 import socket
 import datetime
 from onvif_client import OnvifClient
+from onvif_cache import CACHE_DIR
+from onvif_events import EventSubscription
 from stream_player import StreamPlayer
+from detectors import BACKENDS
+from metrics import MetricsRegistry, start_exporters
+from webhook_dispatcher import AlertDispatcher, parse_targets
+from event_recorder import RECORD_MODES, create_recorder
+from zones import load_zones
 
 # Set global timeout to prevent infinite hangs
 socket.setdefaulttimeout(10.0)
@@ -17,13 +24,48 @@ def main():
     parser.add_argument("--user", help="Username")
     parser.add_argument("--password", help="Password")
     parser.add_argument("--channel", type=int, help="NVR Channel Number (1-based index)")
-    parser.add_argument("--webhook-url", help="URL to trigger (GET request) when a face is detected")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help=f"Directory for the ONVIF WSDL cache and the cached profile/stream URI (default: {CACHE_DIR})")
+    parser.add_argument("--no-onvif-cache", action="store_true", help="Always run full ONVIF discovery at startup")
+    parser.add_argument("--webhook-url", action="append", help="URL to trigger (GET request) when a face is detected; prefix with 'post:' to send a JSON POST instead. Repeat for several targets")
+    parser.add_argument("--identity-cooldown", type=float, default=15.0, help="Seconds before the same person is announced again (default: 15)")
+    parser.add_argument("--camera-cooldown", type=float, default=0.0, help="Minimum seconds between any two alerts from this camera (default: 0, off)")
     parser.add_argument("--train", help="Enable Training Mode and specify the name of the person to capture")
+    parser.add_argument("--auto-capture", type=int, default=0, metavar="N", help="Training Mode: collect N images automatically (sharp, well exposed, frontal, no near-duplicates), then exit (default: 0 = press 'c')")
     parser.add_argument("--person", help="Name of the person to recognize (Detect Mode)")
-    parser.add_argument("--trainer", default="trainer.yml", help="Path to trainer.yml file (default: trainer.yml)")
+    parser.add_argument("--trainer", default="trainer.yml", help="Path to trainer.yml (LBPH), a compact .lbph model (see trainer.py --export) or gallery .npz (embedding) file (default: trainer.yml)")
+    parser.add_argument("--no-model-reload", action="store_true", help="Do not pick up a retrained model/names.json while running (default: reload in the background)")
+    parser.add_argument("--capture-mode", choices=["latest", "process", "direct"], default="latest", help="'latest' reads the stream on a background thread and always processes the freshest frame; 'process' decodes in a separate process and shares frames through shared memory (decoding only: the remux recorder and the --dual-stream main stream still open their own connections); 'direct' reads inline (default: latest)")
+    parser.add_argument("--headless", action="store_true", help="Run without a window: no drawing/display, stop with Ctrl+C/SIGTERM, SIGUSR1 saves an annotated snapshot")
+    parser.add_argument("--snapshot-dir", default="snapshots", help="Directory for annotated snapshots in headless mode (default: snapshots)")
+    parser.add_argument("--motion-gate", action="store_true", help="Only run face detection while the scene is changing (cheap frame differencing)")
+    parser.add_argument("--motion-interval", type=int, default=5, help="With --motion-gate, detect every Nth frame while motion lasts (default: 5)")
+    parser.add_argument("--dual-stream", action="store_true", help="Decode the low resolution sub-stream for detection and open the main stream only for face crops and snapshots")
+    parser.add_argument("--event-gate", action="store_true", help="Only run face detection while the camera itself reports motion/person events (ONVIF PullPoint subscription)")
+    parser.add_argument("--event-hold", type=float, default=3.0, help="With --event-gate, seconds detection stays armed after the camera's event ends (default: 3)")
+    parser.add_argument("--adaptive", action="store_true", help="Pick detection cadence and downscale factor from measured fps and stage timings")
+    parser.add_argument("--cpu-budget", type=float, default=0.5, help="With --adaptive, fraction of one core detection/recognition may use (default: 0.5)")
+    parser.add_argument("--latency-budget", type=float, default=1.0, help="With --adaptive, max seconds before a new face reaches the detector (default: 1.0)")
+    parser.add_argument("--detector", choices=BACKENDS, default="haar", help="Face detector backend (default: haar). 'dnn' and 'yunet' need model files in --model-dir")
+    parser.add_argument("--model-dir", default="models", help="Directory containing the DNN/YuNet detector and SFace embedding models (default: models)")
+    parser.add_argument("--zone", action="append", metavar="SPEC", help="Only detect faces inside this region: [name:]x0,y0,x1,y1 (rectangle) or [name:]x,y;x,y;x,y... (polygon), fractions of the frame (<= 1) or pixels, optional @min-max face size in px. Repeat for several zones")
+    parser.add_argument("--zones-file", help="JSON file with detection zones per camera ('main' or 'ch<N>'), see zones.py")
+    parser.add_argument("--max-frame-age", type=float, default=1.0, help="Discard frames older than this many seconds in 'latest' mode (default: 1.0)")
+    parser.add_argument("--record-dir", help="Save a clip and a snapshot of every alert to this directory")
+    parser.add_argument("--record-mode", choices=RECORD_MODES, default="auto", help="'remux' copies the compressed stream with ffmpeg (almost no CPU), 'frames' re-encodes decoded frames, 'auto' uses remux when ffmpeg is installed (default: auto)")
+    parser.add_argument("--pre-event", type=float, default=5.0, help="Seconds recorded before an alert (default: 5)")
+    parser.add_argument("--post-event", type=float, default=10.0, help="Seconds recorded after an alert (default: 10)")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default: off)")
+    parser.add_argument("--metrics-file", help="Periodically write a JSON metrics snapshot to this file")
+    parser.add_argument("--metrics-interval", type=float, default=30.0, help="Seconds between JSON metrics snapshots (default: 30)")
 
     args = parser.parse_args()
 
+    camera = f"ch{args.channel}" if args.channel else "main"
+    try:
+        zones = load_zones(camera, args.zone, args.zones_file)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        parser.error(f"Invalid detection zones: {e}")
+
     # Force OpenCV to use TCP for RTSP (Fixes corruption/drop issues)
     import os
     os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp"
@@ -40,59 +82,97 @@ def main():
     password = args.password if args.password else getpass.getpass("Password: ")
 
     print(f"\nInitializing ONVIF Client for {ip}:{port}...")
-    client = OnvifClient(ip, port, user, password)
+    client = OnvifClient(ip, port, user, password, cache_dir=None if args.no_onvif_cache else args.cache_dir)
 
     try:
-        client.connect()
-    except Exception as e:
-        print(f"FATAL: Could not connect to camera: {e}")
-        sys.exit(1)
-
-    try:
-        if args.channel:
-            print(f"Selecting profile for Channel {args.channel}...")
-            # Convert 1-based channel to 0-based index
-            selected_token = client.get_profile_token_by_channel(args.channel - 1)
-            print(f"Selected Token for Channel {args.channel}: {selected_token}")
-        else:
-            print("Retrieving media profiles...")
-            profiles = client.get_media_profiles()
-            if not profiles:
-                print("No media profiles found on device.")
-                sys.exit(1)
-            
-            # Select the first profile for now (Requirement FR-2)
-            # Often connection quality is better on sub streams for testing, but requirement says "first available or main"
-            # Usually the first one is main.
-            selected_profile = profiles[0]
-            print(f"Selected Profile:: Name: {selected_profile.Name}, Token: {selected_profile.token}")
-            selected_token = selected_profile.token
-
-        print("Requesting Stream URI...")
-        uri = client.get_stream_uri(selected_token)
+        # A cached URI skips the ONVIF handshake entirely; it is re-checked in the background
+        uri = client.resolve_stream_uri(args.channel)
         print(f"Stream URI retrieved: {uri}")
-        
     except Exception as e:
         print(f"FATAL: Error during ONVIF setup: {e}")
         sys.exit(1)
 
+    # Dual-stream: detect on the sub-stream, crop faces from the main stream
+    stream = "main"
+    detect_uri = uri
+    if args.dual_stream:
+        try:
+            detect_uri = client.resolve_stream_uri(args.channel, stream="sub")
+            stream = "sub"
+            print(f"Sub-stream URI retrieved: {detect_uri}")
+        except Exception as e:
+            print(f"WARNING: No sub-stream available ({e}); running on the main stream only.")
+
     print("\nStarting Video Stream...")
-    print("Press 'q' in the video window to exit.")
+    if args.headless:
+        print("Headless mode: send SIGINT/SIGTERM to exit, SIGUSR1 for an annotated snapshot.")
+    else:
+        print("Press 'q' in the video window to exit.")
+    dispatcher = None
     if args.webhook_url:
-        print(f"Face Detection Webhook Enabled: {args.webhook_url}")
+        targets = parse_targets(args.webhook_url)
+        print(f"Face Detection Webhook Enabled: {', '.join(str(t) for t in targets)}")
+        dispatcher = AlertDispatcher(targets, identity_cooldown=args.identity_cooldown, camera_cooldown=args.camera_cooldown)
     
     mode = "train" if args.train else "detect"
     person_to_use = args.train if args.train else args.person
     
     # If explicit training mode, output to dataset folder
     
+    recorder = None
+    if args.record_dir and mode == "detect":
+        try:
+            recorder = create_recorder(uri, args.record_dir, args.pre_event, args.post_event, camera, args.record_mode)
+        except FileNotFoundError as e:
+            print(f"FATAL: {e}")
+            sys.exit(1)
+        if not recorder.start():
+            print("WARNING: Event recording could not be started.")
+            recorder = None
+
+    events = None
+    event_gate = None
+    if args.event_gate and mode == "detect":
+        sources = None
+        if args.channel:
+            try:
+                sources = client.get_event_sources(args.channel)
+            except Exception as e:
+                print(f"WARNING: Could not map channel {args.channel} to its event sources ({e}); any camera event arms detection.")
+        events = EventSubscription(client, hold_time=args.event_hold).start()
+        event_gate = events.gate(sources)
+        print("Event gate enabled: face detection runs while the camera reports motion.")
+
+    registry = MetricsRegistry()
+    exporters = start_exporters(registry, args.metrics_port, args.metrics_file, args.metrics_interval)
+
     player = StreamPlayer(
-        uri, 
-        webhook_url=args.webhook_url, 
+        detect_uri, 
+        dispatcher=dispatcher,
         mode=mode,
         train_output_dir="dataset" if mode == "train" else None,
         trainer_file=args.trainer,
-        person_name=person_to_use if person_to_use else "Person"
+        person_name=person_to_use if person_to_use else "Person",
+        capture_mode=args.capture_mode,
+        max_frame_age=args.max_frame_age,
+        headless=args.headless,
+        snapshot_dir=args.snapshot_dir,
+        motion_gate=args.motion_gate,
+        motion_detect_interval=args.motion_interval,
+        adaptive=args.adaptive,
+        cpu_budget=args.cpu_budget,
+        latency_budget=args.latency_budget,
+        detector=args.detector,
+        model_dir=args.model_dir,
+        metrics=registry.stream(camera),
+        camera=camera,
+        recorder=recorder,
+        resolve_uri=lambda: client.refresh_stream_uri(args.channel, stream),
+        event_gate=event_gate,
+        detail_uri=uri if stream == "sub" else None,
+        auto_capture=args.auto_capture,
+        model_reload=not args.no_model_reload,
+        zones=zones
     )
     try:
         # Run blocking loop in main thread
@@ -101,6 +181,14 @@ def main():
         print("\nStopping...")
     finally:
         player.stop()
+        if dispatcher:
+            dispatcher.stop()
+        if recorder:
+            recorder.stop()
+        if events:
+            events.stop()
+        for exporter in exporters:
+            exporter.stop()
         print("Exiting application.")
 
 if __name__ == "__main__":
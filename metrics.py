@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds (Prometheus histogram 'le' bounds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+PREFIX = "onvif_"
+
+# name -> (type, help). Every metric a stream reports is listed here.
+METRICS = {
+    "frames_decoded_total": ("counter", "Frames decoded from the stream"),
+    "frames_dropped_total": ("counter", "Decoded frames replaced before processing"),
+    "frames_stale_total": ("counter", "Frames discarded because they were too old when picked up"),
+    "frames_processed_total": ("counter", "Frames run through the detection loop"),
+    "detections_total": ("counter", "Face detection passes"),
+    "faces_detected_total": ("counter", "Faces found by the detector"),
+    "predictions_total": ("counter", "Recognizer predictions"),
+    "reconnects_total": ("counter", "Stream reconnect attempts"),
+    "stalls_total": ("counter", "Reads abandoned by the watchdog because no frame arrived"),
+    "downtime_seconds_total": ("counter", "Seconds the stream was down (lost until the first frame after reconnecting)"),
+    "alerts_total": ("counter", "Verified recognitions that passed the cooldowns and triggered an alert"),
+    "webhooks_sent_total": ("counter", "Webhook calls that succeeded"),
+    "webhook_failures_total": ("counter", "Webhook calls that failed after all retries"),
+    "webhook_retries_total": ("counter", "Webhook calls retried after a failure"),
+    "webhook_dropped_total": ("counter", "Alerts dropped because the webhook queue was full"),
+    "model_reloads_total": ("counter", "Recognition models swapped in after the model files changed"),
+    "decode_fps": ("gauge", "Frames decoded per second"),
+    "process_fps": ("gauge", "Frames processed per second"),
+    "capture_queue_depth": ("gauge", "Decoded frames waiting for the processing loop"),
+    "analysis_queue_depth": ("gauge", "Frames submitted to the worker pool and not yet analyzed"),
+    "webhook_queue_depth": ("gauge", "Alerts queued or being delivered"),
+    "stream_up": ("gauge", "1 while the stream is being read"),
+    "detect_seconds": ("histogram", "Face detection latency"),
+    "predict_seconds": ("histogram", "Recognizer predict latency"),
+    "frame_seconds": ("histogram", "Processing time of one frame"),
+    "analysis_seconds": ("histogram", "Time from submitting a frame to the worker pool to its result"),
+    "webhook_seconds": ("histogram", "Webhook request latency (per attempt)"),
+    "recovery_seconds": ("histogram", "Duration of stream outages, from loss to the first frame after reconnecting"),
+}
+
+# Histograms that do not measure per-frame latencies
+HISTOGRAM_BUCKETS = {
+    "recovery_seconds": (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0),
+}
+
+# Counters whose per-second rate is published as a gauge
+RATE_GAUGES = {
+    "frames_decoded_total": "decode_fps",
+    "frames_processed_total": "process_fps",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        Fixed-bucket histogram (cumulative on export, like Prometheus).
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """
+        Estimate a quantile by linear interpolation inside the bucket (like histogram_quantile()).
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+
+class StreamMetrics:
+    def __init__(self, stream):
+        """
+        Counters, gauges and latency histograms of one stream. Thread-safe.
+        :param stream: Label value identifying the stream (e.g. 'ch3')
+        """
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.rate_windows = {} # counter -> (window start, count in window)
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            gauge = RATE_GAUGES.get(name)
+            if gauge:
+                now = time.time()
+                start, count = self.rate_windows.get(name, (now, 0))
+                count += value
+                if now - start >= 1.0:
+                    self.gauges[gauge] = count / (now - start)
+                    start, count = now, 0
+                self.rate_windows[name] = (start, count)
+
+    def set(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def add(self, name, delta):
+        with self.lock:
+            self.gauges[name] = self.gauges.get(name, 0) + delta
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(HISTOGRAM_BUCKETS.get(name, LATENCY_BUCKETS))
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """
+        Plain dict of the current values; histograms are summarized as count/sum/p50/p90/p99 (ms).
+        """
+        with self.lock:
+            histograms = {}
+            for name, h in self.histograms.items():
+                summary = {"count": h.count, "sum": round(h.sum, 6)}
+                for label, q in (("p50_ms", 0.5), ("p90_ms", 0.9), ("p99_ms", 0.99)):
+                    value = h.quantile(q)
+                    summary[label] = round(value * 1000.0, 3) if value is not None else None
+                histograms[name] = summary
+            return {"counters": dict(self.counters), "gauges": dict(self.gauges), "histograms": histograms}
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        All streams of one process.
+        """
+        self.lock = threading.Lock()
+        self.streams = {}
+
+    def stream(self, name):
+        """
+        Metrics of a stream, created on first use.
+        """
+        with self.lock:
+            if name not in self.streams:
+                self.streams[name] = StreamMetrics(name)
+            return self.streams[name]
+
+    def snapshot(self):
+        with self.lock:
+            streams = list(self.streams.values())
+        return {"time": time.time(), "streams": {s.stream: s.snapshot() for s in streams}}
+
+    def render_prometheus(self):
+        """
+        Prometheus text exposition format (version 0.0.4), one label set per stream.
+        """
+        with self.lock:
+            streams = list(self.streams.values())
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            samples = []
+            for s in streams:
+                label = 'stream="%s"' % s.stream.replace('\\', '\\\\').replace('"', '\\"')
+                with s.lock:
+                    if kind == "counter" and name in s.counters:
+                        samples.append(f"{PREFIX}{name}{{{label}}} {s.counters[name]}")
+                    elif kind == "gauge" and name in s.gauges:
+                        samples.append(f"{PREFIX}{name}{{{label}}} {s.gauges[name]}")
+                    elif kind == "histogram" and name in s.histograms:
+                        h = s.histograms[name]
+                        cumulative = 0
+                        for bound, count in zip(h.buckets, h.counts):
+                            cumulative += count
+                            samples.append(f'{PREFIX}{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                        samples.append(f'{PREFIX}{name}_bucket{{{label},le="+Inf"}} {h.count}')
+                        samples.append(f"{PREFIX}{name}_sum{{{label}}} {h.sum}")
+                        samples.append(f"{PREFIX}{name}_count{{{label}}} {h.count}")
+            if samples:
+                lines.append(f"# HELP {PREFIX}{name} {help_text}")
+                lines.append(f"# TYPE {PREFIX}{name} {kind}")
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, registry, port=9108, host="127.0.0.1"):
+        """
+        Serve /metrics (Prometheus text) and /metrics.json on a background thread.
+        :param registry: MetricsRegistry to expose
+        :param port: TCP port (0 picks a free one, see self.port after start())
+        :param host: Bind address (local only by default)
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/metrics":
+                    body = registry.render_prometheus().encode()
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/metrics.json":
+                    body = json.dumps(registry.snapshot()).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Keep scrapes out of the console
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"Metrics endpoint: http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class JsonSnapshotWriter:
+    def __init__(self, registry, path, interval=30.0):
+        """
+        Periodically write registry.snapshot() to a JSON file (replaced atomically).
+        """
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        self.write()
+
+    def _loop(self):
+        while not self.stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.registry.snapshot(), f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"WARNING: Could not write metrics to {self.path}: {e}")
+
+
+def start_exporters(registry, port=0, json_file=None, interval=30.0, host="127.0.0.1"):
+    """
+    Start the HTTP endpoint and/or the JSON snapshot writer requested on the command line.
+    :return: list of started exporters (call stop() on each at exit)
+    """
+    exporters = []
+    if port:
+        server = MetricsServer(registry, port, host)
+        server.start()
+        exporters.append(server)
+    if json_file:
+        writer = JsonSnapshotWriter(registry, json_file, interval)
+        writer.start()
+        exporters.append(writer)
+    return exporters
@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from recognizers import FACE_SIZE, load_model_names, load_recognizer
+
+
+class ModelWatcher:
+    def __init__(self, trainer_file, map_file="names.json", model_dir="models", interval=2.0, settle=1.0, load_model=True, on_reload=None, verbose=True):
+        """
+        Watch the model artifacts and load a changed model on a background thread.
+        The caller picks the result up with take() between frames, so the swap is atomic from its point of view.
+        :param trainer_file: Path to the trained model (trainer.yml, .lbph or .npz)
+        :param map_file: Path to the ID -> Name mapping (names.json)
+        :param model_dir: Directory containing the embedding model (embedding galleries only)
+        :param interval: Seconds between two checks of the files
+        :param settle: Seconds the files must stay unchanged before loading (trainer.py writes the model and the
+                       names one after the other, and OpenCV writes trainer.yml in place)
+        :param load_model: Reload the recognizer as well; False only follows the names
+        :param on_reload: Optional callback(recognizer, threshold, names), called on the watcher thread instead of
+                          keeping the update for take()
+        :param verbose: Print a line for every reload (failures are always reported)
+        """
+        self.trainer_file = trainer_file
+        self.map_file = map_file
+        self.model_dir = model_dir
+        self.interval = interval
+        self.settle = settle
+        self.load_model = load_model
+        self.on_reload = on_reload
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.pending = None # (recognizer, threshold, names) not yet taken
+        self.reloads = 0
+        self.failures = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.loaded = self._signature()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.interval + self.settle + 1.0)
+
+    def take(self):
+        """
+        :return: (recognizer, threshold, names) of a newly loaded model, or None if nothing changed.
+                 recognizer and threshold are None when load_model is False.
+        """
+        if self.pending is None:
+            return None
+        with self.lock:
+            update, self.pending = self.pending, None
+        return update
+
+    def _signature(self):
+        signature = []
+        for path in (self.trainer_file, self.map_file):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _loop(self):
+        failed = None
+        while not self.stop_event.wait(self.interval):
+            signature = self._signature()
+            if signature == self.loaded or signature == failed or signature[0] is None:
+                continue
+            # Wait for the writer to finish; a file that is still changing is picked up by a later check
+            if self.stop_event.wait(self.settle) or self._signature() != signature:
+                continue
+            try:
+                update = self._load()
+            except Exception as e:
+                self.failures += 1
+                failed = signature
+                print(f"WARNING: Could not reload the face recognition model from {self.trainer_file} ({str(e).strip()}); keeping the current one.")
+                continue
+            if self.on_reload:
+                self.on_reload(*update)
+            else:
+                with self.lock:
+                    self.pending = update
+            self.loaded = signature
+            self.reloads += 1
+
+    def _load(self):
+        t_start = time.time()
+        recognizer, threshold = None, None
+        if self.load_model:
+            recognizer, threshold = load_recognizer(self.trainer_file, self.model_dir)
+            # Fail here rather than in the frame loop (e.g. a truncated model that loads but cannot predict)
+            recognizer.predict(np.zeros((FACE_SIZE, FACE_SIZE), dtype=np.uint8))
+        names = load_model_names(self.trainer_file, self.map_file)
+        if self.verbose:
+            what = "model" if self.load_model else "names"
+            print(f"Reloaded face recognition {what} from {self.trainer_file} in {time.time() - t_start:.2f}s ({len(names)} names: {list(names.values())})")
+        return recognizer, threshold, names
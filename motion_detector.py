@@ -0,0 +1,58 @@
+import time
+
+import cv2
+
+
+class MotionDetector:
+    def __init__(self, width=160, threshold=25, min_area=0.002, learning_rate=0.05, hold_time=2.0):
+        """
+        Cheap scene-change detector used to gate face detection.
+        Works on a tiny blurred gray copy of the frame against a running-average background.
+        :param width: Width (px) the frame is downscaled to before differencing
+        :param threshold: Per-pixel intensity difference that counts as change
+        :param min_area: Fraction of changed pixels that counts as motion
+        :param learning_rate: Background adaptation rate (cv2.accumulateWeighted alpha)
+        :param hold_time: Seconds motion stays active after the last changed frame
+        """
+        self.width = width
+        self.threshold = threshold
+        self.min_area = min_area
+        self.learning_rate = learning_rate
+        self.hold_time = hold_time
+        self.background = None
+        self.last_motion_time = float("-inf")
+        self.motion_ratio = 0.0 # Fraction of changed pixels in the last frame
+
+    def update(self, frame, timestamp=None):
+        """
+        Feed a BGR frame.
+        :param timestamp: Time of the frame (default: now; replays pass the media time)
+        :return: True while motion is active (including the hold period)
+        """
+        h, w = frame.shape[:2]
+        height = max(1, int(h * self.width / w))
+        tiny = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(tiny, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+        if self.background is None:
+            self.background = gray.astype("float32")
+            return False
+
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        _, mask = cv2.threshold(diff, self.threshold, 255, cv2.THRESH_BINARY)
+        self.motion_ratio = cv2.countNonZero(mask) / float(mask.size)
+        cv2.accumulateWeighted(gray, self.background, self.learning_rate)
+
+        now = timestamp if timestamp is not None else time.time()
+        if self.motion_ratio >= self.min_area:
+            self.last_motion_time = now
+        return now - self.last_motion_time < self.hold_time
+
+    def reset(self):
+        """
+        Forget the background model (e.g. after a reconnect).
+        """
+        self.background = None
+        self.last_motion_time = float("-inf")
+        self.motion_ratio = 0.0
@@ -0,0 +1,82 @@
+import os
+import json
+import time
+import threading
+
+# Default location of the persisted device cache and the zeep WSDL cache
+CACHE_DIR = ".onvif_cache"
+
+
+class DeviceCache:
+    def __init__(self, path):
+        """
+        Persisted per-device ONVIF discovery results, so a restart can go straight to RTSP:
+        the auth mode that worked and, per channel, the profile token and stream URI.
+        Layout: {"<ip>:<port>": {"encrypt": bool, "channels": {"<channel>": {"token": str, "uri": str}}, "updated": epoch}}
+        Channel keys are 1-based channel numbers, or "default" for the first profile.
+        :param path: JSON file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.devices = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.devices = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"WARNING: Ignoring unreadable ONVIF cache {path}: {e}")
+
+    def get(self, device):
+        """
+        :return: Copy of the device entry ({} if unknown)
+        """
+        with self.lock:
+            return json.loads(json.dumps(self.devices.get(device, {})))
+
+    def set_encrypt(self, device, encrypt):
+        with self.lock:
+            entry = self.devices.setdefault(device, {})
+            if entry.get("encrypt") == encrypt:
+                return
+            entry["encrypt"] = encrypt
+            self._save()
+
+    def set_channel(self, device, channel, token, uri):
+        """
+        Store a resolved channel. Writes the file only if something changed.
+        """
+        with self.lock:
+            entry = self.devices.setdefault(device, {})
+            channels = entry.setdefault("channels", {})
+            value = {"token": token, "uri": uri}
+            if channels.get(str(channel)) == value:
+                return
+            channels[str(channel)] = value
+            entry["updated"] = time.time()
+            self._save()
+
+    def invalidate(self, device, channel=None):
+        """
+        Forget one channel (or the whole device) after a cached URI stopped working.
+        """
+        with self.lock:
+            entry = self.devices.get(device)
+            if not entry:
+                return
+            if channel is None:
+                del self.devices[device]
+            else:
+                entry.get("channels", {}).pop(str(channel), None)
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(self.devices, f, indent=2)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"WARNING: Could not write ONVIF cache {self.path}: {e}")
@@ -1,9 +1,39 @@
 import os
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from onvif import ONVIFCamera
 import onvif
+from lxml import etree
+
+from onvif_cache import CACHE_DIR, DeviceCache
+
+# Parallel GetStreamUri requests when resolving many channels
+URI_WORKERS = 8
+
+# Seconds a first WS-Security connection attempt runs before Digest/Basic is tried alongside it
+ENCRYPT_HEAD_START = 2.0
+
+# onvif-zeep looks up the PullPoint service address under this key
+PULLPOINT_NS = 'http://www.onvif.org/ver10/events/wsdl/PullPointSubscription'
+# Renew/Unsubscribe live on the WS-BaseNotification subscription manager of the same address
+SUBSCRIPTION_MANAGER_BINDING = '{http://www.onvif.org/ver10/events/wsdl}SubscriptionManagerBinding'
+# WS-BaseNotification namespace of PullMessages notifications
+WSNT_NS = 'http://docs.oasis-open.org/wsn/b-2'
+
+# Cached remote schemas (xml.xsd, soap envelope, ...) are valid for 30 days
+WSDL_CACHE_TIMEOUT = 30 * 24 * 3600
+
+def _cache_key(channel, stream="main"):
+    """
+    Device cache key of a channel's stream: '3', 'default', '3/sub', ...
+    """
+    key = str(channel or "default")
+    return key + "/sub" if stream == "sub" else key
+
 
 class OnvifClient:
-    def __init__(self, ip, port, user, password, wsdl_dir=None):
+    def __init__(self, ip, port, user, password, wsdl_dir=None, cache_dir=CACHE_DIR):
         """
         Initialize the ONVIF client.
         :param ip: IP address of the camera
@@ -11,6 +41,7 @@ class OnvifClient:
         :param user: Username
         :param password: Password
         :param wsdl_dir: Directory containing WSDL files (optional, uses package default if None)
+        :param cache_dir: Directory for the WSDL cache and the persisted device cache (None disables both)
         """
         self.ip = ip
         self.port = port
@@ -46,6 +77,13 @@ class OnvifClient:
                 print(f"WARNING: Could not find 'wsdl' directory containing 'devicemgmt.wsdl'. Defaulting to {self.wsdl_dir}")
         self.camera = None
         self.media_service = None
+        self.channel_index = None
+        self.source_configs = {} # Video source token -> video source configuration tokens (event sources)
+        self.profile_sizes = {} # Profile token -> encoder (width, height) or None, in GetProfiles order
+        self.cache_dir = cache_dir
+        self.device_key = f"{ip}:{port}"
+        self.cache = DeviceCache(os.path.join(cache_dir, "devices.json")) if cache_dir else None
+        self.lock = threading.RLock() # zeep clients are shared with the background revalidation
 
     def connect(self):
         """
@@ -53,35 +91,109 @@ class OnvifClient:
         """
         print(f"Connecting to ONVIF Camera at {self.ip}:{self.port}...")
         
+        transport = self._create_transport()
+
         # Helper to attempt connection
         def _attempt_connect(encrypt):
             print(f"DEBUG: Attempting connection with encrypt={encrypt}")
             camera = ONVIFCamera(
                 self.ip, self.port, self.user, self.password, self.wsdl_dir,
-                encrypt=encrypt, no_cache=True
+                encrypt=encrypt, no_cache=transport is None, transport=transport
             )
             # Force a simple call to verify connection works (GetDeviceInformation or services)
             # The constructor usually initializes devicemgmt, but let's be sure
             return camera
 
+        # Try the auth mode that worked last time first, so a restart needs a single attempt
+        cached = self.cache.get(self.device_key).get("encrypt") if self.cache else None
+
         try:
-            # First attempt: Stanard WS-Security (encrypt=True)
-            try:
-                self.camera = _attempt_connect(encrypt=True)
-            except Exception as e:
-                print(f"DEBUG: Connection with encrypt=True failed: {e}")
-                print("DEBUG: Retrying with encrypt=False (Digest/Basic)...")
-                # Second attempt: Disable WS-Security (encrypt=False) - often required for some NVRs/Cameras
-                self.camera = _attempt_connect(encrypt=False)
+            confirmed = True
+            if cached is None:
+                # Unknown device: WS-Security first, Digest/Basic without waiting for a slow WS-Security timeout
+                self.camera, encrypt, confirmed = self._connect_racing(_attempt_connect)
+            else:
+                try:
+                    self.camera = _attempt_connect(encrypt=cached)
+                    encrypt = cached
+                except Exception as e:
+                    print(f"DEBUG: Connection with encrypt={cached} failed: {e}")
+                    print(f"DEBUG: Retrying with encrypt={not cached}...")
+                    self.camera = _attempt_connect(encrypt=not cached)
+                    encrypt = not cached
+            if self.cache and confirmed:
+                self.cache.set_encrypt(self.device_key, encrypt)
             
             # Create the media service
             self.media_service = self.camera.create_media_service()
+            self.channel_index = None
             print("Successfully connected to Media Service.")
         except Exception as e:
             print(f"Failed to connect to ONVIF Camera: {e}")
             print("HINT: Unknown Fault often means Time Synchronization issue. Check if PC time matches Camera time.")
             raise
 
+    def ensure_connected(self):
+        """
+        Connect unless already connected (the stream URI may have come from the cache).
+        """
+        with self.lock:
+            if not self.media_service:
+                self.connect()
+
+    def _connect_racing(self, attempt, head_start=ENCRYPT_HEAD_START):
+        """
+        Try WS-Security (encrypt=True) first. Digest/Basic (encrypt=False, often required for some
+        NVRs/Cameras) is only tried once WS-Security failed or has not answered within head_start seconds,
+        and a successful WS-Security connection is preferred whenever both have completed.
+        :param attempt: Callable(encrypt) returning an ONVIFCamera
+        :param head_start: Seconds WS-Security runs alone
+        :return: (camera, encrypt, confirmed). confirmed is False when encrypt=False was used only because
+                 WS-Security had not answered yet; that choice should not be cached.
+        """
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            secure = executor.submit(attempt, True)
+            done, _ = wait([secure], timeout=head_start)
+            if done and secure.exception() is None:
+                return secure.result(), True, True
+            if done:
+                print(f"DEBUG: Connection with encrypt=True failed: {secure.exception()}")
+                pending = set()
+            else:
+                print(f"DEBUG: No answer with encrypt=True after {head_start}s, also trying encrypt=False")
+                pending = {secure}
+            plain = executor.submit(attempt, False)
+            pending.add(plain)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                if secure in done and secure.exception() is None:
+                    return secure.result(), True, True
+                if plain in done and plain.exception() is None:
+                    return plain.result(), False, secure.done()
+                for future in done:
+                    print(f"DEBUG: Connection with encrypt={future is secure} failed: {future.exception()}")
+            raise secure.exception()
+        finally:
+            # A WS-Security attempt that is still pending finishes in the background
+            executor.shutdown(wait=False)
+
+    def _create_transport(self):
+        """
+        zeep transport with a persistent SQLite cache for the remote schemas the WSDLs import.
+        :return: Transport, or None to use zeep's defaults without caching
+        """
+        if not self.cache_dir:
+            return None
+        try:
+            from zeep.cache import SqliteCache
+            from zeep.transports import Transport
+        except ImportError:
+            return None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        cache = SqliteCache(path=os.path.join(self.cache_dir, "zeep.db"), timeout=WSDL_CACHE_TIMEOUT)
+        return Transport(cache=cache, timeout=10, operation_timeout=10)
+
     def get_media_profiles(self):
         """
         Retrieve all available media profiles.
@@ -113,28 +225,150 @@ class OnvifClient:
             print(f"Error retrieving video sources: {e}")
             raise
 
+    def get_channel_index(self, refresh=False):
+        """
+        Map every video source (channel) to the media profiles bound to it, from a single
+        GetVideoSources and a single GetProfiles call. The result is kept until refresh=True.
+        :return: list of (source_token, [profile tokens]); index 0 is channel 1
+        """
+        if self.channel_index is not None and not refresh:
+            return self.channel_index
+        sources = self.get_video_sources()
+        profiles = self.get_media_profiles()
+
+        by_source = {}
+        self.profile_sizes = {}
+        for p in profiles:
+            encoder = p.VideoEncoderConfiguration
+            resolution = encoder.Resolution if encoder else None
+            self.profile_sizes[p.token] = (resolution.Width, resolution.Height) if resolution else None
+            # Check which video source the profile is bound to
+            if p.VideoSourceConfiguration:
+                source_token = p.VideoSourceConfiguration.SourceToken
+                by_source.setdefault(source_token, []).append(p.token)
+                self.source_configs.setdefault(source_token, set()).add(p.VideoSourceConfiguration.token)
+        self.channel_index = [(source.token, by_source.get(source.token, [])) for source in sources]
+        return self.channel_index
+
     def get_profile_token_by_channel(self, channel_index):
         """
         Find a media profile token that corresponds to a specific channel index (0-based).
         """
-        sources = self.get_video_sources()
-        if not sources:
+        index = self.get_channel_index()
+        if not index:
             raise RuntimeError("No video sources found on device.")
         
-        if channel_index < 0 or channel_index >= len(sources):
-            raise ValueError(f"Channel index {channel_index} out of range (Found {len(sources)} sources).")
+        if channel_index < 0 or channel_index >= len(index):
+            raise ValueError(f"Channel index {channel_index} out of range (Found {len(index)} sources).")
 
-        target_source_token = sources[channel_index].token
+        target_source_token, tokens = index[channel_index]
         print(f"Target Source for Channel {channel_index}: {target_source_token}")
-
-        profiles = self.get_media_profiles()
-        for p in profiles:
-            # Check if profile is bound to the target video source
-            if p.VideoSourceConfiguration and p.VideoSourceConfiguration.SourceToken == target_source_token:
-                return p.token
+        if tokens:
+            return tokens[0]
         
         raise RuntimeError(f"No media profile found for channel {channel_index} (Source Token: {target_source_token})")
 
+    def resolve_channel_uris(self, channels=None, workers=URI_WORKERS):
+        """
+        Stream URIs of many channels: one profile index, then concurrent GetStreamUri calls.
+        :param channels: Optional list of 1-based channel numbers (default: all)
+        :param workers: Parallel requests
+        :return: list of (channel, profile token, uri) in channel order; channels that fail are skipped with a warning
+        """
+        jobs = []
+        for i, (source_token, tokens) in enumerate(self.get_channel_index()):
+            channel = i + 1
+            if channels and channel not in channels:
+                continue
+            if not tokens:
+                print(f"WARNING: No media profile found for channel {channel} (Source Token: {source_token})")
+                continue
+            jobs.append((channel, tokens[0]))
+        if not jobs:
+            return []
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(jobs)))) as executor:
+            futures = [(channel, token, executor.submit(self.get_stream_uri, token)) for channel, token in jobs]
+        result = []
+        for channel, token, future in futures:
+            try:
+                uri = future.result()
+            except Exception as e:
+                print(f"WARNING: Could not resolve stream URI for channel {channel}: {e}")
+                continue
+            if self.cache:
+                self.cache.set_channel(self.device_key, channel, token, uri)
+            result.append((channel, token, uri))
+        return result
+
+    def get_sub_profile_token(self, channel=None):
+        """
+        Lowest resolution profile bound to a channel's video source (the sub-stream).
+        :param channel: 1-based channel number, or None for the video source of the first profile
+        :return: profile token
+        """
+        index = self.get_channel_index()
+        if channel:
+            if channel < 1 or channel > len(index):
+                raise ValueError(f"Channel {channel} out of range (Found {len(index)} sources).")
+            tokens = index[channel - 1][1]
+        else:
+            first = next(iter(self.profile_sizes), None)
+            tokens = next((t for _, t in index if first in t), [])
+        if len(tokens) < 2:
+            raise RuntimeError(f"Channel {channel or 'default'} has no sub-stream profile (Found {len(tokens)} profiles).")
+        sized = [t for t in tokens[1:] if self.profile_sizes.get(t)]
+        if not sized:
+            # Sizes unknown: NVRs list the main stream first
+            return tokens[-1]
+        return min(sized, key=lambda t: self.profile_sizes[t][0] * self.profile_sizes[t][1])
+
+    def get_event_sources(self, channel):
+        """
+        Tokens a device may name as the source of a channel's events (cameras use the video source
+        token, others the video source configuration token).
+        :param channel: 1-based channel number
+        :return: set of tokens
+        """
+        self.ensure_connected()
+        index = self.get_channel_index()
+        if channel < 1 or channel > len(index):
+            raise ValueError(f"Channel {channel} out of range (Found {len(index)} sources).")
+        source_token = index[channel - 1][0]
+        return {source_token} | self.source_configs.get(source_token, set())
+
+    def create_pullpoint_subscription(self, termination=60):
+        """
+        Create a PullPoint event subscription on the device's Events service.
+        :param termination: Seconds until the device drops the subscription unless it is renewed
+        :return: (pullpoint service for PullMessages, subscription manager for Renew/Unsubscribe)
+        """
+        with self.lock:
+            self.ensure_connected()
+            events = self.camera.create_events_service()
+            res = events.CreatePullPointSubscription({'InitialTerminationTime': datetime.timedelta(seconds=termination)})
+            address = res.SubscriptionReference.Address._value_1
+            print(f"DEBUG: PullPoint subscription created at {address}")
+            self.camera.xaddrs[PULLPOINT_NS] = address
+            pullpoint = self.camera.create_pullpoint_service()
+            manager = pullpoint.zeep_client.create_service(SUBSCRIPTION_MANAGER_BINDING, address)
+        return pullpoint, manager
+
+    def pull_messages(self, pullpoint, timeout=5, limit=32):
+        """
+        Long-poll a PullPoint subscription.
+        The response is parsed here rather than by zeep, which drops the text of the mixed-content Topic element.
+        :param timeout: Seconds the device may hold the request open while it has no events
+        :param limit: Max messages per response
+        :return: list of wsnt:NotificationMessage elements (lxml)
+        """
+        with pullpoint.zeep_client.settings(raw_response=True):
+            res = pullpoint.ws_client.PullMessages(Timeout=datetime.timedelta(seconds=timeout), MessageLimit=limit)
+        if res.status_code != 200:
+            raise RuntimeError(f"PullMessages failed: HTTP {res.status_code}")
+        root = etree.fromstring(res.content)
+        return root.findall(f'.//{{{WSNT_NS}}}NotificationMessage')
+
     def get_stream_uri(self, profile_token):
         """
         Get the RTSP Stream URI for a specific profile token.
@@ -170,3 +404,91 @@ class OnvifClient:
         except Exception as e:
             print(f"Error fetching Stream URI: {e}")
             raise
+
+    def cached_stream_uri(self, channel=None, stream="main"):
+        """
+        Stream URI from the persisted cache, without contacting the device.
+        :param channel: 1-based channel number, or None for the first profile
+        :param stream: 'main' or 'sub' (lowest resolution profile of the channel)
+        :return: URI or None
+        """
+        if not self.cache:
+            return None
+        entry = self.cache.get(self.device_key).get("channels", {}).get(_cache_key(channel, stream))
+        return entry["uri"] if entry else None
+
+    def discover_stream_uri(self, channel=None, stream="main"):
+        """
+        Full discovery (connecting first if needed): profile token for the channel, then its stream URI.
+        The result is stored in the cache.
+        :param channel: 1-based channel number, or None for the first profile
+        :param stream: 'main' or 'sub' (lowest resolution profile of the channel)
+        :return: URI
+        """
+        with self.lock:
+            self.ensure_connected()
+            if stream == "sub":
+                token = self.get_sub_profile_token(channel)
+                print(f"Selected sub-stream Token for Channel {channel or 'default'}: {token}")
+            elif channel:
+                print(f"Selecting profile for Channel {channel}...")
+                # Convert 1-based channel to 0-based index
+                token = self.get_profile_token_by_channel(channel - 1)
+                print(f"Selected Token for Channel {channel}: {token}")
+            else:
+                profiles = self.get_media_profiles()
+                if not profiles:
+                    raise RuntimeError("No media profiles found on device.")
+                # Usually the first one is main.
+                print(f"Selected Profile:: Name: {profiles[0].Name}, Token: {profiles[0].token}")
+                token = profiles[0].token
+            print("Requesting Stream URI...")
+            uri = self.get_stream_uri(token)
+        if self.cache:
+            self.cache.set_channel(self.device_key, _cache_key(channel, stream), token, uri)
+        return uri
+
+    def resolve_stream_uri(self, channel=None, revalidate=True, stream="main"):
+        """
+        Cached URI if there is one (checked against the device in the background), else full discovery.
+        :return: URI
+        """
+        uri = self.cached_stream_uri(channel, stream)
+        if uri is None:
+            return self.discover_stream_uri(channel, stream)
+        print(f"Using cached {stream} stream URI for {self.device_key} (channel {channel or 'default'}).")
+        if revalidate:
+            self.revalidate(channel, uri, stream)
+        return uri
+
+    def revalidate(self, channel, uri, stream="main"):
+        """
+        Re-run discovery on a background thread and update the cache if the device changed.
+        """
+        def _check():
+            try:
+                fresh = self.discover_stream_uri(channel, stream)
+            except Exception as e:
+                print(f"WARNING: Background ONVIF revalidation failed: {e}")
+                return
+            if fresh != uri:
+                print(f"WARNING: {stream.capitalize()} stream URI for channel {channel or 'default'} changed; the cache now has the new URI.")
+
+        thread = threading.Thread(target=_check, daemon=True)
+        thread.start()
+        return thread
+
+    def refresh_stream_uri(self, channel=None, stream="main"):
+        """
+        Called when a URI fails to open (cached, or stale after an NVR reboot): drop the cached entry and
+        the channel index, then run full discovery. Works the same without a cache.
+        :return: URI, or None if discovery failed
+        """
+        if self.cache:
+            self.cache.invalidate(self.device_key, _cache_key(channel, stream))
+        self.channel_index = None
+        try:
+            return self.discover_stream_uri(channel, stream)
+        except Exception as e:
+            print(f"Error during ONVIF discovery: {e}")
+            return None
@@ -0,0 +1,227 @@
+import time
+import queue
+import random
+import datetime
+import threading
+
+WSNT_NS = "http://docs.oasis-open.org/wsn/b-2"
+TT_NS = "http://www.onvif.org/ver10/schema"
+
+# Topic fragments of the motion / analytics events that arm face detection
+MOTION_TOPICS = ("Motion", "Human", "Person", "People", "Face", "ObjectDetection", "FieldDetector", "LineDetector", "Intrusion")
+
+# Data items that carry the on/off state of an event (e.g. IsMotion="true")
+STATE_ITEMS = ("IsMotion", "State", "IsInside", "IsPeople", "IsHuman", "IsPerson", "Active")
+
+
+class CameraEvent:
+    def __init__(self, topic, source, data, utc_time=None, operation=None, received=None):
+        """
+        One notification from the device's Events service.
+        :param topic: Topic path, e.g. 'tns1:RuleEngine/CellMotionDetector/Motion'
+        :param source: Source simple items, e.g. {'VideoSourceConfigurationToken': 'VSC1'}
+        :param data: Data simple items, e.g. {'IsMotion': 'true'}
+        :param utc_time: UtcTime attribute as sent by the device
+        :param operation: PropertyOperation ('Initialized', 'Changed', 'Deleted') or None
+        :param received: Local time.time() the event was pulled
+        """
+        self.topic = topic or ""
+        self.source = source
+        self.data = data
+        self.utc_time = utc_time
+        self.operation = operation
+        self.received = received if received is not None else time.time()
+
+    def __repr__(self):
+        return f"CameraEvent({self.topic}, source={self.source}, data={self.data})"
+
+    @property
+    def active(self):
+        """
+        True if the event reports a condition that is on. Events without a state item (line crossing, ...) are pulses.
+        """
+        for name in STATE_ITEMS:
+            if name in self.data:
+                return self.data[name].strip().lower() in ("true", "1")
+        return True
+
+    @property
+    def stateful(self):
+        """
+        True if the event carries an on/off state item (a condition), False for a pulse.
+        """
+        return any(name in self.data for name in STATE_ITEMS)
+
+    def matches(self, topics):
+        return any(t.lower() in self.topic.lower() for t in topics)
+
+
+def parse_notification(element):
+    """
+    Build a CameraEvent from a wsnt:NotificationMessage element.
+    """
+    topic = element.find(f"{{{WSNT_NS}}}Topic")
+    message = element.find(f"{{{WSNT_NS}}}Message/{{{TT_NS}}}Message")
+    source, data, utc_time, operation = {}, {}, None, None
+    if message is not None:
+        utc_time = message.get("UtcTime")
+        operation = message.get("PropertyOperation")
+        for section, items in (("Source", source), ("Data", data)):
+            for item in message.findall(f"{{{TT_NS}}}{section}/{{{TT_NS}}}SimpleItem"):
+                items[item.get("Name")] = item.get("Value", "")
+    return CameraEvent(topic.text.strip() if topic is not None and topic.text else "", source, data, utc_time, operation)
+
+
+class EventSubscription:
+    def __init__(self, client, topics=MOTION_TOPICS, hold_time=3.0, pull_timeout=5, termination=60, queue_size=256, fail_open=True):
+        """
+        Camera-side events as a stream. A background thread keeps a PullPoint subscription alive:
+        PullMessages long-polls, Renew before the subscription expires, and re-subscribe with backoff after errors.
+        Iterate over the subscription (or call get()) for every CameraEvent, or use armed()/gate() to ask
+        whether a motion/analytics event is currently active.
+        :param client: OnvifClient (connected on demand)
+        :param topics: Topic fragments that count as motion/analytics for armed()
+        :param hold_time: Seconds armed() stays True after the last matching event ended
+        :param pull_timeout: Seconds the device may hold a PullMessages request open
+        :param termination: Subscription lifetime requested from the device (renewed at half-time)
+        :param queue_size: Events kept for consumers of the stream; the oldest are dropped when full
+        :param fail_open: While no subscription is working, armed() returns True so detection is never lost
+        """
+        self.client = client
+        self.topics = topics
+        self.hold_time = hold_time
+        self.pull_timeout = pull_timeout
+        self.termination = termination
+        self.fail_open = fail_open
+        self.events = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.active = {} # (topic, source items) -> True while the device reports the condition on
+        self.last_seen = {} # source token -> last time a matching event was active
+        self.connected = False
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.pullpoint = None
+        self.manager = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=self.pull_timeout + 2.0)
+        self._unsubscribe()
+
+    def get(self, timeout=None):
+        """
+        Next event from the stream.
+        :return: CameraEvent, or None on timeout
+        """
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def __iter__(self):
+        while not self.stop_event.is_set():
+            event = self.get(timeout=0.5)
+            if event is not None:
+                yield event
+
+    def armed(self, sources=None, now=None):
+        """
+        :param sources: Optional set of source tokens (see OnvifClient.get_event_sources()); None = any source
+        :return: True while a matching event is active on one of the sources, or ended less than hold_time ago
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            if not self.connected:
+                return self.fail_open
+            for (_, items), on in self.active.items():
+                # Events without a source apply to every channel
+                if on and (sources is None or not items or sources & set(v for _, v in items)):
+                    return True
+            for token, seen in self.last_seen.items():
+                if (sources is None or token is None or token in sources) and now - seen < self.hold_time:
+                    return True
+        return False
+
+    def gate(self, sources=None):
+        """
+        :return: An object with armed() bound to the given sources, for StreamPlayer/ChannelMonitor
+        """
+        return EventGate(self, sources)
+
+    def _loop(self):
+        delay = 1.0
+        while not self.stop_event.is_set():
+            try:
+                self.pullpoint, self.manager = self.client.create_pullpoint_subscription(self.termination)
+                renew_at = time.time() + self.termination / 2.0
+                with self.lock:
+                    self.connected = True
+                delay = 1.0
+                while not self.stop_event.is_set():
+                    for element in self.client.pull_messages(self.pullpoint, self.pull_timeout):
+                        self._handle(parse_notification(element))
+                    if time.time() >= renew_at:
+                        self.manager.Renew(TerminationTime=datetime.timedelta(seconds=self.termination))
+                        renew_at = time.time() + self.termination / 2.0
+            except Exception as e:
+                if self.stop_event.is_set():
+                    break
+                print(f"WARNING: ONVIF event subscription failed: {e}. Re-subscribing in {delay:.0f}s...")
+            with self.lock:
+                self.connected = False
+                self.active.clear()
+            self._unsubscribe()
+            if self.stop_event.wait(delay * random.uniform(0.8, 1.2)):
+                break
+            delay = min(delay * 2, 60.0)
+
+    def _handle(self, event):
+        if event.matches(self.topics):
+            key = (event.topic, tuple(sorted(event.source.items())))
+            with self.lock:
+                was_active = self.active.get(key, False)
+                if event.stateful:
+                    # Pulses have no 'off' message, so only conditions are kept as active
+                    self.active[key] = event.active
+                # Only an active event, or one that just ended, counts for hold_time. The inactive
+                # 'Initialized' state a camera sends for every property when subscribing does not arm anything.
+                if event.active or was_active:
+                    for token in event.source.values():
+                        self.last_seen[token] = event.received
+                    if not event.source:
+                        self.last_seen[None] = event.received
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            try:
+                self.events.get_nowait()
+            except queue.Empty:
+                pass
+            self.events.put_nowait(event)
+
+    def _unsubscribe(self):
+        manager, self.manager, self.pullpoint = self.manager, None, None
+        if manager is None:
+            return
+        try:
+            manager.Unsubscribe()
+        except Exception:
+            pass # The device drops it at its termination time anyway
+
+
+class EventGate:
+    def __init__(self, subscription, sources=None):
+        """
+        armed() of an EventSubscription, restricted to the sources of one channel.
+        """
+        self.subscription = subscription
+        self.sources = set(sources) if sources else None
+
+    def armed(self):
+        return self.subscription.armed(self.sources)
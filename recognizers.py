@@ -0,0 +1,131 @@
+import os
+import json
+
+import cv2
+
+from embedding_recognizer import create_embedding_recognizer
+from lbph_recognizer import LBPH_EXTENSION, LBPHRecognizer, read_header
+
+# LBPH chi-square distance below which a prediction is accepted (lower is stricter)
+LBPH_THRESHOLD = 45
+
+# Training images and live crops are normalized to the same square size before recognition
+FACE_SIZE = 100
+
+
+def prepare_face(gray_face, size=FACE_SIZE):
+    """
+    Normalize a gray face crop the way the training set is packed (see dataset_pack.py):
+    histogram equalization, then resize to size x size.
+    """
+    face = cv2.equalizeHist(gray_face)
+    return cv2.resize(face, (size, size), interpolation=cv2.INTER_AREA if face.shape[0] > size else cv2.INTER_LINEAR)
+
+
+def face_crop(recognizer, image, box, gray=None):
+    """
+    Cut a face out of a frame in the form the recognizer was trained on: the plain BGR crop for
+    embedding recognizers (recognizer.color), else the normalized gray crop (prepare_face).
+    :param image: BGR (or gray) frame
+    :param box: (x, y, w, h) in image coordinates
+    :param gray: Gray version of image, if the caller already has one
+    """
+    x, y, w, h = box
+    if getattr(recognizer, "color", False):
+        crop = image[y:y+h, x:x+w]
+        return crop if crop.ndim == 3 else cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
+    if gray is None:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    return prepare_face(gray[y:y+h, x:x+w])
+
+
+def is_gallery(trainer_file):
+    """
+    True for an embedding gallery: a '.npz' file, or any file written by EmbeddingRecognizer.write
+    (an .npz is a zip archive, so a custom --savefile name is recognized by its content).
+    """
+    if trainer_file.endswith(".npz"):
+        return True
+    try:
+        with open(trainer_file, 'rb') as f:
+            return f.read(4) == b"PK\x03\x04"
+    except OSError:
+        return False
+
+
+def manifest_path(model_file):
+    """
+    The manifest of ingested images lives next to the model (trainer.yml -> trainer.manifest.json).
+    """
+    return os.path.splitext(model_file)[0] + ".manifest.json"
+
+
+def check_face_format(trainer_file, recognizer):
+    """
+    Warn when a model was not trained on the face crops it is queried with, e.g. a trainer.yml from before
+    faces were normalized: it loads fine but matches poorly. The format is read from the compact model's
+    header or from the manifest trainer.py writes next to the model.
+    :return: True if the model matches
+    """
+    color = getattr(recognizer, "color", False)
+    expected = (recognizer.face_size if color else FACE_SIZE, color)
+    if trainer_file.endswith(LBPH_EXTENSION):
+        trained = (recognizer.face_size, False)
+    else:
+        try:
+            with open(manifest_path(trainer_file), 'r') as f:
+                manifest = json.load(f)
+            trained = (manifest.get("face_size"), manifest.get("color", False))
+        except (OSError, ValueError):
+            trained = (None, False)
+    if trained == expected:
+        return True
+    kind = "colour" if color else "equalized gray"
+    found = f"{trained[0]}px faces" if trained[0] else "faces of unknown size (no manifest)"
+    print(f"WARNING: {trainer_file} was trained on {found}, but faces are now matched as {expected[0]}px {kind} crops. "
+          f"Recognition will be unreliable until the model is rebuilt with trainer.py.")
+    return False
+
+
+def load_recognizer(trainer_file, model_dir="models"):
+    """
+    Load a trained recognizer. The file extension selects the type:
+    '.npz' (or any zip file, see is_gallery) is an embedding gallery (see embedding_recognizer.py), '.lbph' a compact memory mapped
+    LBPH model, anything else an LBPH model in OpenCV's YAML format. LBPH models are matched with
+    the vectorized NumPy engine in lbph_recognizer.py (same distances as cv2's LBPH, plus top-k and batches).
+    :param trainer_file: Path to the trained model
+    :param model_dir: Directory containing the embedding model (embedding galleries only)
+    :return: (recognizer, threshold) - recognizer.predict(gray_face) returns (id, distance)
+    """
+    if is_gallery(trainer_file):
+        recognizer = create_embedding_recognizer(model_dir)
+        recognizer.read(trainer_file)
+        check_face_format(trainer_file, recognizer)
+        return recognizer, recognizer.threshold
+
+    recognizer = LBPHRecognizer()
+    recognizer.read(trainer_file)
+    check_face_format(trainer_file, recognizer)
+    return recognizer, LBPH_THRESHOLD
+
+
+def load_names(map_file="names.json"):
+    """
+    Load the ID -> Name mapping written by trainer.py.
+    """
+    if not os.path.exists(map_file):
+        return {}
+    with open(map_file, 'r') as f:
+        names = json.load(f)
+    # Convert keys to int (json keys are always strings)
+    return {int(k): v for k, v in names.items()}
+
+
+def load_model_names(trainer_file, map_file="names.json"):
+    """
+    ID -> Name mapping for a model: compact LBPH models carry their own, other models use names.json.
+    """
+    if trainer_file.endswith(LBPH_EXTENSION) and os.path.exists(trainer_file):
+        header, _ = read_header(trainer_file)
+        return {int(k): v for k, v in header["names"].items()}
+    return load_names(map_file)
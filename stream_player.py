@@ -1,19 +1,58 @@
 import cv2
-import threading
+import os
+import signal
 import time
-import urllib.request
+from frame_grabber import Backoff, FrameGrabber, open_capture
+from motion_detector import MotionDetector
+from detection_scheduler import AdaptiveScheduler
+from face_tracker import FaceTracker
+from detectors import create_detector
+from burst_capture import BurstCapture
+from model_watcher import ModelWatcher
+from frame_bus import BusGrabber, bus_name
+from dual_stream import DetailStream, map_box, refine_box
+from webhook_dispatcher import AlertDispatcher, CooldownTracker, parse_targets
+from recognizers import LBPH_THRESHOLD, face_crop, load_model_names, load_recognizer
 
 class StreamPlayer:
-    def __init__(self, uri, window_name="ONVIF Camera Stream", webhook_url=None, mode="detect", train_output_dir="dataset", trainer_file="trainer.yml", person_name="Unknown"):
+    def __init__(self, uri, window_name="ONVIF Camera Stream", webhook_url=None, mode="detect", train_output_dir="dataset", trainer_file="trainer.yml", person_name="Unknown", capture_mode="latest", max_frame_age=1.0, headless=False, snapshot_dir="snapshots", motion_gate=False, motion_detect_interval=5, adaptive=False, cpu_budget=0.5, latency_budget=1.0, detector="haar", model_dir="models", metrics=None, dispatcher=None, camera="main", recorder=None, resolve_uri=None, event_gate=None, detail_uri=None, auto_capture=0, model_reload=True, zones=None):
         """
         Initialize the StreamPlayer.
         :param uri: RTSP Stream URI
         :param window_name: Name of the display window
-        :param webhook_url: URL to trigger on face detection (detect mode)
+        :param webhook_url: URL (or list of URLs, 'post:<url>' for JSON POST) to trigger on face detection (detect mode)
         :param mode: 'detect' or 'train'
         :param train_output_dir: Directory to save images in train mode
         :param trainer_file: Path to trained model
         :param person_name: Name of the person to recognize
+        :param capture_mode: 'latest' (background reader, always process the freshest frame), 'process' (like latest,
+                             but decoded in a separate process and shared through a shared memory frame bus,
+                             see frame_bus.py) or 'direct' (read inline)
+        :param max_frame_age: Seconds after which a buffered frame is discarded as stale ('latest' mode)
+        :param headless: Skip all drawing/display work; stop via SIGINT/SIGTERM instead of keypresses
+        :param snapshot_dir: Directory for annotated snapshots requested via request_snapshot()/SIGUSR1
+        :param motion_gate: Only run face detection while the scene is changing
+        :param motion_detect_interval: Run detection every Nth frame while motion lasts (motion_gate only)
+        :param adaptive: Choose detection cadence and downscale factor from measured stage timings
+        :param cpu_budget: Fraction of one core detection/recognition may use (adaptive only)
+        :param latency_budget: Max seconds before a new face is seen by the detector (adaptive only)
+        :param detector: Face detector backend: 'haar', 'dnn' or 'yunet'
+        :param model_dir: Directory containing the DNN/YuNet detector and SFace embedding model files
+        :param metrics: Optional StreamMetrics (see metrics.py) receiving counters and stage latencies
+        :param dispatcher: Optional shared AlertDispatcher; by default one is created for webhook_url
+        :param camera: Camera name used in alerts and per-camera cooldowns
+        :param recorder: Optional EventRecorder (see event_recorder.py) saving a clip and snapshot per alert
+        :param resolve_uri: Optional callable returning a fresh URI (full ONVIF discovery) if uri cannot be opened,
+                            e.g. because it came from the startup cache and the device changed
+        :param event_gate: Optional object whose armed() tells whether the camera reports motion/analytics events
+                           (see onvif_events.py); face detection runs only while it is armed
+        :param detail_uri: Optional main stream URI for dual-stream mode: uri is then the low resolution
+                           sub-stream used for detection, and recognition, training captures and snapshots
+                           use crops from the main stream (opened on demand, see dual_stream.py)
+        :param auto_capture: Train mode: collect this many images automatically, keeping the best scored,
+                             non-duplicate face crops (see burst_capture.py), then stop. 0 = capture manually
+        :param model_reload: Detect mode: pick up a retrained model and names.json without restarting (see model_watcher.py)
+        :param zones: Optional ZoneSet (see zones.py); faces are only searched for inside these regions of the detection frame
         """
         self.uri = uri
         self.window_name = window_name
@@ -24,48 +63,78 @@ class StreamPlayer:
         self.running = False
         self.thread = None
         self.cap = None
+        self.capture_mode = capture_mode
+        self.max_frame_age = max_frame_age
+        self.grabber = None
+        self.backoff = Backoff() # 'direct' mode reconnects
+        self.reconnect_at = 0
+        self.reconnect_failures = 0
+        self.down_since = None
+        self.last_stats_time = 0
+        self.headless = headless
+        self.snapshot_dir = snapshot_dir
+        self.last_frame = None
+        self.snapshot_requested = False
+        self.capture_requested = False
+        self.metrics = metrics
+        self.camera = camera
+        self.recorder = recorder
+        self.resolve_uri = resolve_uri
+        self.detail = DetailStream(detail_uri, max_frame_age=max_frame_age) if detail_uri else None
+        # A sub-stream is already small: detect at full size and accept smaller faces
+        self.detect_scale = 1.0 if self.detail else 0.5
+        self.min_face = 24 if self.detail else 60
+        self.zones = zones
+        if zones:
+            print(f"Detection zones: {'; '.join(z.describe() for z in zones.zones)}")
         
-        # Ensure dataset dir exists if training
-        import os
-        if self.mode == "train" and not os.path.exists(self.train_output_dir):
-            os.makedirs(self.train_output_dir)
+        # Training captures are scored/deduplicated and written on a background thread
+        self.auto_capture = auto_capture if self.mode == "train" else 0
+        self.burst = BurstCapture(train_output_dir, person_name, target=auto_capture or 30) if self.mode == "train" else None
             
         # Initialize Face Detection
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        print(f"Loading face detector backend '{detector}'...")
+        self.detector = create_detector(detector, model_dir)
         
-        # Initialize Face Recognition (LBPH)
+        # Initialize Face Recognition (LBPH, or an embedding gallery for .npz files)
         self.names = {}
+        self.recognition_threshold = LBPH_THRESHOLD
         if self.mode == "detect" and os.path.exists(trainer_file):
             print(f"Loading Face Recognizer model from {trainer_file}...")
-            self.recognizer = cv2.face.LBPHFaceRecognizer_create()
-            self.recognizer.read(trainer_file)
+            self.recognizer, self.recognition_threshold = load_recognizer(trainer_file, model_dir)
             
-            # Load names mapping
-            map_file = "names.json"
-            if os.path.exists(map_file):
-                import json
-                with open(map_file, 'r') as f:
-                    self.names = json.load(f)
-                # Convert keys to int (json keys are always strings)
-                self.names = {int(k): v for k, v in self.names.items()}
+            # Load names mapping (stored in the model itself for compact LBPH models)
+            self.names = load_model_names(trainer_file, "names.json")
+            if self.names:
                 print(f"Loaded {len(self.names)} names: {list(self.names.values())}")
         elif self.mode == "detect":
-            print("WARNING: No trainer.yml found. Face recognition disabled (Detection only).")
+            print(f"WARNING: No {trainer_file} found. Face recognition disabled (Detection only).")
 
-        # Trigger control
+        # Retrained models are loaded in the background and swapped in between frames (also enables a model trained later)
+        self.model_watcher = ModelWatcher(trainer_file, "names.json", model_dir).start() if self.mode == "detect" and model_reload else None
 
-        # Trigger control
-        self.last_trigger_time = 0
-        self.trigger_cooldown = 15.0 # Seconds between triggers
+        # Trigger control: alerts are delivered by a background dispatcher with per-person/per-camera cooldowns
+        self.own_dispatcher = dispatcher is None and bool(webhook_url)
+        self.dispatcher = dispatcher or (AlertDispatcher(parse_targets(webhook_url)) if webhook_url else None)
+        self.cooldowns = self.dispatcher.cooldowns if self.dispatcher else CooldownTracker()
+        self.clock = time.time # Time source for cooldowns, re-checks, motion hold and scheduling (replays substitute the media time)
         
         # Performance optimization
         self.frame_count = 0
         self.last_faces = [] # Stores (x,y,w,h)
-        self.saved_count = 0 # For training mode
-        
-        # Stability Filter
-        self.consecutive_recognition_count = 0
-        self.last_recognized_candidate = None
+        self.face_labels = {} # (x,y,w,h) -> label text from the last recognition
+
+        # Motion gating
+        self.motion_detector = MotionDetector() if motion_gate else None
+        self.event_gate = event_gate
+        self.motion_detect_interval = motion_detect_interval
+        self.motion_frame_count = 0 # Frames since the current motion started
+
+        # Adaptive scheduling (replaces the fixed cadence, scale and scaleFactor)
+        self.scheduler = AdaptiveScheduler(cpu_budget=cpu_budget, latency_budget=latency_budget) if adaptive else None
+
+        # Stability Filter: faces are tracked across detection passes and each track votes on its identity
+        self.tracker = FaceTracker()
 
     def start(self):
         """
@@ -86,183 +155,571 @@ class StreamPlayer:
         """
         self.running = False
         
+        if self.grabber:
+            self.grabber.stop()
         if self.cap:
             self.cap.release()
+        if self.detail:
+            self.detail.stop()
+        if self.model_watcher:
+            self.model_watcher.stop()
+        if self.burst:
+            self.burst.stop()
+            print(f"Training capture: {self.burst.describe()}")
+        
+        if self.own_dispatcher:
+            self.dispatcher.stop()
         
-        cv2.destroyWindow(self.window_name)
+        if not self.headless:
+            cv2.destroyWindow(self.window_name)
         print("Stream player stopped.")
 
     def _update(self):
         """
         Main video loop.
         """
-        # Force TCP (already set in environment, but good to know)
-        self.cap = cv2.VideoCapture(self.uri, cv2.CAP_FFMPEG)
-        
-        if not self.cap.isOpened():
+        if not self._open_capture() and not self._reresolve_uri():
             print(f"Error: Could not open stream {self.uri}")
             self.running = False
             return
 
         print(f"Opening stream: {self.uri}")
 
-        # Create window with resizing capability
-        cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
+        if self.headless:
+            self._install_signal_handlers()
+        else:
+            # Create window with resizing capability
+            cv2.namedWindow(self.window_name, cv2.WINDOW_NORMAL)
 
         while self.running:
-            try:
-                 # Debug blocking
-                 # print("r", end="", flush=True) 
-                 ret, frame = self.cap.read()
-                 # print("d", end="", flush=True)
-            except Exception as e:
-                print(f"Error reading frame: {e}")
-                break
+            frame = self._read_frame()
+            if frame is None:
+                # No fresh frame yet (or it was stale); keep the UI responsive
+                if not self.headless:
+                    self._handle_key(cv2.waitKey(1) & 0xFF, None)
+                continue
+
+            self.last_frame = frame
+            if self.recorder:
+                self.recorder.push(frame, time.time())
+            t_start = time.time()
+            self._process_frame(frame)
+            if self.metrics:
+                self.metrics.inc("frames_processed_total")
+                self.metrics.observe("frame_seconds", time.time() - t_start)
+            self._service_requests(frame)
+            if self.detail:
+                self.detail.close_if_idle()
 
+            if not self.headless:
+                # Display the frame
+                cv2.imshow(self.window_name, self.annotate(frame, in_place=True))
+                self._handle_key(cv2.waitKey(1) & 0xFF, frame)
+
+    def _read_frame(self):
+        """
+        Read the next frame, reconnecting in 'direct' mode when the stream drops.
+        :return: frame, or None if no frame is available (self.running is cleared on fatal errors)
+        """
+        if self.grabber:
+            ret, frame, _ = self.grabber.read(timeout=0.5)
+            self._report_capture_stats()
             if not ret:
-                print("\nError: Lost frame or stream ended. Attempting reconnect...")
-                self.cap.release()
-                time.sleep(2)
-                self.cap = cv2.VideoCapture(self.uri, cv2.CAP_FFMPEG)
-                if not self.cap.isOpened():
-                   print("Reconnect failed.")
-                   break
-                continue
+                if not self.grabber.running:
+                    print("Stream lost.")
+                    self.running = False
+                return None
+            return frame
 
-            # Force UI update even if processing is slow
-            if self.frame_count % 5 == 0:
-                 cv2.waitKey(1)
-
-            # Skip frames for face detection to improve performance
-            # Process every 30th frame (approx once per second at 30fps)
-            self.frame_count += 1
-            if self.frame_count % 30 == 0:
-                # Resize for faster detection (Use 0.5 instead of 0.25 for better accuracy)
-                small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-                rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY) # Actually using gray
-                
-                # Tuned parameters:
-                # - scaleFactor: 1.1 (Standard balance)
-                # - minNeighbors: 4 (Standard balance)
-                # - minSize: (30, 30) (Detect smaller faces)
-                detected_faces = self.face_cascade.detectMultiScale(
-                    rgb_small_frame, 
-                    scaleFactor=1.1,
-                    minNeighbors=4, 
-                    minSize=(30, 30)
-                )
-                
-                # Scale back up (multiply by 2 since we resized by 0.5)
-                self.last_faces = []
-                for (x, y, w, h) in detected_faces:
-                    self.last_faces.append((x*2, y*2, w*2, h*2))
+        if self.cap is None:
+            return self._reconnect_direct()
 
-            # Draw results from last detection
-            for (x, y, w, h) in self.last_faces:
-                color = (0, 255, 0) if self.mode == "train" else (255, 0, 0)
-                cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
-            
-            # --- TRAINING MODE LOGIC ---
-            if self.mode == "train":
-                # Show instructions
-                cv2.putText(frame, f"Captured: {self.saved_count} (Press 'c' to capture)", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-                
-                # Check for 'c' press to capture
-                # We handle 'q' globally later, but we need 'c' check here
-                # actually, let's do one waitKey call per loop
-                pass
-
-            # Global Key Check
-            key = cv2.waitKey(1) & 0xFF
-            if key == ord('q'):
-                self.running = False
-                break
-            elif key == ord('c') and self.mode == "train":
-                if len(self.last_faces) > 0:
-                    (x, y, w, h) = self.last_faces[0] 
-                    gray_capture = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    face_img = gray_capture[y:y+h, x:x+w]
-                    import os
-                    filename = f"{self.train_output_dir}/{self.person_name}.{int(time.time())}.{self.saved_count}.jpg"
-                    cv2.imwrite(filename, face_img)
-                    print(f"Captured {filename}")
-                    self.saved_count += 1
+        try:
+            ret, frame = self.cap.read()
+        except Exception as e:
+            print(f"Error reading frame: {e}")
+            ret, frame = False, None
+
+        if not ret:
+            # Reconnect from the loop with backoff instead of sleeping here; the UI stays responsive
+            self.cap.release()
+            self.cap = None
+            self.down_since = time.time()
+            self.backoff.reset()
+            self.reconnect_at = self.down_since + self.backoff.next_delay()
+            print(f"\nError: Lost frame or stream ended. Reconnecting in {self.reconnect_at - self.down_since:.1f}s...")
+            if self.metrics:
+                self.metrics.set("stream_up", 0)
+            return None
+        if self.down_since is not None:
+            down = time.time() - self.down_since
+            self.down_since = None
+            print(f"Stream restored after {down:.1f}s of downtime.")
+            if self.metrics:
+                self.metrics.set("stream_up", 1)
+                self.metrics.inc("downtime_seconds_total", down)
+                self.metrics.observe("recovery_seconds", down)
+        if self.metrics:
+            self.metrics.inc("frames_decoded_total")
+        return frame
+
+    def _reconnect_direct(self):
+        """
+        'direct' mode: one reconnect attempt once the backoff delay has passed.
+        :return: None (frames resume on the next call after a successful reconnect)
+        """
+        if time.time() < self.reconnect_at:
+            time.sleep(0.05)
+            return None
+        self.reconnect_failures += 1
+        if self.resolve_uri and self.reconnect_failures % 3 == 0:
+            self._fresh_uri()
+        if self.metrics:
+            self.metrics.inc("reconnects_total")
+        cap = open_capture(self.uri)
+        if cap.isOpened():
+            self.cap = cap
+            self.reconnect_failures = 0
+            return None
+        cap.release()
+        delay = self.backoff.next_delay()
+        self.reconnect_at = time.time() + delay
+        print(f"Reconnect failed. Retrying in {delay:.1f}s...")
+        return None
+
+    def _swap_model(self):
+        """
+        Switch to a model the watcher finished loading. Runs between frames, so a frame never
+        sees a recognizer from one model and names from another. Tracks keep their votes;
+        they are re-checked with the new model on their next recognition pass.
+        """
+        update = self.model_watcher.take()
+        if update is None:
+            return
+        self.recognizer, self.recognition_threshold, self.names = update
+        if self.metrics:
+            self.metrics.inc("model_reloads_total")
+
+    def _process_frame(self, frame):
+        """
+        Detection, recognition and trigger logic for one frame. Does no drawing.
+        """
+        self.frame_count += 1
+        if self.scheduler:
+            self.scheduler.record_frame(self.clock())
+        if self.model_watcher:
+            self._swap_model()
+
+        if self.motion_detector or self.event_gate:
+            # Detect immediately when motion starts, then every Nth frame while it lasts.
+            # The camera's own events are checked first: they cost nothing on this side.
+            moving = self.event_gate.armed() if self.event_gate else True
+            if moving and self.motion_detector:
+                moving = self.motion_detector.update(frame, self.clock())
+            if not moving:
+                if self.motion_frame_count:
+                    print("DEBUG: Motion ended, face detection idle.")
+                self.motion_frame_count = 0
+                self.last_faces = []
+                self.face_labels = {}
+                self.tracker.clear()
+                return
+            if self.motion_frame_count == 0:
+                if self.motion_detector:
+                    print(f"DEBUG: Motion detected ({self.motion_detector.motion_ratio:.1%} of frame), face detection armed.")
                 else:
-                    print("No face detected to capture!")
-
-            # --- RECOGNITION / WEBHOOK LOGIC (Run if NOT Training) ---
-            if self.mode != "train":
-                 # Check on detection update only (every 30 frames)
-                 if self.frame_count % 30 == 0 and len(self.last_faces) > 0:
-                    current_time = time.time()
-                    
-                    # Recognition Logic
-                    recognized_name = None
-                    if hasattr(self, 'recognizer'):
-                        (x, y, w, h) = self.last_faces[0]
-                        # We need full res gray frame for recognition
-                        gray_full = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                        face_roi = gray_full[y:y+h, x:x+w]
-                        try:
-                            # Performance timing
-                            t_start = time.time()
-                            id, confidence = self.recognizer.predict(face_roi)
-                            t_dur = time.time() - t_start
-                            if t_dur > 0.1:
-                                print(f"WARNING: Recognition took {t_dur:.3f}s")
-                            
-                            detected_name_candidate = self.names.get(id, "Unknown")
-                            print(f"DEBUG: Predicted {detected_name_candidate} with distance {round(confidence)}")
-                            
-                            if confidence < 45: 
-                                recognized_name = detected_name_candidate
-                                cv2.putText(frame, f"{recognized_name} ({round(100-confidence)})", (x+5, y-5), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                            else:
-                                cv2.putText(frame, "Unknown", (x+5, y-5), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                        except Exception as e:
-                            print(f"Prediction error: {e}")
-
-                    # Stability Filter Logic
-                    final_verified_name = None
-                    
-                    if recognized_name and recognized_name != "Unknown":
-                        if recognized_name == self.last_recognized_candidate:
-                            self.consecutive_recognition_count += 1
-                        else:
-                            self.consecutive_recognition_count = 1 
-                            self.last_recognized_candidate = recognized_name
-                            
-                        print(f"DEBUG: Stability Check: {recognized_name} seen {self.consecutive_recognition_count} times.")
-                        
-                        if self.consecutive_recognition_count >= 2:
-                            final_verified_name = recognized_name
+                    print("DEBUG: Camera reports motion, face detection armed.")
+            self.motion_frame_count += 1
+            interval = self.scheduler.interval if self.scheduler else self.motion_detect_interval
+            if (self.motion_frame_count - 1) % interval != 0:
+                return
+        # Skip frames for face detection to improve performance
+        # Process every 30th frame (approx once per second at 30fps) unless the scheduler says otherwise;
+        # auto capture wants many candidates, so it detects every other frame
+        elif self.frame_count % (self.scheduler.interval if self.scheduler else 2 if self.auto_capture else 30) != 0:
+            return
+
+        t_start = time.time()
+        self.last_faces = self._detect_faces(frame)
+        t_detect = time.time() - t_start
+        if self.scheduler:
+            self.scheduler.record_detection(t_detect)
+        if self.metrics:
+            self.metrics.observe("detect_seconds", t_detect)
+            self.metrics.inc("detections_total")
+            self.metrics.inc("faces_detected_total", len(self.last_faces))
+        self.face_labels = {}
+        tracks = self.tracker.update(self.last_faces)
+
+        # --- RECOGNITION / WEBHOOK LOGIC (Run if NOT Training) ---
+        if self.mode != "train" and len(self.last_faces) > 0:
+            self._recognize_and_trigger(frame, tracks)
+        elif self.auto_capture:
+            self._auto_capture(frame)
+
+    def _detect_faces(self, frame):
+        """
+        Run the face detector backend on a downscaled copy of the frame, or of each zone's crop.
+        :return: list of (x, y, w, h) in full frame coordinates
+        """
+        # Resize for faster detection (Use 0.5 instead of 0.25 for better accuracy; 1.0 on a sub-stream)
+        scale = self.scheduler.scale if self.scheduler else self.detect_scale
+        scale_factor = self.scheduler.scale_factor if self.scheduler else 1.1
+        if self.zones:
+            # Only the zones' pixels are scanned; faces are mapped back and must lie inside a zone
+            return self.zones.detect(frame, lambda crop, zone: self._detect_in(crop, scale, scale_factor, zone.min_face or self.min_face))
+        return self._detect_in(frame, scale, scale_factor, self.min_face)
+
+    def _detect_in(self, image, scale, scale_factor, min_face):
+        """
+        :return: faces found in image, in image coordinates
+        """
+        small_frame = cv2.resize(image, (0, 0), fx=scale, fy=scale) if scale != 1.0 else image
+        
+        # Tuned parameters:
+        # - scaleFactor: 1.1 (Standard balance, Haar only)
+        # - minNeighbors: 4 (Standard balance, Haar only)
+        # - minSize: (30, 30) at 0.5 scale, i.e. 60px faces in the full frame (never below the 24px cascade window)
+        min_size = max(24, int(min_face * scale))
+        if min(small_frame.shape[:2]) < min_size:
+            return []
+        detected_faces = self.detector.detect(
+            small_frame,
+            scale_factor=scale_factor,
+            min_size=(min_size, min_size)
+        )
+        
+        # Scale back up to full frame coordinates
+        faces = []
+        for (x, y, w, h) in detected_faces:
+            faces.append((int(x / scale), int(y / scale), int(w / scale), int(h / scale)))
+        return faces
+
+    def _recognize_and_trigger(self, frame, tracks):
+        """
+        Recognize tracks that need it, update their stability vote and fire the webhook.
+        :param tracks: Tracks matching self.last_faces (same order)
+        """
+        current_time = self.clock()
+        
+        # Recognition Logic (once per new track, or when its identity needs re-confirming)
+        if hasattr(self, 'recognizer'):
+            gray_full = None
+            source = None
+            pending = []
+            for track in tracks:
+                if not self.tracker.needs_recognition(track, current_time):
+                    continue
+                if source is None:
+                    source = self._high_res_frame(frame)
+                    if source is None:
+                        # Main stream still opening; the track is recognized on a later pass
+                        break
+                    # We need full res gray frame for recognition
+                    gray_full = cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+                box = self._high_res_box(track.box, frame, gray_full)
+                pending.append((track, face_crop(self.recognizer, source, box, gray_full)))
+
+            if pending:
+                try:
+                    # Performance timing; all faces of the frame are matched in one batch where supported
+                    t_start = time.time()
+                    rois = [roi for _, roi in pending]
+                    if hasattr(self.recognizer, "predict_batch"):
+                        predictions = self.recognizer.predict_batch(rois)
                     else:
-                        self.consecutive_recognition_count = 0
-                        self.last_recognized_candidate = None
-
-                    # Trigger Logic
-                    if  current_time - self.last_trigger_time > self.trigger_cooldown:
-                        if self.webhook_url and final_verified_name:
-                             trigger_url = self.webhook_url
-                             print(f"\nFACE VERIFIED STABLE: {final_verified_name}! Triggering Announcement.")
-                             import urllib.parse
-                             message = f"{final_verified_name} is at the door"
-                             encoded_message = urllib.parse.quote(message)
-                             
-                             if "voicemonkey.io" in self.webhook_url and "trigger" in self.webhook_url:
-                                 trigger_url = self.webhook_url.replace("trigger", "announce") + f"&text={encoded_message}"
-                             else:
-                                 trigger_url = self.webhook_url + f"&text={encoded_message}"
-                             
-                             self.last_trigger_time = current_time
-                             threading.Thread(target=self._fire_webhook, args=(trigger_url,), daemon=True).start()
-
-            # Display the frame
-            cv2.imshow(self.window_name, frame)
-            
-    def _fire_webhook(self, url):
+                        predictions = [self.recognizer.predict(roi) for roi in rois]
+                    t_dur = time.time() - t_start
+                    if self.scheduler:
+                        self.scheduler.record_recognition(t_dur)
+                    if self.metrics:
+                        self.metrics.observe("predict_seconds", t_dur)
+                        self.metrics.inc("predictions_total", len(pending))
+                    if t_dur > 0.1:
+                        print(f"WARNING: Recognition of {len(pending)} faces took {t_dur:.3f}s")
+
+                    for (track, _), (id, confidence) in zip(pending, predictions):
+                        detected_name_candidate = self.names.get(id, "Unknown")
+                        print(f"DEBUG: Track {track.id}: Predicted {detected_name_candidate} with distance {round(confidence)}")
+
+                        recognized_name = detected_name_candidate if confidence < self.recognition_threshold and detected_name_candidate != "Unknown" else None
+                        verified = self.tracker.add_prediction(track, recognized_name, confidence, current_time)
+                        if recognized_name:
+                            # Stability Filter Logic
+                            votes = sum(1 for n, _ in track.history if n == recognized_name)
+                            print(f"DEBUG: Stability Check: Track {track.id} {recognized_name} seen {votes} times, verified: {verified}")
+                except Exception as e:
+                    print(f"Prediction error: {e}")
+
+        for track in tracks:
+            self.face_labels[track.box] = self._track_label(track)
+
+            # Trigger Logic (once per verified track)
+            final_verified_name = track.verified_name
+            if not final_verified_name or track.alerted:
+                continue
+            if self.cooldowns.allow(final_verified_name, self.camera, current_time):
+                self._fire_alert(final_verified_name)
+                track.alerted = True
+
+    def _fire_alert(self, name):
+        """
+        Announce a verified person (queued on the dispatcher, never blocks the loop).
+        """
+        if self.metrics:
+            self.metrics.inc("alerts_total")
+        if self.recorder and self.last_frame is not None:
+            self.recorder.trigger(name, self.annotate(self._snapshot_frame(self.last_frame)))
+        if not self.dispatcher:
+            return
+        print(f"\nFACE VERIFIED STABLE: {name}! Triggering Announcement.")
+        self.dispatcher.send(name, self.camera, self.metrics)
+
+    def _high_res_frame(self, frame):
+        """
+        Frame to take face crops from: the main stream in dual-stream mode, else the frame itself.
+        :return: BGR frame, or None if the main stream is not ready yet
+        """
+        if not self.detail:
+            return frame
+        detail = self.detail.frame()
+        if detail is None and self.detail.failed:
+            return frame
+        return detail
+
+    def _snapshot_frame(self, frame):
+        """
+        Main stream frame for snapshots when it is open, else the given frame.
+        """
+        source = self._high_res_frame(frame)
+        return frame if source is None else source
+
+    def _high_res_box(self, box, frame, source):
+        """
+        Map a detection box from the frame it was found in to the frame the crop is taken from.
+        """
+        if source.shape[:2] == frame.shape[:2]:
+            return box
+        src_size = (frame.shape[1], frame.shape[0])
+        dst_size = (source.shape[1], source.shape[0])
+        return refine_box(self.detector, source, map_box(box, src_size, dst_size))
+
+    def _track_label(self, track):
+        """
+        Display text for a track: verified name, last accepted prediction, or Unknown.
+        """
+        if track.verified_name:
+            distances = [d for n, d in track.history if n == track.verified_name]
+            return f"{track.verified_name} ({round(100 - min(distances))})"
+        prediction = track.last_prediction
+        if prediction and prediction[0]:
+            return f"{prediction[0]}? ({round(100 - prediction[1])})"
+        return "Unknown"
+
+    def _capture_face(self, frame):
+        """
+        Save the largest face of the current frame as a training image.
+        Detection is re-run on this frame: the last detection pass may be up to a second old.
+        """
+        faces = self._detect_faces(frame) if frame is not None else []
+        if not faces:
+            print("No face detected to capture!")
+            return
+        source = self._high_res_frame(frame)
+        if source is None:
+            print("Main stream is still opening, capture again in a moment.")
+            return
+        gray_capture = cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+        (x, y, w, h) = self._high_res_box(max(faces, key=lambda f: f[2] * f[3]), frame, gray_capture)
+        self.burst.save(gray_capture[y:y+h, x:x+w])
+
+    def _auto_capture(self, frame):
+        """
+        Offer the largest face of this detection pass to the burst capture; stop once it has enough images.
+        """
+        if self.last_faces:
+            source = self._high_res_frame(frame)
+            if source is None:
+                return # Main stream still opening
+            gray_capture = cv2.cvtColor(source, cv2.COLOR_BGR2GRAY)
+            box = self._high_res_box(max(self.last_faces, key=lambda f: f[2] * f[3]), frame, gray_capture)
+            self.burst.offer(gray_capture, [box])
+        else:
+            self.burst.offer(None, [])
+        if self.burst.done:
+            print("Auto capture target reached, stopping.")
+            self.running = False
+
+    def annotate(self, frame, in_place=False):
+        """
+        Draw the latest detection/recognition results onto a frame.
+        Only called for display or when a consumer asks for an annotated frame.
+        :param frame: BGR frame
+        :param in_place: Draw on the given frame instead of a copy
+        :return: Annotated frame
+        """
+        if not in_place:
+            frame = frame.copy()
+
+        # Boxes are in detection frame coordinates; scale them for a main stream frame
+        boxes = lambda b: b
+        if self.last_frame is not None and frame.shape[:2] != self.last_frame.shape[:2]:
+            src_size = (self.last_frame.shape[1], self.last_frame.shape[0])
+            boxes = lambda b: map_box(b, src_size, (frame.shape[1], frame.shape[0]))
+
+        # Zones are drawn on the detection frame only (pixel zones refer to its resolution)
+        if self.zones and (self.last_frame is None or frame.shape[:2] == self.last_frame.shape[:2]):
+            self.zones.draw(frame)
+
+        # Draw results from last detection
+        for face in self.last_faces:
+            (x, y, w, h) = boxes(face)
+            color = (0, 255, 0) if self.mode == "train" else (255, 0, 0)
+            cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
+
+        for face, label in self.face_labels.items():
+            (x, y, w, h) = boxes(face)
+            cv2.putText(frame, label, (x+5, y-5), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+
+        # --- TRAINING MODE LOGIC ---
+        if self.mode == "train":
+            # Show instructions
+            if self.auto_capture:
+                hint = "auto, move your head slowly"
+            else:
+                hint = "Send SIGUSR2 to capture" if self.headless else "Press 'c' to capture"
+            cv2.putText(frame, f"Captured: {self.burst.saved} ({hint})", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+        if self.scheduler:
+            cv2.putText(frame, f"detect every {self.scheduler.interval} @ {self.scheduler.scale:.2f}x", (10, frame.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 1)
+        return frame
+
+    def get_annotated_frame(self):
+        """
+        Annotated copy of the most recent frame (for previews), or None before the first frame.
+        """
+        frame = self.last_frame
+        if frame is None:
+            return None
+        return self.annotate(frame)
+
+    def request_snapshot(self):
+        """
+        Ask the loop to save an annotated snapshot of the next frame.
+        """
+        self.snapshot_requested = True
+
+    def _service_requests(self, frame):
+        """
+        Handle snapshot/capture requests raised by signals or other threads.
+        """
+        if self.snapshot_requested:
+            self.snapshot_requested = False
+            if not os.path.exists(self.snapshot_dir):
+                os.makedirs(self.snapshot_dir)
+            filename = os.path.join(self.snapshot_dir, f"snapshot.{int(time.time())}.jpg")
+            cv2.imwrite(filename, self.annotate(self._snapshot_frame(frame)))
+            print(f"Snapshot saved to {filename}")
+
+        if self.capture_requested:
+            self.capture_requested = False
+            if self.mode == "train":
+                self._capture_face(frame)
+
+    def _handle_key(self, key, frame):
+        """
+        Global Key Check (GUI mode only).
+        """
+        if key == ord('q'):
+            self.running = False
+        elif key == ord('c') and self.mode == "train":
+            self._capture_face(frame)
+
+    def _install_signal_handlers(self):
+        """
+        Headless mode: SIGINT/SIGTERM stop the loop, SIGUSR1 saves a snapshot, SIGUSR2 captures a training image.
+        """
+        def _stop(signum, _frame):
+            print(f"\nReceived signal {signum}, stopping...")
+            self.running = False
+
+        def _snapshot(signum, _frame):
+            self.snapshot_requested = True
+
+        def _capture(signum, _frame):
+            self.capture_requested = True
+
         try:
-            with urllib.request.urlopen(url) as response:
-                 print(f"Webhook triggered. Status: {response.getcode()}")
-        except Exception as e:
-            print(f"Failed to trigger webhook: {e}")
+            signal.signal(signal.SIGINT, _stop)
+            signal.signal(signal.SIGTERM, _stop)
+            # Not available on Windows
+            if hasattr(signal, "SIGUSR1"):
+                signal.signal(signal.SIGUSR1, _snapshot)
+                signal.signal(signal.SIGUSR2, _capture)
+        except ValueError:
+            # signal.signal only works from the main thread
+            print("WARNING: Could not install signal handlers (not on main thread).")
+
+    def _open_capture(self):
+        """
+        Open the stream according to the capture mode.
+        :return: True if the stream was opened
+        """
+        if self.capture_mode == "latest":
+            self.grabber = FrameGrabber(self.uri, max_frame_age=self.max_frame_age, metrics=self.metrics,
+                                        resolve_uri=self._fresh_uri if self.resolve_uri else None)
+            return self.grabber.start()
+        if self.capture_mode == "process":
+            self.grabber = BusGrabber(self.uri, bus_name(self.camera), max_frame_age=self.max_frame_age, metrics=self.metrics,
+                                      resolve_uri=self._fresh_uri if self.resolve_uri else None)
+            return self.grabber.start()
+
+        # Force TCP (already set in environment, but good to know)
+        self.cap = open_capture(self.uri)
+        return self.cap.isOpened()
+
+    def _reresolve_uri(self):
+        """
+        Ask resolve_uri for a fresh URI and open it (once).
+        :return: True if the new URI was opened
+        """
+        if not self.resolve_uri:
+            return False
+        print(f"WARNING: Could not open {self.uri}, re-running ONVIF discovery...")
+        if self.grabber:
+            self.grabber.stop()
+        if self.cap:
+            self.cap.release()
+        if not self._fresh_uri():
+            return False
+        return self._open_capture()
+
+    def _fresh_uri(self):
+        """
+        Run resolve_uri and switch the player (and a remux recorder of the same stream) to the result.
+        :return: URI, or None if discovery failed
+        """
+        uri = self.resolve_uri()
+        if not uri:
+            return None
+        if self.recorder and getattr(self.recorder, "uri", None) == self.uri:
+            # The remux recorder picks the new URI up when it restarts ffmpeg. Only when it records this
+            # stream: in dual-stream mode it records the main stream while the player reads the sub-stream.
+            self.recorder.uri = uri
+        self.uri = uri
+        return uri
+
+    def _report_capture_stats(self, interval=30.0):
+        """
+        Periodically print dropped/stale frame counters of the background reader.
+        """
+        now = time.time()
+        if now - self.last_stats_time < interval:
+            return
+        self.last_stats_time = now
+        stats = self.grabber.get_stats()
+        print(f"DEBUG: Capture stats: read {stats['read']}, dropped {stats['dropped']}, stale {stats['stale']}, "
+              f"outages {stats['outages']}, downtime {stats['downtime']:.1f}s")
+        if self.scheduler:
+            print(f"DEBUG: Scheduler: {self.scheduler.describe()}")
+
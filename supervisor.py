@@ -0,0 +1,594 @@
+import os
+import sys
+import time
+import socket
+import getpass
+import argparse
+import datetime
+import threading
+import queue
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import cv2
+
+from onvif_client import OnvifClient
+from onvif_events import EventSubscription
+from frame_grabber import FrameGrabber
+from motion_detector import MotionDetector
+from face_tracker import FaceTracker
+from detectors import BACKENDS, create_detector
+from recognizers import face_crop, is_gallery, load_model_names, load_recognizer
+from model_watcher import ModelWatcher
+from zones import load_zones
+from webhook_dispatcher import AlertDispatcher, parse_targets
+from metrics import MetricsRegistry, start_exporters
+
+# Set global timeout to prevent infinite hangs
+socket.setdefaulttimeout(10.0)
+
+# --- Worker process state ---
+# Each pool worker loads the detector and the recognizer once and serves every channel.
+_detector = None
+_recognizer = None # (recognizer, threshold)
+_watcher = None # ModelWatcher of this worker (model_reload only)
+
+DETECT_SCALE = 0.5 # Frames are downscaled before detection
+MIN_FACE = 60 # Smallest face side in frame pixels (30 px at DETECT_SCALE) unless a zone sets its own
+
+
+def _init_worker(trainer_file, detector_backend="haar", model_dir="models", model_reload=False):
+    """
+    Pool initializer: load the models once per worker process.
+    With model_reload, every worker also watches the model file and swaps in a retrained model between tasks.
+    """
+    global _detector, _recognizer, _watcher
+    # One OpenCV thread per worker; the pool itself provides the parallelism
+    cv2.setNumThreads(1)
+    _detector = create_detector(detector_backend, model_dir)
+    if trainer_file and os.path.exists(trainer_file):
+        _recognizer = load_recognizer(trainer_file, model_dir)
+    if trainer_file and model_reload:
+        _watcher = ModelWatcher(trainer_file, model_dir=model_dir, verbose=False).start()
+
+
+def _swap_model():
+    global _recognizer
+    update = _watcher.take() if _watcher else None
+    if update:
+        _recognizer = update[:2]
+
+
+def _recognize_all(frame, faces):
+    """
+    Recognize every detected face, in one batch where the recognizer supports it.
+    :return: list of (id, distance, accepted), one per face (empty without a model)
+    """
+    if not faces or _recognizer is None:
+        return []
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    recognizer, threshold = _recognizer
+    rois = [face_crop(recognizer, frame, box, gray) for box in faces]
+    if hasattr(recognizer, "predict_batch"):
+        predictions = recognizer.predict_batch(rois)
+    else:
+        predictions = [recognizer.predict(roi) for roi in rois]
+    return [(int(id_), float(confidence), confidence < threshold) for id_, confidence in predictions]
+
+
+def _scale_up(detected_faces):
+    return [(int(x / DETECT_SCALE), int(y / DETECT_SCALE), int(w / DETECT_SCALE), int(h / DETECT_SCALE)) for (x, y, w, h) in detected_faces]
+
+
+def _detect_in(image, min_face=MIN_FACE):
+    """
+    :return: faces of at least min_face pixels found in image, in image coordinates
+    """
+    small = cv2.resize(image, (0, 0), fx=DETECT_SCALE, fy=DETECT_SCALE)
+    min_size = max(24, int(min_face * DETECT_SCALE))
+    if min(small.shape[:2]) < min_size:
+        return []
+    return _scale_up(_detector.detect(small, scale_factor=1.1, min_size=(min_size, min_size)))
+
+
+def _analyze_frame(frame, region=None):
+    """
+    Detect faces in a full-resolution frame (BGR or gray) and recognize each of them.
+    :param region: Optional (zones, x0, y0, width, height) when frame is the zones' crop of a width x height frame at (x0, y0)
+    :return: (faces, predictions) where predictions holds (id, distance, accepted) per face, or is empty without a model
+    """
+    return _analyze_batch([frame], [region])[0]
+
+
+def _analyze_batch(frames, regions=None):
+    """
+    Detect faces in several frames with one detector call (batched for the DNN backend).
+    Frames with zones are scanned zone by zone with each zone's face size limits instead,
+    and only the faces a zone accepts are recognized.
+    :param regions: Optional list with a region (see _analyze_frame) or None per frame
+    :return: list of (faces, predictions), one per frame; faces are in full frame coordinates
+    """
+    _swap_model()
+    regions = regions or [None] * len(frames)
+    whole = [i for i, region in enumerate(regions) if region is None]
+    detections = {}
+    if whole:
+        smalls = [cv2.resize(frames[i], (0, 0), fx=DETECT_SCALE, fy=DETECT_SCALE) for i in whole]
+        size = int(MIN_FACE * DETECT_SCALE)
+        for i, detected_faces in zip(whole, _detector.detect_batch(smalls, scale_factor=1.1, min_size=(size, size))):
+            detections[i] = _scale_up(detected_faces)
+
+    results = []
+    for i, (frame, region) in enumerate(zip(frames, regions)):
+        if region is None:
+            faces = detections[i]
+            results.append((faces, _recognize_all(frame, faces)))
+            continue
+        zones, x0, y0, width, height = region
+        faces = zones.detect(frame, lambda crop, zone: _detect_in(crop, zone.min_face or MIN_FACE), origin=(x0, y0), frame_size=(width, height))
+        results.append((faces, _recognize_all(frame, [(x - x0, y - y0, w, h) for (x, y, w, h) in faces])))
+    return results
+
+
+class FrameBatcher:
+    def __init__(self, pool, batch_size=8, max_wait=0.02):
+        """
+        Collect frames from several channels and submit them to the pool as one batch.
+        :param pool: Shared ProcessPoolExecutor
+        :param batch_size: Max frames per batch
+        :param max_wait: Max seconds the first frame waits for the batch to fill
+        """
+        self.pool = pool
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def submit(self, frame, region=None):
+        """
+        Same contract as pool.submit(_analyze_frame, frame, region).
+        """
+        future = Future()
+        self.queue.put((frame, region, future))
+        return future
+
+    def stop(self):
+        self.running = False
+        self.queue.put(None)
+
+    def _loop(self):
+        while self.running:
+            item = self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.running = False
+                    break
+                batch.append(item)
+
+            futures = [f for _, _, f in batch]
+            try:
+                job = self.pool.submit(_analyze_batch, [frame for frame, _, _ in batch], [region for _, region, _ in batch])
+            except Exception as e:
+                for f in futures:
+                    f.set_exception(e)
+                continue
+            job.add_done_callback(lambda j, futures=futures: self._distribute(j, futures))
+
+    def _distribute(self, job, futures):
+        try:
+            results = job.result()
+        except Exception as e:
+            for f in futures:
+                f.set_exception(e)
+            return
+        for f, result in zip(futures, results):
+            f.set_result(result)
+
+
+class ChannelMonitor:
+    def __init__(self, channel, uri, pool, names, dispatcher=None, detect_interval=30, motion_gate=False, motion_detect_interval=5, color=False, metrics=None, event_gate=None, resolve_uri=None, zones=None):
+        """
+        Capture one NVR channel and hand detection/recognition to the shared worker pool.
+        :param channel: 1-based channel number (for display)
+        :param uri: RTSP Stream URI of the channel
+        :param pool: Shared ProcessPoolExecutor, or a FrameBatcher
+        :param names: ID -> Name mapping
+        :param dispatcher: Shared AlertDispatcher (None = no alerts)
+        :param detect_interval: Analyze every Nth frame
+        :param motion_gate: Only submit frames while the scene is changing
+        :param motion_detect_interval: Analyze every Nth frame while motion lasts (motion_gate only)
+        :param color: Send BGR frames (DNN/YuNet backends, embedding galleries) instead of gray
+        :param metrics: Optional StreamMetrics for this channel
+        :param event_gate: Optional EventGate (see onvif_events.py); frames are only submitted while the camera reports motion
+        :param resolve_uri: Optional callable returning a fresh URI when reconnecting keeps failing (e.g. after an NVR reboot)
+        :param zones: Optional ZoneSet (see zones.py); only the rectangle around the zones is sent to the workers,
+                      which scan each zone with its own face size limits and only recognize the faces inside a zone
+        """
+        self.channel = channel
+        self.uri = uri
+        self.pool = pool
+        self.names = names
+        self.dispatcher = dispatcher
+        self.detect_interval = detect_interval
+        self.color = color
+        self.motion_detector = MotionDetector() if motion_gate else None
+        self.motion_detect_interval = motion_detect_interval
+        self.motion_frame_count = 0
+        self.event_gate = event_gate
+        self.zones = zones
+        self.metrics = metrics
+        self.grabber = FrameGrabber(uri, metrics=metrics, resolve_uri=resolve_uri)
+        self.thread = None
+        self.running = False
+
+        self.pending = None # At most one analysis in flight per channel
+        self.pending_since = 0
+        self.frame_count = 0
+        self.analyzed_count = 0
+        self.last_faces = []
+
+        # Stability Filter: faces are tracked across analyses and each track votes on its identity
+        self.tracker = FaceTracker()
+
+    def start(self):
+        if not self.grabber.start():
+            print(f"[ch{self.channel}] Error: Could not open stream {self.uri}")
+            return False
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        self.running = False
+        self.grabber.stop()
+        if self.thread:
+            self.thread.join(timeout=2.0)
+
+    def _loop(self):
+        while self.running:
+            if self.pending is not None and self.pending.done():
+                self._handle_result(self.pending)
+                self.pending = None
+
+            ret, frame, _ = self.grabber.read(timeout=0.5)
+            if not ret:
+                if not self.grabber.running:
+                    print(f"[ch{self.channel}] Stream lost.")
+                    self.running = False
+                continue
+
+            self.frame_count += 1
+            if self.metrics:
+                self.metrics.inc("frames_processed_total")
+            if self.motion_detector or self.event_gate:
+                moving = self.event_gate.armed() if self.event_gate else True
+                if moving and self.motion_detector:
+                    moving = self.motion_detector.update(frame)
+                if not moving:
+                    self.motion_frame_count = 0
+                    self.last_faces = []
+                    self.tracker.clear()
+                    continue
+                self.motion_frame_count += 1
+                due = (self.motion_frame_count - 1) % self.motion_detect_interval == 0
+            else:
+                due = self.frame_count % self.detect_interval == 0
+
+            if due and self.pending is None:
+                # Gray is a third of the bytes to ship to the worker; the cascade needs nothing more
+                image = frame if self.color else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                region = None
+                if self.zones:
+                    # Less to ship and to scan; the worker detects per zone and returns full frame coordinates
+                    height, width = frame.shape[:2]
+                    x0, y0, x1, y1 = self.zones.bounds(width, height)
+                    image = image[y0:y1, x0:x1]
+                    region = (self.zones, x0, y0, width, height)
+                if isinstance(self.pool, FrameBatcher):
+                    self.pending = self.pool.submit(image, region)
+                else:
+                    self.pending = self.pool.submit(_analyze_frame, image, region)
+                self.pending_since = time.time()
+                self.analyzed_count += 1
+                if self.metrics:
+                    self.metrics.set("analysis_queue_depth", 1)
+
+    def _handle_result(self, future):
+        if self.metrics:
+            self.metrics.set("analysis_queue_depth", 0)
+            self.metrics.observe("analysis_seconds", time.time() - self.pending_since)
+        try:
+            faces, predictions = future.result()
+        except Exception as e:
+            print(f"[ch{self.channel}] Analysis error: {e}")
+            return
+
+        self.last_faces = faces
+        if self.metrics:
+            self.metrics.inc("detections_total")
+            self.metrics.inc("faces_detected_total", len(faces))
+            self.metrics.inc("predictions_total", len(predictions))
+        tracks = self.tracker.update(faces)
+        if not faces:
+            return
+
+        # The workers recognize every face; a prediction only counts for tracks that still need one
+        now = time.time()
+        for track, prediction in zip(tracks, predictions):
+            if not self.tracker.needs_recognition(track, now):
+                continue
+            id_, confidence, accepted = prediction
+            detected_name_candidate = self.names.get(id_, "Unknown")
+            print(f"DEBUG: [ch{self.channel}] Track {track.id}: Predicted {detected_name_candidate} with distance {round(confidence)}")
+            recognized_name = detected_name_candidate if accepted and detected_name_candidate != "Unknown" else None
+            verified = self.tracker.add_prediction(track, recognized_name, confidence, now)
+            if recognized_name:
+                votes = sum(1 for n, _ in track.history if n == recognized_name)
+                print(f"DEBUG: [ch{self.channel}] Stability Check: Track {track.id} {recognized_name} seen {votes} times, verified: {verified}")
+
+        # Cooldowns are per person and per camera, shared by all channels through the dispatcher
+        for track in tracks:
+            final_verified_name = track.verified_name
+            if not self.dispatcher or not final_verified_name or track.alerted:
+                continue
+            if self.dispatcher.submit(final_verified_name, f"ch{self.channel}", self.metrics):
+                print(f"\n[ch{self.channel}] FACE VERIFIED STABLE: {final_verified_name}! Triggering Announcement.")
+                if self.metrics:
+                    self.metrics.inc("alerts_total")
+                track.alerted = True
+
+
+class Supervisor:
+    def __init__(self, client, webhook_url=None, trainer_file="trainer.yml", map_file="names.json", workers=None, channels=None, detect_interval=30, motion_gate=False, detector="haar", model_dir="models", batch_size=1, metrics=None, dispatcher=None, event_gate=False, event_hold=3.0, model_reload=True, zone_specs=None, zones_file=None):
+        """
+        Run every channel of an NVR in one process with a shared detection pool.
+        :param client: Connected OnvifClient
+        :param webhook_url: URL(s) to trigger on verified recognition (ignored if dispatcher is given)
+        :param trainer_file: Path to trained model
+        :param map_file: Path to the ID -> Name mapping
+        :param workers: Number of pool processes (default: number of cores)
+        :param channels: Optional list of 1-based channel numbers to monitor (default: all)
+        :param detect_interval: Analyze every Nth frame per channel
+        :param motion_gate: Only analyze channels while their scene is changing
+        :param detector: Face detector backend: 'haar', 'dnn' or 'yunet'
+        :param model_dir: Directory containing the DNN/YuNet model files
+        :param batch_size: Frames from different channels combined into one detector call (>1 mainly helps 'dnn')
+        :param metrics: Optional MetricsRegistry; each channel reports as stream 'ch<N>'
+        :param dispatcher: AlertDispatcher shared by all channels
+        :param event_gate: Analyze a channel only while the NVR reports motion/analytics events for it
+        :param event_hold: Seconds a channel stays armed after its event ended (event_gate only)
+        :param model_reload: Pick up a retrained model and names.json without restarting (see model_watcher.py)
+        :param zone_specs: --zone values applied to every channel (see zones.parse_zone)
+        :param zones_file: JSON file with detection zones per channel ('ch<N>', see zones.load_zones)
+        """
+        self.client = client
+        self.dispatcher = dispatcher or (AlertDispatcher(parse_targets(webhook_url)) if webhook_url else None)
+        self.trainer_file = trainer_file
+        self.workers = workers or os.cpu_count() or 1
+        self.channels = channels
+        self.detect_interval = detect_interval
+        self.motion_gate = motion_gate
+        self.detector = detector
+        self.model_dir = model_dir
+        self.batch_size = batch_size
+        self.metrics = metrics
+        self.event_gate = event_gate
+        self.event_hold = event_hold
+        self.model_reload = model_reload
+        self.zone_specs = zone_specs
+        self.zones_file = zones_file
+        self.model_watcher = None
+        self.events = None
+        self.monitors = []
+        self.pool = None
+        self.batcher = None
+
+        self.names = load_model_names(trainer_file, map_file)
+        if self.names:
+            print(f"Loaded {len(self.names)} names: {list(self.names.values())}")
+        if model_reload:
+            # The workers reload the recognizer themselves; this side only follows the names.
+            # IDs are stable across retraining (trainer.py keeps existing IDs), so the two need not switch together.
+            self.model_watcher = ModelWatcher(trainer_file, map_file, model_dir, load_model=False, on_reload=self._update_names)
+
+    def _update_names(self, recognizer, threshold, names):
+        # Updated in place: every ChannelMonitor holds this dict
+        self.names.update(names)
+
+    def discover_channels(self):
+        """
+        Map every video source to its first media profile and resolve the stream URIs
+        (one GetProfiles call, GetStreamUri requests in parallel).
+        :return: list of (channel, uri)
+        """
+        result = []
+        for channel, token, uri in self.client.resolve_channel_uris(self.channels):
+            print(f"Channel {channel}: Profile {token} -> {uri}")
+            result.append((channel, uri))
+        return result
+
+    def run(self, stats_interval=10.0):
+        """
+        Start all channels and print per-channel throughput (Blocking).
+        """
+        channels = self.discover_channels()
+        if not channels:
+            print("No channels to monitor.")
+            return
+
+        # Spawn (not fork) so workers never inherit capture threads
+        print(f"Starting detection pool with {self.workers} workers for {len(channels)} channels...")
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.trainer_file, self.detector, self.model_dir, self.model_reload)
+        )
+        if self.model_watcher:
+            self.model_watcher.start()
+        if self.batch_size > 1:
+            self.batcher = FrameBatcher(self.pool, batch_size=self.batch_size)
+
+        if self.event_gate:
+            # One subscription for the whole device; each channel listens to its own sources
+            self.events = EventSubscription(self.client, hold_time=self.event_hold).start()
+
+        for channel, uri in channels:
+            gate = None
+            if self.events:
+                try:
+                    gate = self.events.gate(self.client.get_event_sources(channel))
+                except Exception as e:
+                    print(f"WARNING: [ch{channel}] No event sources ({e}); any event arms this channel.")
+                    gate = self.events.gate()
+            monitor = ChannelMonitor(channel, uri, self.batcher or self.pool, self.names,
+                                     dispatcher=self.dispatcher, detect_interval=self.detect_interval,
+                                     motion_gate=self.motion_gate, color=self.detector != "haar" or is_gallery(self.trainer_file),
+                                     metrics=self.metrics.stream(f"ch{channel}") if self.metrics else None,
+                                     event_gate=gate,
+                                     zones=load_zones(f"ch{channel}", self.zone_specs, self.zones_file),
+                                     resolve_uri=lambda channel=channel: self.client.refresh_stream_uri(channel))
+            if monitor.start():
+                self.monitors.append(monitor)
+
+        if not self.monitors:
+            print("No channel could be opened.")
+            return
+
+        last_time = time.time()
+        last_counts = {m.channel: (m.grabber.frames_read, m.analyzed_count) for m in self.monitors}
+        while any(m.running for m in self.monitors):
+            time.sleep(stats_interval)
+            now = time.time()
+            elapsed = now - last_time
+            last_time = now
+            print(f"\n--- Throughput ({datetime.datetime.now():%H:%M:%S}) ---")
+            for m in self.monitors:
+                read, analyzed = m.grabber.frames_read, m.analyzed_count
+                prev_read, prev_analyzed = last_counts[m.channel]
+                last_counts[m.channel] = (read, analyzed)
+                stats = m.grabber.get_stats()
+                state = "up" if m.running and m.grabber.connected else "down"
+                print(f"ch{m.channel:>3} [{state}] decode {(read - prev_read) / elapsed:5.1f} fps | "
+                      f"analyzed {(analyzed - prev_analyzed) / elapsed:5.2f} fps | "
+                      f"dropped {stats['dropped']} | downtime {stats['downtime']:.0f}s | faces {len(m.last_faces)}")
+
+    def stop(self):
+        for m in self.monitors:
+            m.stop()
+        if self.model_watcher:
+            self.model_watcher.stop()
+        if self.events:
+            self.events.stop()
+        if self.dispatcher:
+            self.dispatcher.stop()
+        if self.batcher:
+            self.batcher.stop()
+        if self.pool:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        print("Supervisor stopped.")
+
+
+def main():
+    print(f"Current System Time: {datetime.datetime.now()}")
+    parser = argparse.ArgumentParser(description="Multi-channel ONVIF face recognition supervisor")
+    parser.add_argument("--ip", help="Camera/NVR IP address")
+    parser.add_argument("--port", type=int, default=80, help="ONVIF port (default: 80)")
+    parser.add_argument("--user", help="Username")
+    parser.add_argument("--password", help="Password")
+    parser.add_argument("--channels", help="Comma separated list of 1-based channels to monitor (default: all)")
+    parser.add_argument("--webhook-url", action="append", help="URL to trigger (GET request) when a face is recognized; prefix with 'post:' to send a JSON POST instead. Repeat for several targets")
+    parser.add_argument("--identity-cooldown", type=float, default=15.0, help="Seconds before the same person is announced again (default: 15)")
+    parser.add_argument("--camera-cooldown", type=float, default=0.0, help="Minimum seconds between alerts from the same channel (default: 0, off)")
+    parser.add_argument("--trainer", default="trainer.yml", help="Path to trainer.yml (LBPH), a compact .lbph model (see trainer.py --export) or gallery .npz (embedding) file (default: trainer.yml)")
+    parser.add_argument("--no-model-reload", action="store_true", help="Do not pick up a retrained model/names.json while running (default: reload in the background)")
+    parser.add_argument("--workers", type=int, help="Detection worker processes (default: number of cores)")
+    parser.add_argument("--detect-interval", type=int, default=30, help="Analyze every Nth frame per channel (default: 30)")
+    parser.add_argument("--motion-gate", action="store_true", help="Only analyze a channel while its scene is changing")
+    parser.add_argument("--event-gate", action="store_true", help="Only analyze a channel while the NVR reports motion/person events for it (ONVIF PullPoint subscription)")
+    parser.add_argument("--event-hold", type=float, default=3.0, help="With --event-gate, seconds a channel stays armed after its event ends (default: 3)")
+    parser.add_argument("--detector", choices=BACKENDS, default="haar", help="Face detector backend (default: haar)")
+    parser.add_argument("--model-dir", default="models", help="Directory containing the DNN/YuNet face detector models (default: models)")
+    parser.add_argument("--zone", action="append", metavar="SPEC", help="Only detect faces inside this region on every channel: [name:]x0,y0,x1,y1 or [name:]x,y;x,y;x,y... (fractions <= 1 or pixels), optional @min-max face size in px. Repeat for several zones")
+    parser.add_argument("--zones-file", help="JSON file with detection zones per channel ('ch<N>'), see zones.py")
+    parser.add_argument("--batch-size", type=int, default=1, help="Frames from different channels per detector call (default: 1; useful with --detector dnn)")
+    parser.add_argument("--stats-interval", type=float, default=10.0, help="Seconds between throughput reports (default: 10)")
+    parser.add_argument("--metrics-port", type=int, default=0, help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics (default: off)")
+    parser.add_argument("--metrics-file", help="Periodically write a JSON metrics snapshot to this file")
+    parser.add_argument("--metrics-interval", type=float, default=30.0, help="Seconds between JSON metrics snapshots (default: 30)")
+
+    args = parser.parse_args()
+    try:
+        # Checked up front so a mistake fails before connecting; the zones are loaded per channel later
+        load_zones("ch1", args.zone, args.zones_file)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        parser.error(f"Invalid detection zones: {e}")
+
+    # Force OpenCV to use TCP for RTSP (Fixes corruption/drop issues)
+    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = "rtsp_transport;tcp"
+
+    ip = args.ip if args.ip else input("Camera IP: ")
+    user = args.user if args.user else input("Username: ")
+    password = args.password if args.password else getpass.getpass("Password: ")
+    channels = [int(c) for c in args.channels.split(",")] if args.channels else None
+
+    print(f"\nInitializing ONVIF Client for {ip}:{args.port}...")
+    client = OnvifClient(ip, args.port, user, password)
+    try:
+        client.connect()
+    except Exception as e:
+        print(f"FATAL: Could not connect to camera: {e}")
+        sys.exit(1)
+
+    registry = MetricsRegistry()
+    exporters = start_exporters(registry, args.metrics_port, args.metrics_file, args.metrics_interval)
+
+    dispatcher = None
+    if args.webhook_url:
+        dispatcher = AlertDispatcher(parse_targets(args.webhook_url), identity_cooldown=args.identity_cooldown, camera_cooldown=args.camera_cooldown)
+
+    supervisor = Supervisor(
+        client,
+        dispatcher=dispatcher,
+        trainer_file=args.trainer,
+        workers=args.workers,
+        channels=channels,
+        detect_interval=args.detect_interval,
+        motion_gate=args.motion_gate,
+        detector=args.detector,
+        model_dir=args.model_dir,
+        batch_size=args.batch_size,
+        metrics=registry,
+        event_gate=args.event_gate,
+        event_hold=args.event_hold,
+        model_reload=not args.no_model_reload,
+        zone_specs=args.zone,
+        zones_file=args.zones_file
+    )
+    try:
+        supervisor.run(stats_interval=args.stats_interval)
+    except KeyboardInterrupt:
+        print("\nStopping...")
+    finally:
+        supervisor.stop()
+        for exporter in exporters:
+            exporter.stop()
+        print("Exiting application.")
+
+
+if __name__ == "__main__":
+    main()
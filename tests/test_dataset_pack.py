@@ -0,0 +1,80 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from dataset_pack import DatasetPack, load_pack
+from recognizers import prepare_face
+
+
+def _write_images(data_dir, names, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    for name in names:
+        cv2.imwrite(os.path.join(data_dir, name), rng.integers(0, 256, (80, 80), dtype=np.uint8))
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    data_dir = str(tmp_path / "dataset")
+    _write_images(data_dir, ["Alice.1.1.png", "Alice.1.2.png", "Bob.1.1.png"])
+    return data_dir, str(tmp_path / "dataset.pack")
+
+
+def test_ingest_round_trip(dataset):
+    data_dir, path = dataset
+    files = sorted(os.listdir(data_dir))
+    pack = DatasetPack(path, size=32)
+    rows = pack.ingest(data_dir, files, [1, 1, 2], workers=2)
+    assert rows == [0, 1, 2]
+
+    faces, labels, packed_files = load_pack(path)
+    assert faces.shape == (3, 32, 32) and faces.dtype == np.uint8
+    assert labels.tolist() == [1, 1, 2]
+    assert packed_files == files
+    # Noise has no face, so the whole image is normalized
+    expected = prepare_face(cv2.imread(os.path.join(data_dir, files[2]), cv2.IMREAD_GRAYSCALE), 32)
+    assert np.array_equal(faces[2], expected)
+
+
+def test_only_new_or_modified_files_are_decoded(dataset):
+    data_dir, path = dataset
+    files = sorted(os.listdir(data_dir))
+    DatasetPack(path, size=32).ingest(data_dir, files, [1, 1, 2])
+
+    _write_images(data_dir, ["Carol.1.1.png"], seed=1)
+    os.utime(os.path.join(data_dir, files[0]), (1, 1))
+    files = sorted(os.listdir(data_dir))
+    pack = DatasetPack(path, size=32)
+    rows = pack.ingest(data_dir, files, [1, 1, 2, 3])
+    # The modified file gets a new row at the end, the new file after it
+    assert len(pack) == 5
+    assert rows == [3, 1, 2, 4]
+
+    pack.compact(set(files))
+    assert len(pack) == 4
+    faces, labels, packed_files = load_pack(path)
+    assert sorted(packed_files) == files and faces.shape[0] == 4
+
+
+def test_labels_follow_renumbering(dataset):
+    data_dir, path = dataset
+    files = sorted(os.listdir(data_dir))
+    DatasetPack(path, size=32).ingest(data_dir, files, [1, 1, 2])
+    pack = DatasetPack(path, size=32)
+    pack.ingest(data_dir, files, [5, 5, 7])
+    assert load_pack(path)[1].tolist() == [5, 5, 7]
+
+
+def test_pack_with_another_face_size_is_rebuilt(dataset):
+    data_dir, path = dataset
+    DatasetPack(path, size=32).ingest(data_dir, sorted(os.listdir(data_dir)), [1, 1, 2])
+    assert len(DatasetPack(path, size=48)) == 0
+
+
+@pytest.mark.filterwarnings("error")
+def test_load_pack_closes_the_index(dataset):
+    data_dir, path = dataset
+    DatasetPack(path, size=32).ingest(data_dir, sorted(os.listdir(data_dir)), [1, 1, 2])
+    load_pack(path)
@@ -0,0 +1,71 @@
+from detection_scheduler import AdaptiveScheduler
+
+
+def _run(scheduler, seconds, fps=25.0, detect=0.01, recog=0.0, start=0.0):
+    """
+    Feed frames at fps for the given media time, detecting on every interval-th frame.
+    """
+    t = start
+    frame = 0
+    while t < start + seconds:
+        scheduler.record_frame(t)
+        if frame % scheduler.interval == 0:
+            # Cost scales with the pixel count of the current level
+            scheduler.record_detection(detect * (scheduler.scale / 0.5) ** 2)
+            if recog:
+                scheduler.record_recognition(recog)
+        frame += 1
+        t += 1.0 / fps
+    return t
+
+
+def test_measures_frame_rate_from_timestamps():
+    scheduler = AdaptiveScheduler()
+    for i in range(50):
+        scheduler.record_frame(i / 20.0)
+    assert abs(scheduler.fps - 20.0) < 0.01
+
+
+def test_no_adjustment_before_the_first_period():
+    scheduler = AdaptiveScheduler(adjust_period=5.0)
+    # Media time starting far from wall-clock time must not trigger an immediate adjustment
+    _run(scheduler, 4.0, start=1000.0)
+    assert scheduler.interval == 30
+
+
+def test_cheap_detection_detects_often_at_full_resolution():
+    scheduler = AdaptiveScheduler(cpu_budget=0.5, adjust_period=1.0)
+    _run(scheduler, 30.0, detect=0.002)
+    assert scheduler.scale == 1.0
+    assert scheduler.interval == 1
+
+
+def test_expensive_detection_is_downscaled_and_spaced_out():
+    scheduler = AdaptiveScheduler(cpu_budget=0.2, latency_budget=1.0, adjust_period=1.0)
+    _run(scheduler, 60.0, detect=0.2)
+    assert scheduler.scale < 0.5
+    state = scheduler.get_state()
+    cpu = state["fps"] / state["interval"] * (state["detect_cost"] + state["recog_cost"])
+    assert cpu <= 0.2 * 1.25
+    assert scheduler.interval <= 25
+
+
+def test_recognition_cost_is_averaged_over_all_passes():
+    scheduler = AdaptiveScheduler(smoothing=1.0)
+    scheduler.record_detection(0.01)
+    scheduler.record_recognition(0.04)
+    scheduler.record_recognition(0.02)
+    # Totals are folded in when the next pass starts
+    assert scheduler.recog_cost == 0.0
+    scheduler.record_detection(0.01)
+    assert abs(scheduler.recog_cost - 0.06) < 1e-9
+    # A pass without recognition counts as zero
+    scheduler.record_detection(0.01)
+    assert scheduler.recog_cost == 0.0
+
+    scheduler = AdaptiveScheduler(smoothing=0.5)
+    for _ in range(20):
+        scheduler.record_detection(0.01)
+        scheduler.record_recognition(0.1)
+        scheduler.record_detection(0.01)
+    assert 0.03 < scheduler.recog_cost < 0.07
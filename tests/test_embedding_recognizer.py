@@ -0,0 +1,67 @@
+import numpy as np
+
+from embedding_recognizer import EmbeddingRecognizer
+from recognizers import face_crop, is_gallery
+
+
+class FakeEmbedder:
+    """
+    Stand-in for SFace: the embedding is the mean colour of the crop.
+    """
+    size = 112
+
+    def __init__(self):
+        self.seen = []
+
+    def embed(self, face):
+        self.seen.append(face.shape)
+        v = face.reshape(-1, 3).mean(axis=0).astype(np.float32) - 100.0
+        return v / np.linalg.norm(v)
+
+
+def _gallery():
+    recognizer = EmbeddingRecognizer(FakeEmbedder(), k=3)
+    red, green = np.zeros((112, 112, 3), np.uint8), np.zeros((112, 112, 3), np.uint8)
+    red[..., 2] = 255
+    green[..., 1] = 255
+    recognizer.train([red, red, green], np.array([1, 1, 2]))
+    return recognizer, red, green
+
+
+def test_predict_batch():
+    recognizer, red, green = _gallery()
+    (label_a, dist_a), (label_b, dist_b) = recognizer.predict_batch([green, red])
+    assert (label_a, label_b) == (2, 1)
+    assert dist_a < 1e-3 and dist_b < 1e-3
+
+
+def test_gallery_saved_to_the_given_path(tmp_path):
+    recognizer, red, _ = _gallery()
+    path = str(tmp_path / "faces.gallery")
+    recognizer.write(path)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["faces.gallery"]
+    loaded = EmbeddingRecognizer(FakeEmbedder())
+    loaded.read(path)
+    assert len(loaded.index) == 3
+    assert loaded.predict(red)[0] == 1
+
+
+def test_live_queries_are_colour_crops():
+    recognizer, _, _ = _gallery()
+    frame = np.zeros((480, 640, 3), np.uint8)
+    frame[100:200, 300:400, 2] = 255
+    crop = face_crop(recognizer, frame, (300, 100, 100, 100))
+    assert crop.shape == (100, 100, 3)
+    assert recognizer.predict(crop)[0] == 1
+
+
+
+def test_gallery_recognized_by_content(tmp_path):
+    recognizer, _, _ = _gallery()
+    path = str(tmp_path / "faces.gallery")
+    recognizer.write(path)
+    assert is_gallery(path)
+    yml = tmp_path / "trainer.yml"
+    yml.write_text("%YAML:1.0\n")
+    assert not is_gallery(str(yml))
+    assert not is_gallery(str(tmp_path / "missing.yml"))
@@ -0,0 +1,71 @@
+from face_tracker import FaceTracker, iou
+
+
+def test_iou():
+    assert iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert iou((0, 0, 10, 10), (20, 20, 10, 10)) == 0.0
+    assert abs(iou((0, 0, 10, 10), (5, 0, 10, 10)) - 50 / 150) < 1e-9
+
+
+def test_tracks_follow_moving_faces():
+    tracker = FaceTracker()
+    a, b = tracker.update([(100, 100, 50, 50), (400, 100, 50, 50)])
+    # Given in the other order and moved a little
+    b2, a2 = tracker.update([(410, 105, 50, 50), (110, 100, 50, 50)])
+    assert (a2, b2) == (a, b)
+    assert a.box == (110, 100, 50, 50) and a.hits == 2
+
+
+def test_fast_movement_matches_on_centre_distance():
+    tracker = FaceTracker()
+    (a,) = tracker.update([(100, 100, 50, 50)])
+    # No overlap, but less than one face size away
+    (a2,) = tracker.update([(140, 120, 50, 50)])
+    assert a2 is a
+
+
+def test_unmatched_track_is_dropped_after_max_misses():
+    tracker = FaceTracker(max_misses=2)
+    (a,) = tracker.update([(100, 100, 50, 50)])
+    tracker.update([])
+    tracker.update([])
+    assert tracker.tracks == [a]
+    tracker.update([])
+    assert tracker.tracks == []
+    (b,) = tracker.update([(100, 100, 50, 50)])
+    assert b is not a and b.id != a.id
+
+
+def test_voting_verifies_the_majority_name():
+    tracker = FaceTracker(history_size=5, min_votes=2)
+    (track,) = tracker.update([(0, 0, 50, 50)])
+    assert tracker.add_prediction(track, "Alice", 40.0, now=0.0) is None
+    assert tracker.add_prediction(track, None, 90.0, now=1.0) is None
+    assert tracker.add_prediction(track, "Bob", 45.0, now=2.0) is None
+    assert tracker.add_prediction(track, "Alice", 42.0, now=3.0) == "Alice"
+    assert track.verified_name == "Alice"
+
+
+def test_changed_identity_can_alert_again():
+    tracker = FaceTracker(history_size=3, min_votes=2)
+    (track,) = tracker.update([(0, 0, 50, 50)])
+    tracker.add_prediction(track, "Alice", 40.0, now=0.0)
+    tracker.add_prediction(track, "Alice", 40.0, now=1.0)
+    track.alerted = True
+    tracker.add_prediction(track, "Bob", 40.0, now=2.0)
+    assert track.alerted
+    tracker.add_prediction(track, "Bob", 40.0, now=3.0)
+    tracker.add_prediction(track, "Bob", 40.0, now=4.0)
+    assert track.verified_name == "Bob" and not track.alerted
+
+
+def test_recognition_once_per_track_until_recheck():
+    tracker = FaceTracker(history_size=2, min_votes=2, recheck_interval=10.0)
+    (track,) = tracker.update([(0, 0, 50, 50)])
+    assert tracker.needs_recognition(track, now=0.0)
+    tracker.add_prediction(track, "Alice", 40.0, now=0.0)
+    assert tracker.needs_recognition(track, now=0.5)
+    tracker.add_prediction(track, "Alice", 40.0, now=1.0)
+    # Verified: no more predictions until the recheck interval passed
+    assert not tracker.needs_recognition(track, now=5.0)
+    assert tracker.needs_recognition(track, now=11.5)
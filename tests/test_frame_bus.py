@@ -0,0 +1,141 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pytest
+
+from frame_bus import S_SEQ, FrameBus, FrameReader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def bus():
+    bus = FrameBus(f"onvif_test_{os.getpid()}", capacity=48 * 64 * 3, slots=4)
+    yield bus
+    if bus.head is not None:
+        bus.close()
+
+
+def _frame(value):
+    return np.full((48, 64, 3), value, np.uint8)
+
+
+def test_reader_gets_the_freshest_frame(bus):
+    reader = FrameReader(bus.name)
+    try:
+        assert reader.read(timeout=0.0) is None
+        for value in (1, 2, 3):
+            bus.publish(_frame(value), timestamp=100.0 + value)
+        frame = reader.read(timeout=0.0, copy=True)
+        assert frame.seq == 3 and frame.timestamp == 103.0
+        assert frame.image.shape == (48, 64, 3) and (frame.image == 3).all()
+        # Nothing newer yet
+        assert reader.read(timeout=0.0) is None
+        bus.publish(_frame(4))
+        bus.publish(_frame(5))
+        assert reader.read(timeout=0.0).seq == 5
+        assert reader.frames_read == 2 and reader.frames_skipped == 1
+    finally:
+        reader.close()
+
+
+def test_zero_copy_view_is_valid_until_its_slot_is_reused(bus):
+    reader = FrameReader(bus.name)
+    try:
+        bus.publish(_frame(7))
+        frame = reader.read(timeout=0.0)
+        assert frame.valid() and (frame.image == 7).all()
+        for value in range(8, 8 + bus.slots - 1):
+            bus.publish(_frame(value))
+        assert frame.valid() and (frame.image == 7).all()
+        bus.publish(_frame(99))
+        assert not frame.valid()
+        assert (frame.image == 99).all()
+        frame = None
+    finally:
+        reader.close()
+
+
+def test_slot_being_written_is_not_returned(bus):
+    reader = FrameReader(bus.name)
+    try:
+        bus.publish(_frame(1))
+        # Writer interrupted half way through the slot (seqlock held)
+        bus.table[1, S_SEQ] = -1
+        assert reader.read(timeout=0.0) is None
+        assert reader.torn_reads > 0
+        bus.publish(_frame(2))
+        assert reader.read(timeout=0.0).seq == 2
+    finally:
+        reader.close()
+
+
+def test_peek_does_not_move_the_reader(bus):
+    reader = FrameReader(bus.name)
+    try:
+        bus.publish(_frame(1))
+        assert reader.peek(copy=True).seq == 1
+        assert reader.read(timeout=0.0, copy=True).seq == 1
+        assert reader.peek(copy=True).seq == 1
+        assert reader.read(timeout=0.0) is None
+    finally:
+        reader.close()
+
+
+def test_oversize_frame_is_rejected(bus):
+    assert bus.publish(np.zeros((480, 640, 3), np.uint8)) is None
+    assert bus.publish(np.zeros((48, 64), np.uint8)) == 1
+
+
+def test_closed_bus_ends_reads(bus):
+    reader = FrameReader(bus.name)
+    try:
+        bus.close()
+        assert reader.closed
+        assert reader.read(timeout=0.5) is None
+    finally:
+        reader.close()
+
+
+SCRIPT = textwrap.dedent("""
+    import multiprocessing, os, subprocess, sys, time
+    sys.path.insert(0, {root!r})
+    import numpy as np
+    from frame_bus import FrameBus, FrameReader
+
+    def produce(name, ready, done):
+        bus = FrameBus(name, capacity=16, slots=2)
+        bus.publish(np.ones((4, 4), np.uint8))
+        ready.set()
+        done.wait(10)
+        bus.close()
+
+    if __name__ == "__main__":
+        name = "onvif_test_tracker_%d" % os.getpid()
+        ctx = multiprocessing.get_context("spawn")
+        ready, done = ctx.Event(), ctx.Event()
+        producer = ctx.Process(target=produce, args=(name, ready, done))
+        producer.start()
+        ready.wait(10)
+        # A reader in this process tree (shared resource tracker) and one outside it
+        reader = FrameReader(name)
+        assert reader.read(timeout=1.0, copy=True).seq == 1
+        outside = "import sys; sys.path.insert(0, %r); from frame_bus import FrameReader; r = FrameReader(%r); assert r.read(timeout=1.0, copy=True).seq == 1; r.close()" % ({root!r}, name)
+        subprocess.run([sys.executable, "-c", outside], check=True)
+        reader.close()
+        done.set()
+        producer.join(10)
+        print("ok")
+""")
+
+
+def test_readers_leave_nothing_to_the_resource_tracker(tmp_path):
+    # A file, not -c: spawned children import the main module
+    script = tmp_path / "bus_tracker.py"
+    script.write_text(SCRIPT.format(root=ROOT))
+    result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, timeout=60)
+    assert result.stdout.strip() == "ok", result.stderr
+    assert "leaked" not in result.stderr and "Traceback" not in result.stderr, result.stderr
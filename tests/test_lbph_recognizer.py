@@ -0,0 +1,161 @@
+import os
+import json
+import struct
+
+import cv2
+import numpy as np
+import pytest
+
+from lbph_recognizer import LBPH_MAGIC, LBPHRecognizer, export_model, read_header
+
+
+def _faces(count, seed=0, size=48):
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, (size, size), dtype=np.uint8) for _ in range(count)]
+
+
+def _trained(count=12, people=4, seed=0):
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.train(_faces(count, seed), np.arange(count) % people + 1)
+    return recognizer
+
+
+def _data_files(tmp_path):
+    return sorted(name for name in os.listdir(tmp_path) if name.endswith(".data"))
+
+
+def test_export_round_trip(tmp_path):
+    path = str(tmp_path / "trainer.lbph")
+    export_model(_trained(), path, {1: "Alice", 2: "Bob"}, face_size=48)
+    header, _ = read_header(path)
+    assert header["face_size"] == 48
+    assert _data_files(tmp_path) == [header["data"]]
+
+    model = LBPHRecognizer()
+    model.read(path)
+    assert len(model) == 12
+    assert model.names == {1: "Alice", 2: "Bob"}
+    assert model.face_size == 48
+
+
+def test_export_never_rewrites_a_mapped_model(tmp_path):
+    path = str(tmp_path / "trainer.lbph")
+    probe = _faces(1, seed=9)[0]
+    export_model(_trained(seed=0), path, {})
+    running = LBPHRecognizer()
+    running.read(path)
+    before = running.predict(probe)
+    mapped = read_header(path)[0]["data"]
+    with open(tmp_path / mapped, 'rb') as f:
+        content = f.read()
+
+    export_model(_trained(seed=1), path, {})
+    with open(tmp_path / mapped, 'rb') as f:
+        assert f.read() == content
+    for seed in (2, 3):
+        export_model(_trained(seed=seed), path, {})
+    # The running process keeps its mapping until it reloads
+    assert running.predict(probe) == before
+
+    current = read_header(path)[0]["data"]
+    # Only the current and the previous export are kept
+    assert len(_data_files(tmp_path)) == 2 and current in _data_files(tmp_path)
+    reloaded = LBPHRecognizer()
+    reloaded.read(path)
+    label, distance = _trained(seed=3).predict(probe)
+    assert reloaded.predict(probe)[0] == label
+    assert abs(reloaded.predict(probe)[1] - distance) < 1e-3 * distance
+
+
+def _gallery(people=30, samples=6, seed=0, size=48):
+    """
+    Noisy variations of one base image per person, so centroid bounds can rule people out.
+    """
+    rng = np.random.default_rng(seed)
+    bases = rng.integers(0, 256, (people, size, size)).astype(np.int16)
+
+    def variation(p):
+        return np.clip(bases[p] + rng.integers(-12, 13, (size, size)), 0, 255).astype(np.uint8)
+    faces = [variation(p) for p in range(people) for _ in range(samples)]
+    labels = np.repeat(np.arange(1, people + 1), samples)
+    queries = [variation(p) for p in (0, 7, 29)] + _faces(1, seed=seed + 1, size=size)
+    return faces, labels, queries
+
+
+def _cv2_top_k(recognizer, face, k):
+    """
+    Reference top-k identities from OpenCV: the nearest histogram of each person.
+    """
+    collector = cv2.face.StandardCollector_create()
+    recognizer.predict_collect(face, collector)
+    best = {}
+    for label, distance in collector.getResults(True):
+        best.setdefault(label, distance)
+    return sorted(best.items(), key=lambda item: item[1])[:k]
+
+
+def _assert_matches(found, expected):
+    assert [label for label, _ in found] == [label for label, _ in expected]
+    assert np.allclose([d for _, d in found], [d for _, d in expected], rtol=1e-4)
+
+
+def test_predictions_match_opencv():
+    faces, labels, queries = _gallery()
+    reference = cv2.face.LBPHFaceRecognizer_create()
+    reference.train(faces, labels)
+    model = LBPHRecognizer()
+    model.read_cv2(reference)
+    for query, (label, distance) in zip(queries, model.predict_batch(queries)):
+        expected_label, expected_distance = reference.predict(query)
+        assert label == expected_label
+        assert abs(distance - expected_distance) < 1e-4 * expected_distance
+
+
+def test_top_k_with_and_without_pruning_match_opencv(tmp_path, monkeypatch):
+    faces, labels, queries = _gallery()
+    reference = cv2.face.LBPHFaceRecognizer_create()
+    reference.train(faces, labels)
+    path = str(tmp_path / "trainer.lbph")
+    export_model(reference, path, {})
+    model = LBPHRecognizer()
+    model.read(path)
+
+    scored = []
+    person_minima = model.index._person_minima
+    monkeypatch.setattr(model.index, "_person_minima", lambda query, people: scored.append(len(people)) or person_minima(query, people))
+    histograms = model.histograms(queries)
+    for k in (1, 3):
+        full = model.index.search(histograms, k, prune=False)
+        pruned = model.index.search(histograms, k, prune=True)
+        for query, a, b in zip(queries, full, pruned):
+            expected = _cv2_top_k(reference, query, k)
+            _assert_matches(a, expected)
+            _assert_matches(b, expected)
+    # The queries that resemble someone were searched with bounds, and only a few people were scored for each
+    assert len(scored) >= 2 * 3 and max(scored) < 10
+
+
+def test_float16_model_keeps_the_nearest_person(tmp_path):
+    faces, labels, queries = _gallery()
+    reference = cv2.face.LBPHFaceRecognizer_create()
+    reference.train(faces, labels)
+    path = str(tmp_path / "trainer.lbph")
+    export_model(reference, path, {}, float16=True)
+    model = LBPHRecognizer()
+    model.read(path)
+    for query, (label, distance) in zip(queries[:3], model.predict_batch(queries[:3])):
+        expected_label, expected_distance = reference.predict(query)
+        assert label == expected_label
+        assert abs(distance - expected_distance) < 1e-2 * expected_distance
+
+
+def test_other_format_versions_are_refused(tmp_path):
+    path = str(tmp_path / "trainer.lbph")
+    export_model(_trained(), path, {})
+    header, _ = read_header(path)
+    del header["version"]
+    header_bytes = json.dumps(header).encode("utf-8")
+    with open(path, 'wb') as f:
+        f.write(LBPH_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+    with pytest.raises(ValueError, match="format version 1"):
+        LBPHRecognizer().read(path)
@@ -0,0 +1,141 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("onvif")
+
+from onvif_client import OnvifClient
+
+
+def _profile(token, source_token, config_token, size=None):
+    encoder = SimpleNamespace(Resolution=SimpleNamespace(Width=size[0], Height=size[1])) if size else None
+    return SimpleNamespace(token=token, Name=token, VideoEncoderConfiguration=encoder,
+                           VideoSourceConfiguration=SimpleNamespace(SourceToken=source_token, token=config_token))
+
+
+class FakeMedia:
+    """
+    Media service stand-in: counts calls and records how many GetStreamUri requests overlap.
+    """
+    def __init__(self, sources, profiles, delay=0.1, fail=()):
+        self.sources = [SimpleNamespace(token=t) for t in sources]
+        self.profiles = profiles
+        self.delay = delay
+        self.fail = set(fail)
+        self.calls = {"GetVideoSources": 0, "GetProfiles": 0, "GetStreamUri": 0}
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def GetVideoSources(self):
+        self.calls["GetVideoSources"] += 1
+        return self.sources
+
+    def GetProfiles(self):
+        self.calls["GetProfiles"] += 1
+        return self.profiles
+
+    def create_type(self, name):
+        return SimpleNamespace()
+
+    def GetStreamUri(self, req):
+        with self.lock:
+            self.calls["GetStreamUri"] += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if req.ProfileToken in self.fail:
+                raise RuntimeError("ter:NoProfile")
+            return SimpleNamespace(Uri=f"rtsp://nvr/{req.ProfileToken}")
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def _client(media):
+    client = OnvifClient("127.0.0.1", 80, "admin", "secret", wsdl_dir="wsdl", cache_dir=None)
+    client.media_service = media
+    return client
+
+
+def _nvr(channels=8, **kwargs):
+    sources = [f"VS{i}" for i in range(1, channels + 1)]
+    # Listed out of channel order, each channel with a main and a sub profile
+    profiles = []
+    for i in reversed(range(1, channels + 1)):
+        profiles.append(_profile(f"P{i}_main", f"VS{i}", f"VSC{i}", (1920, 1080)))
+        profiles.append(_profile(f"P{i}_sub", f"VS{i}", f"VSC{i}", (640, 360)))
+    return FakeMedia(sources, profiles, **kwargs)
+
+
+def test_channel_index_from_one_profiles_call():
+    media = _nvr(4)
+    client = _client(media)
+    index = client.get_channel_index()
+    assert [source for source, _ in index] == ["VS1", "VS2", "VS3", "VS4"]
+    assert index[2][1] == ["P3_main", "P3_sub"]
+    assert client.get_profile_token_by_channel(1) == "P2_main"
+    assert client.get_sub_profile_token(2) == "P2_sub"
+    assert client.get_event_sources(3) == {"VS3", "VSC3"}
+    # Cached until refresh
+    client.get_channel_index()
+    assert media.calls["GetProfiles"] == 1 and media.calls["GetVideoSources"] == 1
+    client.get_channel_index(refresh=True)
+    assert media.calls["GetProfiles"] == 2
+
+
+def test_source_without_profile_is_skipped():
+    media = FakeMedia(["VS1", "VS2"], [_profile("P1", "VS1", "VSC1")])
+    client = _client(media)
+    assert client.resolve_channel_uris() == [(1, "P1", "rtsp://nvr/P1")]
+
+
+def test_stream_uris_resolved_concurrently():
+    media = _nvr(8, delay=0.2)
+    client = _client(media)
+    t_start = time.time()
+    result = client.resolve_channel_uris(workers=8)
+    elapsed = time.time() - t_start
+    assert [channel for channel, _, _ in result] == list(range(1, 9))
+    assert result[4] == (5, "P5_main", "rtsp://nvr/P5_main")
+    assert media.calls["GetProfiles"] == 1
+    assert media.calls["GetStreamUri"] == 8
+    assert media.max_active > 1
+    assert elapsed < 8 * 0.2
+
+
+def test_channel_filter_and_failures():
+    media = _nvr(6, delay=0.01, fail={"P3_main"})
+    client = _client(media)
+    result = client.resolve_channel_uris(channels=[2, 3, 5])
+    assert [channel for channel, _, _ in result] == [2, 5]
+    assert media.calls["GetStreamUri"] == 3
+
+
+def _attempts(secure_delay, secure_ok, plain_delay=0.01, plain_ok=True):
+    def attempt(encrypt):
+        time.sleep(secure_delay if encrypt else plain_delay)
+        if not (secure_ok if encrypt else plain_ok):
+            raise RuntimeError(f"encrypt={encrypt} rejected")
+        return f"camera encrypt={encrypt}"
+    return attempt
+
+
+def test_connect_prefers_ws_security():
+    client = _client(None)
+    assert client._connect_racing(_attempts(0.05, True), head_start=0.5) == ("camera encrypt=True", True, True)
+    # Answers after the head start, but before Digest/Basic does
+    assert client._connect_racing(_attempts(0.3, True, plain_delay=0.5), head_start=0.2)[1] is True
+
+
+def test_connect_falls_back_to_digest():
+    client = _client(None)
+    # WS-Security failed: Digest/Basic is confirmed (cacheable)
+    assert client._connect_racing(_attempts(0.01, False), head_start=0.5) == ("camera encrypt=False", False, True)
+    # WS-Security still pending: Digest/Basic is used but not confirmed
+    assert client._connect_racing(_attempts(1.0, True), head_start=0.1) == ("camera encrypt=False", False, False)
+    with pytest.raises(RuntimeError, match="encrypt=True"):
+        client._connect_racing(_attempts(0.01, False, plain_ok=False), head_start=0.5)
@@ -0,0 +1,128 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from onvif_events import CameraEvent, EventSubscription, parse_notification
+
+
+NOTIFICATION = """
+<wsnt:NotificationMessage xmlns:wsnt="http://docs.oasis-open.org/wsn/b-2"
+                          xmlns:tt="http://www.onvif.org/ver10/schema"
+                          xmlns:tns1="http://www.onvif.org/ver10/topics">
+  <wsnt:Topic Dialect="http://www.onvif.org/ver10/tev/topicExpression/ConcreteSet">
+    {topic}
+  </wsnt:Topic>
+  <wsnt:Message>
+    <tt:Message UtcTime="2026-01-01T12:00:00Z" PropertyOperation="{operation}">
+      <tt:Source>
+        <tt:SimpleItem Name="VideoSourceConfigurationToken" Value="{source}"/>
+        <tt:SimpleItem Name="Rule" Value="MyMotionDetectorRule"/>
+      </tt:Source>
+      <tt:Data>
+        <tt:SimpleItem Name="{state}" Value="{value}"/>
+      </tt:Data>
+    </tt:Message>
+  </wsnt:Message>
+</wsnt:NotificationMessage>
+"""
+
+
+def notification(topic="tns1:RuleEngine/CellMotionDetector/Motion", source="VSC1", state="IsMotion", value="true", operation="Changed"):
+    return ET.fromstring(NOTIFICATION.format(topic=topic, source=source, state=state, value=value, operation=operation))
+
+
+def event(value="true", source="VSC1", received=0.0, operation="Changed", topic="tns1:RuleEngine/CellMotionDetector/Motion"):
+    e = parse_notification(notification(topic=topic, source=source, value=value, operation=operation))
+    e.received = received
+    return e
+
+
+def test_parse_notification():
+    e = parse_notification(notification(operation="Initialized"))
+    assert e.topic == "tns1:RuleEngine/CellMotionDetector/Motion"
+    assert e.source == {"VideoSourceConfigurationToken": "VSC1", "Rule": "MyMotionDetectorRule"}
+    assert e.data == {"IsMotion": "true"}
+    assert e.utc_time == "2026-01-01T12:00:00Z"
+    assert e.operation == "Initialized"
+    assert e.active
+    assert e.matches(("Motion",))
+
+
+def test_parse_state_items():
+    assert not parse_notification(notification(value="false")).active
+    assert parse_notification(notification(state="State", value="1")).active
+    assert not parse_notification(notification(topic="tns1:RuleEngine/MyRuleDetector/PeopleDetector", state="IsPeople", value="false")).active
+    # Events without a state item are pulses
+    assert CameraEvent("tns1:RuleEngine/LineDetector/Crossed", {}, {"ObjectId": "3"}).active
+
+
+def test_parse_empty_notification():
+    e = parse_notification(ET.fromstring('<wsnt:NotificationMessage xmlns:wsnt="http://docs.oasis-open.org/wsn/b-2"/>'))
+    assert e.topic == "" and e.source == {} and e.data == {}
+
+
+def test_unrelated_topics_do_not_match():
+    e = parse_notification(notification(topic="tns1:Device/Trigger/DigitalInput", state="LogicalState"))
+    assert not e.matches(("Motion", "Person"))
+
+
+@pytest.fixture
+def subscription():
+    s = EventSubscription(client=None, hold_time=3.0)
+    s.connected = True
+    return s
+
+
+def test_fail_open_while_not_subscribed():
+    s = EventSubscription(client=None)
+    assert s.armed(now=0.0)
+    assert not EventSubscription(client=None, fail_open=False).armed(now=0.0)
+
+
+def test_initialized_inactive_state_does_not_arm(subscription):
+    subscription._handle(event("false", received=10.0, operation="Initialized"))
+    assert not subscription.armed(now=10.0)
+
+
+def test_active_event_arms_until_hold_time_after_it_ended(subscription):
+    subscription._handle(event("true", received=10.0))
+    assert subscription.armed(now=10.0)
+    # Still active long after it started
+    assert subscription.armed(now=100.0)
+    subscription._handle(event("false", received=100.0))
+    assert subscription.armed(now=102.9)
+    assert not subscription.armed(now=103.1)
+
+
+def test_repeated_inactive_events_do_not_extend_hold(subscription):
+    subscription._handle(event("true", received=10.0))
+    subscription._handle(event("false", received=11.0))
+    subscription._handle(event("false", received=13.0))
+    assert not subscription.armed(now=14.5)
+
+
+def test_pulse_event_arms_for_hold_time(subscription):
+    subscription._handle(CameraEvent("tns1:RuleEngine/LineDetector/Crossed", {"VideoSourceConfigurationToken": "VSC1"}, {}, received=20.0))
+    assert subscription.armed(now=22.0)
+    assert not subscription.armed(now=23.5)
+
+
+def test_gate_only_follows_its_own_sources(subscription):
+    subscription._handle(event("true", source="VSC2", received=10.0))
+    assert subscription.gate({"VS2", "VSC2"}).armed()
+    assert not subscription.armed({"VS1", "VSC1"}, now=10.0)
+    assert subscription.armed(now=10.0)
+
+
+def test_event_without_source_arms_every_channel(subscription):
+    subscription._handle(CameraEvent("tns1:VideoAnalytics/Motion", {}, {"State": "true"}, received=10.0))
+    assert subscription.armed({"VSC1"}, now=10.0)
+    assert subscription.armed({"VSC7"}, now=10.0)
+
+
+def test_stream_receives_every_event(subscription):
+    subscription._handle(event("true", received=1.0))
+    subscription._handle(parse_notification(notification(topic="tns1:Device/Trigger/DigitalInput", state="LogicalState")))
+    assert subscription.get(timeout=0.1).topic.endswith("Motion")
+    assert subscription.get(timeout=0.1).topic.endswith("DigitalInput")
+    assert subscription.get(timeout=0.1) is None
@@ -0,0 +1,40 @@
+import json
+
+import cv2
+import numpy as np
+
+from recognizers import FACE_SIZE, check_face_format, load_recognizer, manifest_path
+
+
+def _train_yml(path, size=FACE_SIZE):
+    rng = np.random.default_rng(0)
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.train([rng.integers(0, 256, (size, size), dtype=np.uint8) for _ in range(4)], np.array([1, 1, 2, 2]))
+    recognizer.write(path)
+
+
+def test_model_without_manifest_is_reported_as_legacy(tmp_path, capsys):
+    path = str(tmp_path / "trainer.yml")
+    _train_yml(path, size=60)
+    recognizer, _ = load_recognizer(path)
+    assert "trainer.yml was trained on faces of unknown size" in capsys.readouterr().out
+    assert not check_face_format(path, recognizer)
+
+
+def test_model_with_matching_manifest_loads_quietly(tmp_path, capsys):
+    path = str(tmp_path / "trainer.yml")
+    _train_yml(path)
+    with open(manifest_path(path), 'w') as f:
+        json.dump({"recognizer": "lbph", "face_size": FACE_SIZE, "color": False, "files": {}}, f)
+    recognizer, _ = load_recognizer(path)
+    assert "WARNING" not in capsys.readouterr().out
+    assert check_face_format(path, recognizer)
+
+
+def test_model_with_other_face_size(tmp_path, capsys):
+    path = str(tmp_path / "trainer.yml")
+    _train_yml(path)
+    with open(manifest_path(path), 'w') as f:
+        json.dump({"recognizer": "lbph", "face_size": 64, "files": {}}, f)
+    load_recognizer(path)
+    assert "trained on 64px faces" in capsys.readouterr().out
@@ -0,0 +1,110 @@
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("onvif")
+
+from supervisor import ChannelMonitor
+
+
+class FakeDispatcher:
+    def __init__(self):
+        self.alerts = []
+
+    def submit(self, name, camera=None, metrics=None, now=None):
+        self.alerts.append((name, camera))
+        return True
+
+
+def _result(faces, predictions):
+    future = Future()
+    future.set_result((faces, predictions))
+    return future
+
+
+def _monitor(**kwargs):
+    return ChannelMonitor(3, "rtsp://nvr/ch3", pool=None, names={1: "Alice", 2: "Bob"}, dispatcher=FakeDispatcher(), **kwargs)
+
+
+def test_every_face_is_tracked_and_verified():
+    monitor = _monitor()
+    alice, bob = (100, 100, 80, 80), (600, 120, 80, 80)
+    for _ in range(2):
+        monitor._handle_result(_result([alice, bob], [(1, 40.0, True), (2, 45.0, True)]))
+    assert sorted(monitor.dispatcher.alerts) == [("Alice", "ch3"), ("Bob", "ch3")]
+    assert sorted(t.verified_name for t in monitor.tracker.tracks) == ["Alice", "Bob"]
+    # Announced once per track
+    monitor._handle_result(_result([alice, bob], [(1, 40.0, True), (2, 45.0, True)]))
+    assert len(monitor.dispatcher.alerts) == 2
+
+
+def test_rejected_predictions_do_not_verify():
+    monitor = _monitor()
+    for _ in range(3):
+        monitor._handle_result(_result([(100, 100, 80, 80)], [(1, 120.0, False)]))
+    assert monitor.dispatcher.alerts == []
+    assert monitor.tracker.tracks[0].verified_name is None
+
+
+def test_detections_without_a_model():
+    monitor = _monitor()
+    monitor._handle_result(_result([(100, 100, 80, 80)], []))
+    assert monitor.last_faces == [(100, 100, 80, 80)]
+    assert len(monitor.tracker.tracks) == 1
+
+
+class FakeDetector:
+    def __init__(self, faces):
+        self.faces = faces
+        self.calls = []
+
+    def detect(self, image, scale_factor=1.1, min_size=(30, 30)):
+        self.calls.append((image.shape, min_size))
+        return self.faces
+
+    def detect_batch(self, images, scale_factor=1.1, min_size=(30, 30)):
+        return [self.detect(image, scale_factor, min_size) for image in images]
+
+
+class FakeRecognizer:
+    color = False
+
+    def __init__(self):
+        self.sizes = []
+
+    def predict(self, face):
+        self.sizes.append(face.shape)
+        return 1, 40.0
+
+
+def test_zones_are_filtered_before_recognition(monkeypatch):
+    import numpy as np
+    import supervisor
+    from zones import ZoneSet, parse_zone
+
+    # Zone 'near' only takes faces up to 100 px; the detector finds a 40x40 face at 0.5 scale (80 px)
+    zones = ZoneSet([parse_zone("far:0,0,320,240@100-"), parse_zone("near:320,0,640,240@40-100")])
+    detector, recognizer = FakeDetector([(10, 10, 40, 40)]), FakeRecognizer()
+    monkeypatch.setattr(supervisor, "_detector", detector)
+    monkeypatch.setattr(supervisor, "_recognizer", (recognizer, 45))
+    x0, y0, x1, y1 = zones.bounds(640, 480)
+    crop = np.zeros((480, 640), np.uint8)[y0:y1, x0:x1]
+
+    faces, predictions = supervisor._analyze_frame(crop, (zones, x0, y0, 640, 480))
+    assert faces == [(340, 20, 80, 80)]
+    assert predictions == [(1, 40.0, True)]
+    assert len(recognizer.sizes) == 1
+    # Each zone is scanned with its own minimum face size
+    assert [min_size for _, min_size in detector.calls] == [(50, 50), (24, 24)]
+
+
+def test_whole_frames_use_the_default_face_size(monkeypatch):
+    import numpy as np
+    import supervisor
+
+    detector = FakeDetector([(10, 10, 40, 40)])
+    monkeypatch.setattr(supervisor, "_detector", detector)
+    monkeypatch.setattr(supervisor, "_recognizer", None)
+    results = supervisor._analyze_batch([np.zeros((480, 640), np.uint8)] * 2)
+    assert results == [([(20, 20, 80, 80)], [])] * 2
+    assert detector.calls == [((240, 320), (30, 30))] * 2
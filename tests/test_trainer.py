@@ -0,0 +1,95 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from trainer import train_model
+
+
+def _add_images(data_dir, names, seed):
+    rng = np.random.default_rng(seed)
+    for name in names:
+        cv2.imwrite(os.path.join(data_dir, name), rng.integers(0, 256, (100, 100), dtype=np.uint8))
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    data_dir = tmp_path / "dataset"
+    data_dir.mkdir()
+    paths = {
+        "data_dir": str(data_dir),
+        "model_file": str(tmp_path / "trainer.yml"),
+        "map_file": str(tmp_path / "names.json"),
+        "pack_file": str(tmp_path / "dataset.pack"),
+    }
+    return paths
+
+
+def _train(workspace, **kwargs):
+    train_model(workspace["data_dir"], workspace["model_file"], workspace["map_file"], pack_file=workspace["pack_file"], workers=2, **kwargs)
+
+
+def _model(workspace):
+    recognizer = cv2.face.LBPHFaceRecognizer_create()
+    recognizer.read(workspace["model_file"])
+    return recognizer
+
+
+def _names(workspace):
+    with open(workspace["map_file"]) as f:
+        return json.load(f)
+
+
+def test_existing_ids_are_kept(workspace):
+    with open(workspace["map_file"], 'w') as f:
+        json.dump({"1": "Bob", "4": "Carol"}, f)
+    _add_images(workspace["data_dir"], ["Alice.1.1.png", "Bob.1.1.png"], seed=0)
+    _train(workspace)
+    assert _names(workspace) == {"1": "Bob", "4": "Carol", "5": "Alice"}
+    assert sorted(_model(workspace).getLabels().ravel().tolist()) == [1, 5]
+
+
+def test_new_images_are_added_incrementally(workspace, capsys):
+    _add_images(workspace["data_dir"], ["Alice.1.1.png", "Alice.1.2.png", "Bob.1.1.png"], seed=0)
+    _train(workspace)
+    first = _model(workspace).getHistograms()
+
+    _add_images(workspace["data_dir"], ["Carol.1.1.png"], seed=1)
+    capsys.readouterr()
+    _train(workspace)
+    out = capsys.readouterr().out
+    assert "Incremental training: 1 new images (3 already in the model)" in out
+    assert "Ingesting 1 images" in out
+
+    model = _model(workspace)
+    assert sorted(model.getLabels().ravel().tolist()) == [1, 1, 2, 3]
+    # The earlier samples are unchanged
+    for old, new in zip(first, model.getHistograms()):
+        assert np.array_equal(old, new)
+    with open(os.path.splitext(workspace["model_file"])[0] + ".manifest.json") as f:
+        assert sorted(json.load(f)["files"]) == ["Alice.1.1.png", "Alice.1.2.png", "Bob.1.1.png", "Carol.1.1.png"]
+
+
+def test_up_to_date_model_is_not_retrained(workspace, capsys):
+    _add_images(workspace["data_dir"], ["Alice.1.1.png"], seed=0)
+    _train(workspace)
+    mtime = os.path.getmtime(workspace["model_file"])
+    capsys.readouterr()
+    _train(workspace)
+    assert "is up to date (1 images)" in capsys.readouterr().out
+    assert os.path.getmtime(workspace["model_file"]) == mtime
+
+
+def test_removed_image_forces_a_rebuild(workspace, capsys):
+    _add_images(workspace["data_dir"], ["Alice.1.1.png", "Bob.1.1.png"], seed=0)
+    _train(workspace)
+    os.remove(os.path.join(workspace["data_dir"], "Bob.1.1.png"))
+    capsys.readouterr()
+    _train(workspace)
+    out = capsys.readouterr().out
+    assert "were removed or modified" in out and "Training on 1 images" in out
+    assert _model(workspace).getLabels().ravel().tolist() == [1]
+    # Bob keeps his id for when he is added again
+    assert _names(workspace) == {"1": "Alice", "2": "Bob"}
@@ -0,0 +1,191 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from webhook_dispatcher import AlertDispatcher, CooldownTracker, parse_targets
+
+
+class WebhookServer:
+    """
+    Local webhook stand-in: answers with the scripted statuses (200 once they run out)
+    and can hold requests until released.
+    """
+    def __init__(self, statuses=()):
+        self.statuses = list(statuses)
+        self.requests = []
+        self.release = threading.Event()
+        self.release.set()
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _answer(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length) if length else b""
+                server.release.wait(5.0)
+                with server.lock:
+                    server.requests.append((self.command, self.path, body))
+                    status = server.statuses.pop(0) if server.statuses else 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            do_GET = _answer
+            do_POST = _answer
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/hook?key=1"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def wait_for(self, count, timeout=5.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.lock:
+                if len(self.requests) >= count:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def close(self):
+        self.release.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    servers = []
+
+    def make(statuses=()):
+        s = WebhookServer(statuses)
+        servers.append(s)
+        return s
+    yield make
+    for s in servers:
+        s.close()
+
+
+def test_retries_server_errors_until_delivered(server):
+    hook = server([503, 500])
+    dispatcher = AlertDispatcher(parse_targets(hook.url), workers=1, retries=3, backoff=0.01)
+    try:
+        assert dispatcher.send("Alice", "main")
+        assert hook.wait_for(3)
+        time.sleep(0.1)
+        assert len(hook.requests) == 3
+        method, path, _ = hook.requests[-1]
+        assert method == "GET"
+        assert path.endswith("&text=Alice%20is%20at%20the%20door")
+    finally:
+        dispatcher.stop()
+
+
+def test_does_not_retry_client_errors(server):
+    hook = server([404])
+    dispatcher = AlertDispatcher(parse_targets(hook.url), workers=1, retries=3, backoff=0.01)
+    try:
+        dispatcher.send("Alice", "main")
+        assert hook.wait_for(1)
+        time.sleep(0.2)
+        assert len(hook.requests) == 1
+    finally:
+        dispatcher.stop()
+
+
+def test_gives_up_after_the_last_retry(server):
+    hook = server([503] * 10)
+    dispatcher = AlertDispatcher(parse_targets(hook.url), workers=1, retries=2, backoff=0.01)
+    try:
+        dispatcher.send("Alice", "main")
+        assert hook.wait_for(3)
+        time.sleep(0.2)
+        assert len(hook.requests) == 3
+    finally:
+        dispatcher.stop()
+
+
+def test_post_target_receives_json(server):
+    hook = server()
+    dispatcher = AlertDispatcher(parse_targets("post:" + hook.url), workers=1)
+    try:
+        dispatcher.send("Bob", "ch2")
+        assert hook.wait_for(1)
+        method, _, body = hook.requests[0]
+        assert method == "POST"
+        assert b'"name": "Bob"' in body and b'"camera": "ch2"' in body
+    finally:
+        dispatcher.stop()
+
+
+def test_pending_alert_is_not_queued_twice(server):
+    hook = server()
+    hook.release.clear()
+    dispatcher = AlertDispatcher(parse_targets(hook.url), workers=2, backoff=0.01)
+    try:
+        assert dispatcher.send("Alice", "main")
+        assert not dispatcher.send("Alice", "main")
+        # Another person or camera is a different alert
+        assert dispatcher.send("Alice", "ch2")
+        assert dispatcher.send("Bob", "main")
+        hook.release.set()
+        assert hook.wait_for(3)
+        deadline = time.time() + 5.0
+        while dispatcher.pending and time.time() < deadline:
+            time.sleep(0.01)
+        # Delivered, so the same alert may be queued again
+        assert dispatcher.send("Alice", "main")
+        assert hook.wait_for(4)
+        time.sleep(0.1)
+        assert len(hook.requests) == 4
+    finally:
+        dispatcher.stop()
+
+
+def test_submit_applies_cooldowns(server):
+    hook = server()
+    dispatcher = AlertDispatcher(parse_targets(hook.url), workers=1, identity_cooldown=15.0)
+    try:
+        assert dispatcher.submit("Alice", "main", now=100.0)
+        assert not dispatcher.submit("Alice", "ch2", now=110.0)
+        assert dispatcher.submit("Bob", "main", now=110.0)
+        assert hook.wait_for(2)
+    finally:
+        dispatcher.stop()
+
+
+def test_identity_cooldown():
+    cooldowns = CooldownTracker(identity_cooldown=15.0)
+    assert cooldowns.allow("Alice", "main", now=0.0)
+    assert not cooldowns.allow("Alice", "ch2", now=14.9)
+    assert cooldowns.allow("Bob", "main", now=1.0)
+    assert cooldowns.allow("Alice", "main", now=15.0)
+
+
+def test_camera_cooldown():
+    cooldowns = CooldownTracker(identity_cooldown=0.0, camera_cooldown=10.0)
+    assert cooldowns.allow("Alice", "main", now=0.0)
+    assert not cooldowns.allow("Bob", "main", now=5.0)
+    assert cooldowns.allow("Bob", "ch2", now=5.0)
+    assert cooldowns.allow("Bob", "main", now=10.0)
+
+
+def test_worker_survives_unexpected_errors(server):
+    hook = server()
+    bad = parse_targets("http://127.0.0.1:notaport/hook")[0]
+    dispatcher = AlertDispatcher([bad] + parse_targets(hook.url), workers=1, retries=0)
+    try:
+        assert dispatcher.send("Alice", "main")
+        assert hook.wait_for(1)
+        dispatcher.targets = dispatcher.targets[1:]
+        assert dispatcher.send("Bob", "main")
+        assert hook.wait_for(2)
+    finally:
+        dispatcher.stop()
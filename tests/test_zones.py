@@ -0,0 +1,105 @@
+import json
+
+import numpy as np
+import pytest
+
+from zones import Zone, ZoneSet, dedupe, load_zones, parse_zone
+
+
+def test_parse_rectangle_with_name_and_sizes():
+    zone = parse_zone("door:0.25,0.1,0.75,0.9@60-400")
+    assert zone.name == "door"
+    assert zone.relative
+    assert zone.points == [(0.25, 0.1), (0.75, 0.1), (0.75, 0.9), (0.25, 0.9)]
+    assert (zone.min_face, zone.max_face) == (60, 400)
+
+
+def test_parse_polygon_in_pixels():
+    zone = parse_zone("100,50;400,50;250,300", index=2)
+    assert zone.name == "zone3"
+    assert not zone.relative
+    assert len(zone.points) == 3
+    assert (zone.min_face, zone.max_face) == (0, 0)
+    assert parse_zone("0,0,1,1@-200").max_face == 200
+
+
+@pytest.mark.parametrize("spec", ["0.1,0.2,0.3", "1,2;3", "a,b,c,d", "0.5,0.5;"])
+def test_invalid_zones(spec):
+    with pytest.raises(ValueError):
+        parse_zone(spec)
+
+
+def test_point_in_polygon_and_size_limits():
+    # Triangle with its point at the top
+    zone = Zone([(100, 0), (200, 200), (0, 200)], min_face=40, max_face=100)
+    polygon = zone.polygon(640, 480)
+    assert zone.accepts((80, 120, 50, 50), polygon)
+    # Center outside the triangle, although inside its bounding rectangle
+    assert not zone.accepts((0, 10, 50, 50), polygon)
+    assert not zone.accepts((90, 130, 30, 30), polygon)
+    assert not zone.accepts((50, 50, 120, 120), polygon)
+
+
+def test_relative_zones_follow_the_frame_size():
+    zones = ZoneSet([parse_zone("0.5,0.5,1,1")])
+    assert zones.bounds(640, 480) == (320, 240, 640, 480)
+    assert zones.bounds(1920, 1080) == (960, 540, 1920, 1080)
+    assert ZoneSet([parse_zone("2000,2000,2100,2100")]).bounds(640, 480) == (0, 0, 640, 480)
+
+
+def test_detect_scans_each_zone_and_maps_back():
+    zones = ZoneSet([parse_zone("a:0,0,199,199"), parse_zone("b:400,0,599,199@0-50")])
+    frame = np.zeros((480, 640), np.uint8)
+    crops = []
+
+    def detect(crop, zone):
+        crops.append((zone.name, crop.shape))
+        return [(50, 50, 80, 80)]
+
+    faces = zones.detect(frame, detect)
+    assert crops == [("a", (200, 200)), ("b", (200, 200))]
+    # Zone b only takes faces up to 50 px
+    assert faces == [(50, 50, 80, 80)]
+
+
+def test_detect_on_the_bounds_crop():
+    zones = ZoneSet([parse_zone("a:100,100,299,299"), parse_zone("b:200,200,399,399")])
+    x0, y0, x1, y1 = zones.bounds(640, 480)
+    assert (x0, y0, x1, y1) == (100, 100, 400, 400)
+    frame = np.zeros((480, 640), np.uint8)
+    crop = frame[y0:y1, x0:x1]
+    shapes = []
+
+    def detect(crop, zone):
+        shapes.append(crop.shape)
+        return [(100, 100, 60, 60)] if zone.name == "a" else [(0, 0, 60, 60)]
+
+    faces = zones.detect(crop, detect, origin=(x0, y0), frame_size=(640, 480))
+    assert shapes == [(200, 200), (200, 200)]
+    # The same face found from both zones is kept once
+    assert faces == [(200, 200, 60, 60)]
+
+
+def test_filter_and_dedupe():
+    zones = ZoneSet([parse_zone("0,0,0.5,1")])
+    assert zones.filter([(10, 10, 50, 50), (500, 10, 50, 50)], 640, 480) == [(10, 10, 50, 50)]
+    assert dedupe([(0, 0, 50, 50), (2, 2, 50, 50), (100, 100, 40, 40)]) == [(0, 0, 50, 50), (100, 100, 40, 40)]
+
+
+def test_load_zones_from_specs_and_file(tmp_path):
+    path = tmp_path / "zones.json"
+    path.write_text(json.dumps({
+        "ch1": [{"name": "gate", "rect": [0, 0, 0.5, 0.5], "min_face": 40}],
+        "ch2": [{"polygon": [[0, 0], [1, 0], [1, 1]]}],
+    }))
+    zones = load_zones("ch1", ["door:0.5,0,1,1"], str(path))
+    assert [z.name for z in zones.zones] == ["door", "gate"]
+    assert zones.zones[1].min_face == 40
+    assert load_zones("ch3", None, str(path)) is None
+
+
+def test_load_zones_checks_every_camera(tmp_path):
+    path = tmp_path / "zones.json"
+    path.write_text(json.dumps({"ch1": [{"rect": [0, 0, 1, 1]}], "ch2": [{"polygon": [[0, 0]]}]}))
+    with pytest.raises(ValueError):
+        load_zones("ch1", None, str(path))
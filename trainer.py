@@ -3,59 +3,140 @@ import os
 import numpy as np
 
 import json
+from dataset_pack import DatasetPack, file_signature
+from embedding_recognizer import create_embedding_recognizer
+from lbph_recognizer import export_model
+from recognizers import FACE_SIZE, manifest_path
 
-def train_model(data_dir="dataset", model_file="trainer.yml", map_file="names.json"):
+def load_name_ids(map_file):
+    """
+    Existing Name -> ID mapping from names.json, so ids never change between training runs.
+    """
+    if not os.path.exists(map_file):
+        return {}
+    with open(map_file, 'r') as f:
+        return {name: int(id_) for id_, name in json.load(f).items()}
+
+def person_name(filename):
+    # Filename format expected: Name.Timestamp.Count.jpg
+    # User might have legacy files or different formats.
+    name = filename.split(".")[0]
+
+    if name == "user":
+        # Legacy or default name, let's treat it as "Unknown" or ask user to rename
+        # For now, we'll map it to "Person 1" or similar if we strictly need names
+        name = "User"
+    return name
+
+def pack_path(data_dir, color=False):
+    """
+    The packed dataset lives next to the image directory (dataset/ -> dataset.pack, or dataset.color.pack
+    for the colour crops of embedding galleries).
+    """
+    return data_dir.rstrip("/\\") + (".color.pack" if color else ".pack")
+
+def train_model(data_dir="dataset", model_file="trainer.yml", map_file="names.json", recognizer_type="lbph", model_dir="models", float16=False, rebuild=False, pack_file=None, workers=None, export_file=None):
+    """
+    Train (or incrementally update) the recognizer from the images in data_dir.
+    :param export_file: Also write the LBPH model as a compact memory mapped .lbph file (see lbph_recognizer.py)
+    """
     path = data_dir
-    recognizer = cv2.face.LBPHFaceRecognizer_create()
-    detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
-    
-    imagePaths = [os.path.join(path,f) for f in os.listdir(path) if f.endswith('.jpg') or f.endswith('.png')]     
-    faceSamples=[]
+    if export_file and recognizer_type != "lbph":
+        print("WARNING: --export only applies to LBPH models, ignoring it.")
+        export_file = None
+    if recognizer_type == "embedding":
+        # Embedding gallery (.npz) - constant-latency cosine search instead of LBPH's linear histogram scan
+        recognizer = create_embedding_recognizer(model_dir, float16)
+        # SFace embeds colour crops at its own input size, not equalized gray faces
+        face_size, color = recognizer.face_size, True
+    else:
+        recognizer = cv2.face.LBPHFaceRecognizer_create()
+        face_size, color = FACE_SIZE, False
+
+    imageFiles = sorted(f for f in os.listdir(path) if f.endswith('.jpg') or f.endswith('.png'))
+
+    # Mapping of Name -> ID (reused from names.json so adding a person never renumbers anyone)
+    name_to_id = load_name_ids(map_file)
+    current_id = max(name_to_id.values(), default=0)
+
+    # Incremental mode: only ingest files not listed in the manifest of the existing model
+    manifest_file = manifest_path(model_file)
+    manifest = {}
+    if not rebuild and os.path.exists(model_file) and os.path.exists(manifest_file):
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get("recognizer") != recognizer_type:
+            print(f"Existing model was built with '{manifest.get('recognizer')}', rebuilding.")
+            manifest = {}
+        elif manifest.get("face_size") != face_size or manifest.get("color", False) != color:
+            # Models from before faces were normalized, or with another face size or colour mode
+            kind = "colour" if manifest.get("color") else "gray"
+            print(f"Existing model was trained on {kind} faces of size {manifest.get('face_size')}, rebuilding.")
+            manifest = {}
+    ingested = manifest.get("files", {})
+
+    if ingested:
+        current = set(imageFiles)
+        changed = [f for f, sig in ingested.items() if f not in current or file_signature(os.path.join(path, f)) != {"size": sig["size"], "mtime": sig["mtime"]}]
+        if changed:
+            # LBPH cannot forget samples, so removed or edited images need a full retrain
+            print(f"{len(changed)} previously trained images were removed or modified (e.g. {changed[0]}), rebuilding.")
+            ingested = {}
+
+    incremental = bool(ingested)
+    newFiles = [f for f in imageFiles if f not in ingested]
+    if incremental and not newFiles:
+        print(f"Model {model_file} is up to date ({len(ingested)} images).")
+        if export_file and (not os.path.exists(export_file) or os.path.getmtime(export_file) < os.path.getmtime(model_file)):
+            recognizer.read(model_file)
+            export_lbph(recognizer, export_file, name_to_id, float16)
+        return
+
+    if incremental:
+        print(f"Incremental training: {len(newFiles)} new images ({len(ingested)} already in the model)...")
+    else:
+        print(f"Training on {len(newFiles)} images...")
+
     ids = []
-    
-    # Mapping of Name -> ID
-    name_to_id = {}
-    current_id = 0
-    
-    print(f"Training on {len(imagePaths)} images...")
-    
-    for imagePath in imagePaths:
-        try:
-            # Filename format expected: Name.Timestamp.Count.jpg
-            # User might have legacy files or different formats.
-            filename = os.path.split(imagePath)[-1]
-            name = filename.split(".")[0]
-            
-            if name == "user":
-                # Legacy or default name, let's treat it as "Unknown" or ask user to rename
-                # For now, we'll map it to "Person 1" or similar if we strictly need names
-                name = "User"
-            
-            if name not in name_to_id:
-                current_id += 1
-                name_to_id[name] = current_id
-            
-            id_ = name_to_id[name]
-            
-            PIL_img = cv2.imread(imagePath, cv2.IMREAD_GRAYSCALE)
-            img_numpy = np.array(PIL_img,'uint8')
-            
-            faceSamples.append(img_numpy)
-            ids.append(id_)
-        except Exception as e:
-            print(f"Skipping {imagePath}: {e}")
+    for filename in newFiles:
+        name = person_name(filename)
+        if name not in name_to_id:
+            current_id += 1
+            name_to_id[name] = current_id
+        ids.append(name_to_id[name])
+
+    # Decode/crop/normalize only images the pack has not seen, then train from the memory-mapped rows
+    pack = DatasetPack(pack_file or pack_path(path, color), face_size, color)
+    if not incremental:
+        pack.compact(set(imageFiles))
+    rows = pack.ingest(path, newFiles, ids, workers)
+    faces = pack.faces()
+
+    faceSamples = []
+    sampleIds = []
+    for filename, id_, row in zip(newFiles, ids, rows):
+        if row is None:
+            continue
+        faceSamples.append(faces[row])
+        sampleIds.append(id_)
+        ingested[filename] = dict(pack.signatures[row], id=id_)
 
     if len(faceSamples) == 0:
         print("No training data found.")
         return
 
     print(f"Detected {len(name_to_id)} unique people: {list(name_to_id.keys())}")
-    
-    print("Training model...")
-    recognizer.train(faceSamples, np.array(ids))
+
+    if incremental:
+        print("Updating model...")
+        recognizer.read(model_file)
+        recognizer.update(faceSamples, np.array(sampleIds))
+    else:
+        print("Training model...")
+        recognizer.train(faceSamples, np.array(sampleIds))
     recognizer.write(model_file)
     print(f"Model saved to {model_file}")
-    
+
     # Save the mapping (ID -> Name) for the player
     # We invert it for easier lookup: ID -> Name
     id_to_name = {v: k for k, v in name_to_id.items()}
@@ -63,14 +144,33 @@ def train_model(data_dir="dataset", model_file="trainer.yml", map_file="names.js
         json.dump(id_to_name, f)
     print(f"Name mapping saved to {map_file}")
 
+    with open(manifest_file, 'w') as f:
+        json.dump({"recognizer": recognizer_type, "face_size": face_size, "color": color, "files": ingested}, f)
+    print(f"Manifest saved to {manifest_file}")
+
+    if export_file:
+        export_lbph(recognizer, export_file, name_to_id, float16)
+
+def export_lbph(recognizer, export_file, name_to_id, float16=False):
+    size = export_model(recognizer, export_file, {v: k for k, v in name_to_id.items()}, float16, FACE_SIZE)
+    print(f"Compact model ({len(recognizer.getLabels())} histograms, names included) saved to {export_file} ({size / 1e6:.1f} MB)")
+
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--datadir", default="dataset", help="Directory containing face images")
-    parser.add_argument("--savefile", default="trainer.yml", help="File to save trained model")
+    parser.add_argument("--savefile", help="File to save trained model (default: trainer.yml, or gallery.npz for --recognizer embedding)")
+    parser.add_argument("--recognizer", choices=["lbph", "embedding"], default="lbph", help="Recognizer type (default: lbph)")
+    parser.add_argument("--model-dir", default="models", help="Directory containing the SFace embedding model (default: models)")
+    parser.add_argument("--float16", action="store_true", help="Store the embedding gallery (or the --export model) as float16 (half the size)")
+    parser.add_argument("--rebuild", action="store_true", help="Retrain from all images instead of only adding new ones")
+    parser.add_argument("--pack", help="Packed dataset file (default: <datadir>.pack)")
+    parser.add_argument("--workers", type=int, help="Threads used to decode new images (default: number of cores)")
+    parser.add_argument("--export", metavar="FILE", help="Also write the LBPH model and names as a compact model (e.g. trainer.lbph plus its .data file) that loads instantly via mmap")
     args = parser.parse_args()
-    
+
+    savefile = args.savefile or ("gallery.npz" if args.recognizer == "embedding" else "trainer.yml")
     if not os.path.exists(args.datadir):
         print(f"Error: {args.datadir} does not exist.")
     else:
-        train_model(args.datadir, args.savefile)
+        train_model(args.datadir, savefile, recognizer_type=args.recognizer, model_dir=args.model_dir, float16=args.float16, rebuild=args.rebuild, pack_file=args.pack, workers=args.workers, export_file=args.export)
@@ -0,0 +1,270 @@
+import json
+import time
+import queue
+import random
+import datetime
+import threading
+import http.client
+import urllib.parse
+
+# Retry on throttling and server errors; other 4xx responses will not change on retry
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def build_trigger_url(webhook_url, name):
+    """
+    Build the announcement URL for a verified person.
+    Voice Monkey 'trigger' URLs are rewritten to 'announce' so the text is spoken.
+    """
+    message = f"{name} is at the door"
+    encoded_message = urllib.parse.quote(message)
+
+    if "voicemonkey.io" in webhook_url and "trigger" in webhook_url:
+        return webhook_url.replace("trigger", "announce") + f"&text={encoded_message}"
+    return webhook_url + f"&text={encoded_message}"
+
+
+class WebhookTarget:
+    def __init__(self, url, method="GET"):
+        """
+        One alert destination.
+        :param url: GET targets get '&text=<message>' appended (Voice Monkey trigger URLs are
+                    rewritten to announce); POST targets receive a JSON body
+        :param method: 'GET' or 'POST'
+        """
+        self.url = url
+        self.method = method.upper()
+
+    def __repr__(self):
+        return f"{self.method} {self.url}"
+
+    def build_request(self, name, camera):
+        """
+        :return: (url, body bytes or None, headers)
+        """
+        if self.method == "POST":
+            body = json.dumps({
+                "name": name,
+                "camera": camera,
+                "message": f"{name} is at the door",
+                "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            }).encode()
+            return self.url, body, {"Content-Type": "application/json"}
+        return build_trigger_url(self.url, name), None, {}
+
+
+def parse_targets(specs):
+    """
+    Parse --webhook-url values. 'post:<url>' sends a JSON POST, anything else is a GET URL.
+    :param specs: A string or a list of strings
+    :return: list of WebhookTarget
+    """
+    if isinstance(specs, str):
+        specs = [specs]
+    targets = []
+    for spec in specs or []:
+        if spec.lower().startswith("post:"):
+            targets.append(WebhookTarget(spec[5:], "POST"))
+        else:
+            targets.append(WebhookTarget(spec))
+    return targets
+
+
+class CooldownTracker:
+    def __init__(self, identity_cooldown=15.0, camera_cooldown=0.0):
+        """
+        Decide whether an alert may be sent.
+        :param identity_cooldown: Seconds before the same person is announced again (from any camera)
+        :param camera_cooldown: Seconds between any two alerts from the same camera (0 = off)
+        """
+        self.identity_cooldown = identity_cooldown
+        self.camera_cooldown = camera_cooldown
+        self.last_identity = {}
+        self.last_camera = {}
+        self.lock = threading.Lock()
+
+    def allow(self, name, camera=None, now=None):
+        """
+        :return: True (and start the cooldowns) if neither the person nor the camera is cooling down
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            last = self.last_identity.get(name)
+            if last is not None and now - last < self.identity_cooldown:
+                return False
+            last = self.last_camera.get(camera)
+            if self.camera_cooldown and last is not None and now - last < self.camera_cooldown:
+                return False
+            self.last_identity[name] = now
+            self.last_camera[camera] = now
+            return True
+
+
+class AlertDispatcher:
+    def __init__(self, targets, queue_size=100, workers=2, retries=3, backoff=1.0, timeout=10.0, identity_cooldown=15.0, camera_cooldown=0.0):
+        """
+        Deliver alerts from a bounded queue on background threads, reusing keep-alive
+        connections and retrying transient failures with exponential backoff.
+        :param targets: List of WebhookTarget (see parse_targets())
+        :param queue_size: Max alerts waiting; new alerts are dropped when full
+        :param workers: Delivery threads
+        :param retries: Extra attempts after a failed delivery
+        :param backoff: Seconds before the first retry (doubled on every attempt, with jitter)
+        :param timeout: Socket timeout per request
+        :param identity_cooldown: See CooldownTracker
+        :param camera_cooldown: See CooldownTracker
+        """
+        self.targets = targets
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.cooldowns = CooldownTracker(identity_cooldown, camera_cooldown)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.pending = set() # (name, camera, target) queued or in flight, for de-duplication
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.local = threading.local()
+        self.threads = []
+        for _ in range(max(1, workers)):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, name, camera=None, metrics=None, now=None):
+        """
+        Apply the cooldowns, then queue the alert.
+        :return: True if the alert was accepted
+        """
+        if not self.cooldowns.allow(name, camera, now):
+            return False
+        return self.send(name, camera, metrics)
+
+    def send(self, name, camera=None, metrics=None):
+        """
+        Queue an alert for every target without checking cooldowns. Never blocks.
+        An identical alert that is still queued or being delivered is not queued twice.
+        :param metrics: Optional StreamMetrics of the camera (webhook latency/failures/queue depth)
+        :return: True if queued for at least one target
+        """
+        queued = False
+        for target in self.targets:
+            key = (name, camera, target.url)
+            with self.lock:
+                if key in self.pending:
+                    print(f"DEBUG: Alert for {name} ({camera}) already pending for {target.url}, skipped.")
+                    continue
+                self.pending.add(key)
+            try:
+                self.queue.put_nowait((key, target, name, camera, metrics))
+            except queue.Full:
+                with self.lock:
+                    self.pending.discard(key)
+                print(f"WARNING: Alert queue full, dropping alert for {name}.")
+                if metrics:
+                    metrics.inc("webhook_dropped_total")
+                continue
+            if metrics:
+                metrics.add("webhook_queue_depth", 1)
+            queued = True
+        return queued
+
+    def stop(self, timeout=5.0):
+        """
+        Give queued alerts up to timeout seconds to be delivered, then stop the workers.
+        """
+        deadline = time.time() + timeout
+        while not self.queue.empty() and time.time() < deadline:
+            time.sleep(0.05)
+        self.stop_event.set()
+        for _ in self.threads:
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                break
+        for thread in self.threads:
+            thread.join(timeout=max(0.1, deadline - time.time()))
+
+    def _worker(self):
+        self.local.connections = {}
+        while not self.stop_event.is_set():
+            item = self.queue.get()
+            if item is None:
+                break
+            key, target, name, camera, metrics = item
+            try:
+                self._deliver(target, name, camera, metrics)
+            except Exception as e:
+                # e.g. a malformed URL or a body that cannot be encoded; the worker must survive it
+                print(f"Failed to trigger webhook for {name}: {e.__class__.__name__}: {e}")
+                if metrics:
+                    metrics.inc("webhook_failures_total")
+            finally:
+                with self.lock:
+                    self.pending.discard(key)
+                if metrics:
+                    metrics.add("webhook_queue_depth", -1)
+        for conn in self.local.connections.values():
+            conn.close()
+
+    def _deliver(self, target, name, camera, metrics):
+        url, body, headers = target.build_request(name, camera)
+        for attempt in range(self.retries + 1):
+            t_start = time.time()
+            status, error, reused = self._request(target.method, url, body, headers)
+            if metrics:
+                metrics.observe("webhook_seconds", time.time() - t_start)
+
+            if status is not None and 200 <= status < 300:
+                print(f"Webhook triggered ({target.method} {urllib.parse.urlsplit(url).netloc}). Status: {status}")
+                if metrics:
+                    metrics.inc("webhooks_sent_total")
+                return True
+            retryable = status is None or status in RETRY_STATUS
+            reason = error or f"HTTP {status}"
+            if not retryable or attempt == self.retries or self.stop_event.is_set():
+                print(f"Failed to trigger webhook for {name}: {reason}")
+                if metrics:
+                    metrics.inc("webhook_failures_total")
+                return False
+
+            if metrics:
+                metrics.inc("webhook_retries_total")
+            if reused and attempt == 0 and status is None:
+                # The server closed an idle keep-alive connection; retry right away on a new one
+                continue
+            delay = self.backoff * (2 ** attempt) * random.uniform(0.8, 1.2)
+            print(f"WARNING: Webhook for {name} failed ({reason}), retrying in {delay:.1f}s...")
+            if self.stop_event.wait(delay):
+                return False
+        return False
+
+    def _request(self, method, url, body, headers):
+        """
+        One HTTP request on this worker's pooled connection for the host.
+        :return: (status or None, error text or None, whether the connection was reused)
+        """
+        parts = urllib.parse.urlsplit(url)
+        pool_key = (parts.scheme, parts.netloc)
+        conn = self.local.connections.get(pool_key)
+        reused = conn is not None
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            conn = conn_class(parts.netloc, timeout=self.timeout)
+            self.local.connections[pool_key] = conn
+
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            # The body must be drained before the connection can be reused
+            response.read()
+            if response.will_close:
+                conn.close()
+                del self.local.connections[pool_key]
+            return response.status, None, reused
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            self.local.connections.pop(pool_key, None)
+            return None, str(e) or e.__class__.__name__, reused
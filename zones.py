@@ -0,0 +1,193 @@
+import json
+
+import cv2
+import numpy as np
+
+from face_tracker import iou
+
+
+class Zone:
+    def __init__(self, points, name="zone", min_face=0, max_face=0):
+        """
+        A region of the frame where faces are looked for.
+        :param points: Polygon corners [(x, y), ...]; two corners are a rectangle (top-left, bottom-right).
+                       If every value is <= 1 they are fractions of the frame size, otherwise pixels.
+        :param name: Name for log messages
+        :param min_face: Smallest face side in this zone, in frame pixels (0 = the player's default)
+        :param max_face: Largest face side in this zone, in frame pixels (0 = no limit)
+        """
+        if len(points) == 2:
+            (x0, y0), (x1, y1) = points
+            points = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+        if len(points) < 3:
+            raise ValueError(f"Zone '{name}' needs a rectangle or at least 3 polygon points")
+        self.points = [(float(x), float(y)) for x, y in points]
+        self.relative = all(0.0 <= v <= 1.0 for p in self.points for v in p)
+        self.name = name
+        self.min_face = min_face
+        self.max_face = max_face
+
+    def polygon(self, width, height):
+        """
+        :return: int32 array of the corners in pixels of a width x height frame
+        """
+        sx, sy = (width, height) if self.relative else (1, 1)
+        return np.array([(round(x * sx), round(y * sy)) for x, y in self.points], dtype=np.int32)
+
+    def accepts(self, box, polygon):
+        """
+        True if the center of box (x, y, w, h) lies in the polygon and the face size is within the zone's limits.
+        """
+        x, y, w, h = box
+        size = max(w, h)
+        if size < self.min_face or (self.max_face and size > self.max_face):
+            return False
+        return cv2.pointPolygonTest(polygon, (x + w / 2.0, y + h / 2.0), False) >= 0
+
+    def describe(self):
+        limits = f", faces {self.min_face or 'default'}-{self.max_face or 'any'} px" if self.min_face or self.max_face else ""
+        unit = "relative" if self.relative else "px"
+        return f"{self.name}: {len(self.points)} points ({unit}){limits}"
+
+
+class ZoneSet:
+    def __init__(self, zones):
+        """
+        The zones of one camera. Detection runs on the bounding rectangle of each zone instead of the whole frame,
+        and only faces whose center lies inside a zone polygon are kept.
+        :param zones: list of Zone
+        """
+        self.zones = zones
+        self.size = None
+        self.regions = [] # (zone, polygon, (x0, y0, x1, y1)) for self.size
+
+    def resolve(self, width, height):
+        """
+        Pixel polygons and crop rectangles for a frame size (cached; recomputed when the stream resolution changes).
+        """
+        if self.size != (width, height):
+            self.regions = []
+            for zone in self.zones:
+                polygon = zone.polygon(width, height)
+                x, y, w, h = cv2.boundingRect(polygon)
+                x0, y0 = max(0, x), max(0, y)
+                x1, y1 = min(width, x + w), min(height, y + h)
+                if x1 - x0 < 24 or y1 - y0 < 24:
+                    print(f"WARNING: Zone '{zone.name}' lies (almost) outside the {width}x{height} frame; ignored.")
+                    continue
+                self.regions.append((zone, polygon, (x0, y0, x1, y1)))
+            self.size = (width, height)
+        return self.regions
+
+    def bounds(self, width, height):
+        """
+        Rectangle (x0, y0, x1, y1) covering every zone, or the whole frame if none is usable.
+        """
+        regions = self.resolve(width, height)
+        if not regions:
+            return (0, 0, width, height)
+        return (min(r[2][0] for r in regions), min(r[2][1] for r in regions),
+                max(r[2][2] for r in regions), max(r[2][3] for r in regions))
+
+    def detect(self, frame, detect, origin=(0, 0), frame_size=None):
+        """
+        Run a detector on each zone's crop and map the faces back to frame coordinates.
+        :param frame: Full frame, or the part of it that starts at origin and covers every zone (see bounds())
+        :param detect: callable(crop, zone) -> list of (x, y, w, h) in crop coordinates
+        :param origin: (x, y) of frame's top-left corner in the full frame
+        :param frame_size: (width, height) of the full frame (default: the size of frame)
+        :return: list of (x, y, w, h) in full frame coordinates
+        """
+        ox, oy = origin
+        width, height = frame_size or (frame.shape[1], frame.shape[0])
+        faces = []
+        for zone, polygon, (x0, y0, x1, y1) in self.resolve(width, height):
+            for (x, y, w, h) in detect(frame[y0-oy:y1-oy, x0-ox:x1-ox], zone):
+                box = (x + x0, y + y0, w, h)
+                if zone.accepts(box, polygon):
+                    faces.append(box)
+        return dedupe(faces) if len(self.regions) > 1 else faces
+
+    def filter(self, faces, width, height):
+        """
+        Keep the faces (frame coordinates) that at least one zone accepts.
+        """
+        regions = self.resolve(width, height)
+        if not regions:
+            return faces
+        return [box for box in faces if any(zone.accepts(box, polygon) for zone, polygon, _ in regions)]
+
+    def draw(self, frame, color=(255, 128, 0)):
+        height, width = frame.shape[:2]
+        for zone, polygon, _ in self.resolve(width, height):
+            cv2.polylines(frame, [polygon], True, color, 1)
+            x, y = polygon[0]
+            cv2.putText(frame, zone.name, (int(x) + 4, int(y) + 16), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+
+
+def dedupe(faces, threshold=0.5):
+    """
+    Drop faces found twice where zones overlap (the larger box of a pair is kept).
+    """
+    kept = []
+    for box in sorted(faces, key=lambda b: b[2] * b[3], reverse=True):
+        if all(iou(box, k) < threshold for k in kept):
+            kept.append(box)
+    return kept
+
+
+def parse_zone(spec, index=0):
+    """
+    Parse a --zone value: [name:]x0,y0,x1,y1 (rectangle) or [name:]x,y;x,y;x,y;... (polygon),
+    optionally followed by @min-max face size in pixels (either side may be empty).
+    Examples: 'door:0.35,0.1,0.65,0.9@60-400', '0.2,0.3;0.5,0.1;0.8,0.3;0.8,1;0.2,1'
+    """
+    name = f"zone{index + 1}"
+    min_face = max_face = 0
+    if ":" in spec:
+        name, spec = spec.split(":", 1)
+    if "@" in spec:
+        spec, sizes = spec.split("@", 1)
+        low, _, high = sizes.partition("-")
+        min_face, max_face = int(low or 0), int(high or 0)
+    try:
+        if ";" in spec:
+            points = [tuple(float(v) for v in p.split(",")) for p in spec.split(";") if p.strip()]
+        else:
+            values = [float(v) for v in spec.split(",")]
+            if len(values) != 4:
+                raise ValueError("a rectangle has 4 values")
+            points = [(values[0], values[1]), (values[2], values[3])]
+        if any(len(p) != 2 for p in points):
+            raise ValueError("points are x,y pairs")
+    except ValueError as e:
+        raise ValueError(f"Invalid zone '{spec}' ({e})")
+    return Zone(points, name, min_face, max_face)
+
+
+def load_zones(camera, specs=None, zones_file=None):
+    """
+    Zones of one camera from --zone values and/or a JSON file.
+    The file maps camera names ('main', 'ch<N>') to lists of
+    {"name": ..., "rect": [x0, y0, x1, y1] or "polygon": [[x, y], ...], "min_face": px, "max_face": px}.
+    :return: ZoneSet, or None if the camera has no zones (detect on the whole frame)
+    """
+    zones = [parse_zone(spec, i) for i, spec in enumerate(specs or [])]
+    if zones_file:
+        with open(zones_file, 'r') as f:
+            config = json.load(f)
+        # Every camera's entries are parsed, so a mistake anywhere in the file shows up at startup
+        for name, entries in config.items():
+            parsed = [_zone_entry(entry, i) for i, entry in enumerate(entries)]
+            if name == camera:
+                zones.extend(parsed)
+    return ZoneSet(zones) if zones else None
+
+
+def _zone_entry(entry, index):
+    if "rect" in entry:
+        x0, y0, x1, y1 = entry["rect"]
+        points = [(x0, y0), (x1, y1)]
+    else:
+        points = [tuple(p) for p in entry["polygon"]]
+    return Zone(points, entry.get("name", f"zone{index + 1}"), entry.get("min_face", 0), entry.get("max_face", 0))